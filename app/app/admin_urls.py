@@ -0,0 +1,11 @@
+"""Admin URL configuration, imported on the first admin request.
+
+The admin app is installed with SimpleAdminConfig, so the admin modules
+of the installed apps are only discovered here instead of at startup.
+"""
+from django.contrib import admin
+
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
@@ -3,14 +3,30 @@ ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server, e.g. ``uvicorn app.asgi:application``. Views
+run on a pool of ASGI_THREADS threads while the event loop talks to the
+clients. Change events are streamed at EVENTS_PATH when EVENTS_ENABLED
+is set.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+from core.handlers import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from core.events import event_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if settings.EVENTS_ENABLED and scope['type'] == 'http' and \
+            scope['path'] == settings.EVENTS_PATH:
+        await event_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
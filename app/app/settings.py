@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -45,12 +45,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ApiSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.ApiCsrfViewMiddleware',
+    'core.middleware.ApiAuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.ApiMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -78,16 +84,97 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds. Setting
+# DB_POOL_SIZE switches to a backend that instead shares them between the
+# threads of a worker through a pool of at most that many connections,
+# returning each connection to the pool at the end of the request.
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql' if DB_POOL_SIZE
+                  else 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE
+                        else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'POOL': {
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'CHECK_INTERVAL': int(
+                os.environ.get('DB_POOL_CHECK_INTERVAL', 30)
+            ),
+        },
     }
 }
 
+# Read replicas
+# DB_REPLICA_HOSTS is a comma separated list of replica hosts using the
+# same credentials as the primary. Safe requests read from replicas that
+# are at most DB_REPLICA_MAX_LAG_BYTES of WAL behind the primary; clients
+# that just wrote stay on the primary for DB_REPLICA_PIN_SECONDS. Those
+# pins are kept in the DB_REPLICA_PIN_CACHE_ALIAS cache, which must be
+# shared between workers, and in a cookie. Logins also pin the token they
+# return, so the first request made with it sees the token.
+
+DB_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host.strip(),
+        TEST={'MIRROR': 'default'},
+    )
+    DB_REPLICAS.append(alias)
+
+DB_REPLICA_MAX_LAG_BYTES = int(
+    os.environ.get('DB_REPLICA_MAX_LAG_BYTES', 16 * 1024 * 1024)
+)
+DB_REPLICA_CHECK_INTERVAL = int(
+    os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)
+)
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 10))
+DB_REPLICA_PIN_CACHE_ALIAS = os.environ.get(
+    'DB_REPLICA_PIN_CACHE_ALIAS', 'shared'
+)
+
+
+# Sharding
+# DB_SHARDS is a comma separated list of [host/]name databases holding
+# the tags, locations and experiences of a subset of users. Users are
+# placed on a shard when first seen and can be moved with
+# rebalance_shards. Users with rows from before sharding was enabled stay
+# on the default database until rebalance_shards moves them. Shards are
+# migrated with migrate_shards.
+
+SHARD_DATABASES = []
+for index, shard in enumerate(
+    filter(None, os.environ.get('DB_SHARDS', '').split(','))
+):
+    host, _, name = shard.strip().rpartition('/')
+    alias = f'shard_{index}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host or DATABASES['default']['HOST'],
+        NAME=name,
+        TEST={'NAME': f'test_{name}'},
+    )
+    SHARD_DATABASES.append(alias)
+
+SHARD_DIRECTORY_TTL = int(os.environ.get('SHARD_DIRECTORY_TTL', 30))
+# Seconds a move waits, rejecting the user's writes, before copying rows
+SHARD_MOVE_GRACE = float(os.environ.get('SHARD_MOVE_GRACE', 5))
+
+DATABASE_ROUTERS = [
+    'core.db.sharding.ShardRouter',
+    'core.db.routers.ReplicaRouter',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -137,3 +224,245 @@ STATIC_ROOT = '/vol/web/static'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
+
+
+# Caches
+# 'default' is local to each worker. 'shared' is kept in the primary
+# database, in the SHARED_CACHE_TABLE table created by
+# manage.py createcachetable, and backs the *_CACHE_ALIAS settings that
+# need a cache shared between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_TABLE', 'shared_cache'),
+    },
+}
+
+
+# Token authentication cache
+# Tokens are resolved from an in-process cache for AUTH_TOKEN_CACHE_TTL
+# seconds. Set AUTH_TOKEN_CACHE_ALIAS to a CACHES alias to share entries
+# between workers. The in-process cache is then skipped, so revoked tokens
+# stop working in every worker at once.
+
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS')
+
+
+# Token issuance
+# Login attempts are limited per client IP and per email before the
+# password is checked. Each worker remembers the attempts of at most
+# LOGIN_THROTTLE_MAX_KEYS IPs and emails. Tokens are reused until they are
+# older than AUTH_TOKEN_MAX_AGE seconds (0 keeps them forever).
+
+LOGIN_THROTTLE_IP_RATE = os.environ.get('LOGIN_THROTTLE_IP_RATE', '60/min')
+LOGIN_THROTTLE_EMAIL_RATE = os.environ.get(
+    'LOGIN_THROTTLE_EMAIL_RATE', '10/min'
+)
+LOGIN_THROTTLE_MAX_KEYS = int(
+    os.environ.get('LOGIN_THROTTLE_MAX_KEYS', 100000)
+)
+AUTH_TOKEN_MAX_AGE = int(os.environ.get('AUTH_TOKEN_MAX_AGE', 0))
+
+
+# Experience API throttling
+# Token buckets per user and endpoint with separate read and write
+# budgets. Set THROTTLE_CACHE_ALIAS to a CACHES alias to share the
+# buckets between nodes.
+
+EXPERIENCE_THROTTLE_READ_RATE = os.environ.get(
+    'EXPERIENCE_THROTTLE_READ_RATE', '600/min'
+)
+EXPERIENCE_THROTTLE_WRITE_RATE = os.environ.get(
+    'EXPERIENCE_THROTTLE_WRITE_RATE', '120/min'
+)
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS')
+
+
+# Request instrumentation
+# ServerTimingMiddleware reports query count/time and view/render time
+# for the namespaces below in a Server-Timing header and a log line.
+# Budgets of 0 are disabled; the latency budget is in milliseconds.
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED') == '1'
+SERVER_TIMING_NAMESPACES = ['experience', 'user']
+SERVER_TIMING_QUERY_BUDGET = int(
+    os.environ.get('SERVER_TIMING_QUERY_BUDGET', 0)
+)
+SERVER_TIMING_LATENCY_BUDGET = int(
+    os.environ.get('SERVER_TIMING_LATENCY_BUDGET', 0)
+)
+
+
+# Metrics
+# MetricsMiddleware records per view counters and histograms served at
+# /metrics. Each worker writes its totals to METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds so a scrape sees the whole node.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+
+# Request profiling
+# Staff users can profile a request by sending an X-Profile header or a
+# profile query parameter. Reports are downloaded from
+# /api/profiles/<id>/.
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILE_REPORT_DIR = os.environ.get(
+    'PROFILE_REPORT_DIR', '/vol/web/profiles'
+)
+PROFILE_EXPLAIN_COUNT = int(os.environ.get('PROFILE_EXPLAIN_COUNT', 3))
+
+
+# Slow query log
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are logged on the
+# core.slow_queries logger and aggregated by fingerprint at
+# /api/slow-queries/.
+
+SLOW_QUERY_ENABLED = os.environ.get('SLOW_QUERY_ENABLED') == '1'
+SLOW_QUERY_THRESHOLD_MS = int(
+    os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)
+)
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') == '1'
+
+
+# Health checks
+# Answered by HealthCheckMiddleware before the rest of the middleware.
+
+HEALTH_LIVENESS_PATH = '/healthz'
+HEALTH_READINESS_PATH = '/readyz'
+HEALTH_CHECK_CACHE_SECONDS = int(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 2)
+)
+
+
+# Lean API requests
+# Requests under these prefixes without a session cookie skip the
+# session, authentication, CSRF and message middleware. The API
+# authenticates with tokens, so those only matter for the admin.
+
+API_LEAN_PREFIXES = tuple(
+    filter(None, os.environ.get('API_LEAN_PREFIXES', '/api/').split(','))
+)
+
+
+# REST framework
+# The browsable API, with its templates and forms, is only loaded in
+# development.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+}
+
+
+# Startup
+# startup_report fails with --check when a fresh worker takes longer than
+# STARTUP_TARGET_MS to answer its first request.
+
+STARTUP_TARGET_MS = int(os.environ.get('STARTUP_TARGET_MS', 1000))
+
+
+# ASGI
+# Number of threads running views when served by app.asgi.
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+
+
+# Change events
+# With EVENTS_ENABLED=1, served over ASGI at EVENTS_PATH as server-sent
+# events. Workers share events through PostgreSQL LISTEN/NOTIFY on
+# EVENTS_CHANNEL; use core.events.LocalTransport for a single worker.
+# Writes send no events while disabled.
+
+EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED') == '1'
+EVENTS_PATH = '/api/events/'
+EVENTS_TRANSPORT = os.environ.get(
+    'EVENTS_TRANSPORT', 'core.events.PostgresTransport'
+)
+EVENTS_CHANNEL = 'experience_events'
+EVENTS_KEEPALIVE = int(os.environ.get('EVENTS_KEEPALIVE', 15))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+
+
+# Delta sync
+# List endpoints accept ?since=<sync token>. Tokens hold the ID of the
+# oldest running transaction on PostgreSQL. Other databases use the clock,
+# lagging it by SYNC_SAFETY_MARGIN seconds, longer than any write
+# transaction. Tombstones of deleted rows are kept for SYNC_TOMBSTONE_DAYS.
+
+SYNC_SAFETY_MARGIN = int(os.environ.get('SYNC_SAFETY_MARGIN', 10))
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+
+# Idempotency keys
+# Creates sent with an Idempotency-Key header are stored for
+# IDEMPOTENCY_KEY_TTL seconds and replayed when retried. A retry that
+# arrives while the first request runs waits up to
+# IDEMPOTENCY_WAIT_SECONDS for its response. A request holds its key for
+# IDEMPOTENCY_LEASE_SECONDS, longer than any request may run, after which
+# a retry takes it over, so keys of crashed workers are not stuck.
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))
+IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+IDEMPOTENCY_LEASE_SECONDS = int(
+    os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 120)
+)
+
+
+# Experience API
+# Maximum number of IDs in one /api/experience/experiences/batch/ call.
+
+EXPERIENCE_BATCH_MAX = int(os.environ.get('EXPERIENCE_BATCH_MAX', 100))
+
+
+# Bulk deletion
+# Rows deleted per transaction by the bulk_delete command and admin actions.
+
+BULK_DELETE_BATCH_SIZE = int(os.environ.get('BULK_DELETE_BATCH_SIZE', 1000))
+
+
+# Nearby search
+# Radius of ?near=<lat>,<lng> searches without a ?radius=, and the largest
+# radius accepted, in km.
+
+GEO_DEFAULT_RADIUS_KM = float(os.environ.get('GEO_DEFAULT_RADIUS_KM', 10))
+GEO_MAX_RADIUS_KM = float(os.environ.get('GEO_MAX_RADIUS_KM', 500))
+
+
+# Related experiences
+# Experiences are related by Jaccard similarity of their tags, by how close
+# their locations are and by how close their prices are, weighted below.
+# The RELATED_TOP_K best of each experience are stored per user in the
+# database, and kept in the RELATED_CACHE_ALIAS cache for
+# RELATED_CACHE_TTL seconds once read; that cache may be local to each
+# worker. Writes mark the index stale, and refresh_related --interval
+# rebuilds stale indexes outside of requests.
+
+RELATED_TAG_WEIGHT = float(os.environ.get('RELATED_TAG_WEIGHT', 0.6))
+RELATED_LOCATION_WEIGHT = float(
+    os.environ.get('RELATED_LOCATION_WEIGHT', 0.25)
+)
+RELATED_PRICE_WEIGHT = float(os.environ.get('RELATED_PRICE_WEIGHT', 0.15))
+RELATED_DISTANCE_SCALE_KM = float(
+    os.environ.get('RELATED_DISTANCE_SCALE_KM', 10)
+)
+RELATED_TOP_K = int(os.environ.get('RELATED_TOP_K', 20))
+RELATED_CACHE_ALIAS = os.environ.get('RELATED_CACHE_ALIAS', 'default')
+RELATED_CACHE_TTL = int(os.environ.get('RELATED_CACHE_TTL', 3600))
+
+
+# Autocomplete
+# ?prefix= searches of tags and locations return AUTOCOMPLETE_LIMIT names by
+# default and at most AUTOCOMPLETE_MAX_LIMIT.
+
+AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', 10))
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
@@ -13,15 +13,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path
+from django.urls import URLResolver, path
+from django.urls.resolvers import RoutePattern
 from django.urls.conf import include
 from django.conf.urls.static import static
 from django.conf import settings
+from core import views as core_views
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # Imported lazily so API workers never load the admin
+    URLResolver(
+        RoutePattern('admin/'), 'app.admin_urls',
+        app_name='admin', namespace='admin'
+    ),
     path('api/user/', include('user.urls')),
     path('api/experience/', include('experience.urls')),
+    path('metrics', core_views.metrics, name='metrics'),
+    path(
+        'api/profiles/<uuid:report_id>/',
+        core_views.ProfileReportView.as_view(),
+        name='profile-report'
+    ),
+    path(
+        'api/slow-queries/',
+        core_views.SlowQueryView.as_view(),
+        name='slow-queries'
+    ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -2,6 +2,11 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 from core import models
+from core.deletion import delete_locations, delete_users
+
+
+def describe(counts):
+    return ', '.join(f'{n} {k}' for k, n in counts.items())
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
@@ -24,9 +29,34 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('email', 'password1', 'password2') 
         }),
     )
+    actions = ['bulk_delete']
+
+    @admin.action(
+        permissions=['delete'],
+        description=_('Delete selected users and their data in batches')
+    )
+    def bulk_delete(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        self.message_user(request, _('Deleted %s') % describe(
+            delete_users(ids)
+        ))
+
+
+class LocationAdmin(admin.ModelAdmin):
+    actions = ['bulk_delete']
+
+    @admin.action(
+        permissions=['delete'],
+        description=_('Delete selected locations and experiences in batches')
+    )
+    def bulk_delete(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        self.message_user(request, _('Deleted %s') % describe(
+            delete_locations(ids)
+        ))
 
 
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Tag)
-admin.site.register(models.Location)
+admin.site.register(models.Location, LocationAdmin)
 admin.site.register(models.Experience)
\ No newline at end of file
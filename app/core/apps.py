@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        """Connect the signal receivers and register the checks"""
+        from core import authentication  # noqa: F401
+        from core import checks  # noqa: F401
+        from core import counters  # noqa: F401
+        from core import events  # noqa: F401
+        from core import related  # noqa: F401
+        from core import sync  # noqa: F401
+        from core.db import sharding  # noqa: F401
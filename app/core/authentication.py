@@ -0,0 +1,179 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """Thread safe in-process TTL/LRU cache of token key -> user"""
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached user for a key or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, user):
+        """Cache a user for a token key, evicting the oldest entry if full"""
+        with self._lock:
+            self._data[key] = (user, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a token key from the cache"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_user(self, user_id):
+        """Remove every cached token belonging to a user"""
+        with self._lock:
+            keys = [
+                key for key, (user, expires) in self._data.items()
+                if user.pk == user_id
+            ]
+            for key in keys:
+                del self._data[key]
+        return keys
+
+    def clear(self):
+        """Empty the cache and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._data),
+            }
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+def _shared_cache():
+    """Return the shared cache backing the token cache, if configured"""
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    return f'auth-token:{key}'
+
+
+def invalidate_token(key):
+    """Drop a token from the local and shared caches"""
+    token_cache.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key))
+
+
+def invalidate_users(user_ids):
+    """Drop every cached token of some users"""
+    keys = set()
+    for user_id in user_ids:
+        keys.update(token_cache.delete_user(user_id))
+    shared = _shared_cache()
+    if shared is not None:
+        keys.update(Token.objects.filter(user_id__in=user_ids).values_list(
+            'key', flat=True
+        ))
+        shared.delete_many([_shared_key(key) for key in keys])
+
+
+def invalidate_user(user):
+    """Drop every cached token for a user"""
+    invalidate_users([user.pk])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that avoids the token/user query on cache hits.
+
+    With a shared cache configured the in-process cache is not used, so a
+    token revoked by one worker is rejected by every worker at once.
+    """
+
+    def authenticate_credentials(self, key):
+        """Resolve the token from the cache before falling back to the db"""
+        if _shared_cache() is not None:
+            user = self._get_shared(key)
+            if user is None:
+                user, token = super().authenticate_credentials(key)
+                self._set_shared(key, user)
+        else:
+            user = token_cache.get(key)
+            if user is None:
+                user, token = super().authenticate_credentials(key)
+                token_cache.set(key, user)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Every request gets its own copy so that a view mutating
+        # request.user never leaks into other requests.
+        return (copy.copy(user), key)
+
+    def _get_shared(self, key):
+        shared = _shared_cache()
+        if shared is None:
+            return None
+        return shared.get(_shared_key(key))
+
+    def _set_shared(self, key, user):
+        shared = _shared_cache()
+        if shared is not None:
+            shared.set(_shared_key(key), user, token_cache.ttl)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Invalidate a token as soon as it is deleted"""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, **kwargs):
+    """Invalidate cached tokens when a user changes.
+
+    Deactivation and password changes both go through save(), so any
+    saved user is dropped rather than trying to diff the fields.
+    """
+    if not created:
+        invalidate_user(instance)
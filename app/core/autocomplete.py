@@ -0,0 +1,37 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from core.models import lower_name
+
+
+class PrefixSearchMixin:
+    """Autocomplete names with ?prefix=<text>&limit=<n>.
+
+    Matching is case insensitive and results are in name order. Searches
+    read at most limit rows from the (user, name_lower) index.
+    """
+
+    def list(self, request, *args, **kwargs):
+        prefix = request.query_params.get('prefix')
+        if prefix is None:
+            return super().list(request, *args, **kwargs)
+
+        prefix = lower_name(prefix)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.AUTOCOMPLETE_LIMIT
+            ))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= settings.AUTOCOMPLETE_MAX_LIMIT:
+            raise ValidationError({
+                'limit': 'Must be between 1 and '
+                         f'{settings.AUTOCOMPLETE_MAX_LIMIT}.'
+            })
+
+        found = self.filter_queryset(self.get_queryset()) \
+            .filter(name_lower__startswith=prefix) \
+            .order_by('name_lower', 'id')[:limit]
+
+        return Response(self.get_serializer(found, many=True).data)
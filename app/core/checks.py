@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+# Cache backends keeping their entries in the memory of each worker
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+@register()
+def check_replica_pin_cache(app_configs, **kwargs):
+    """Check that replica pins are seen by every worker"""
+    if not settings.DB_REPLICAS:
+        return []
+    alias = settings.DB_REPLICA_PIN_CACHE_ALIAS
+    cache = settings.CACHES.get(alias)
+    if cache is None:
+        return [Error(
+            f'DB_REPLICA_PIN_CACHE_ALIAS {alias!r} is not in CACHES.',
+            id='core.E001',
+        )]
+    if cache['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f'DB_REPLICA_PIN_CACHE_ALIAS {alias!r} is local to each worker.',
+            hint='Writes would not pin reads served by other workers. Use '
+                 'a cache shared between workers, like "shared".',
+            id='core.E002',
+        )]
+    return []
@@ -0,0 +1,243 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_save, pre_delete, \
+    pre_save
+from django.utils import timezone
+
+from core.models import ChangeId, Experience, Location, Tag, UserStats
+
+
+def adjust(queryset, delta):
+    """Add delta to the experience_count of the rows of a queryset"""
+    queryset.update(
+        experience_count=F('experience_count') + delta,
+        updated_at=timezone.now(),
+        change_id=ChangeId()
+    )
+
+
+def adjust_stats(user_id, using, count, price, minutes):
+    """Add to the experience totals of a user"""
+    stats = UserStats.objects.using(using).filter(user_id=user_id)
+    changes = {
+        'experience_count': F('experience_count') + count,
+        'total_price': F('total_price') + price,
+        'total_minutes': F('total_minutes') + minutes,
+    }
+    if not stats.update(**changes):
+        UserStats.objects.using(using).get_or_create(user_id=user_id)
+        stats.update(**changes)
+
+
+COUNTED_FIELDS = ('location_id', 'price', 'time_minutes')
+
+
+def totals(price, minutes):
+    """Return a price and minutes as saved, whatever type they were set as"""
+    return (
+        Experience._meta.get_field('price').to_python(price),
+        Experience._meta.get_field('time_minutes').to_python(minutes),
+    )
+
+
+def stored_counted(instance, using):
+    """Lock the stored row of an experience and return its counted fields.
+
+    Returns None when the row is gone. Concurrent saves and deletes of the
+    same experience wait here, so each counts the change it actually
+    makes rather than one from stale values.
+    """
+    return Experience._base_manager.using(using).select_for_update() \
+        .filter(pk=instance.pk).values_list(*COUNTED_FIELDS).first()
+
+
+def experience_saving(sender, instance, raw, using, **kwargs):
+    # Experience.save() runs in a transaction holding the lock until the
+    # counts are adjusted
+    instance._counted = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._counted = stored_counted(instance, using)
+
+
+def experience_saved(sender, instance, created, using, **kwargs):
+    """Count an experience for its location and user"""
+    if created or instance._counted is None:
+        location_id, price, minutes = None, 0, 0
+    else:
+        location_id, price, minutes = instance._counted
+        price, minutes = totals(price, minutes)
+    new_price, new_minutes = totals(instance.price, instance.time_minutes)
+    if location_id != instance.location_id:
+        if location_id is not None:
+            adjust(Location.objects.using(using).filter(pk=location_id), -1)
+        adjust(Location.objects.using(using).filter(
+            pk=instance.location_id
+        ), 1)
+    if created or (price, minutes) != (new_price, new_minutes):
+        adjust_stats(
+            instance.user_id, using, int(created),
+            new_price - price, new_minutes - minutes
+        )
+
+
+def experience_deleting(sender, instance, using, **kwargs):
+    """Stop counting an experience for its location, tags and user"""
+    stored = stored_counted(instance, using)
+    if stored is None:
+        # Already deleted by a concurrent request, which did the counting
+        return
+    location_id, price, minutes = stored
+    # The cascade removes the tag assignments without m2m_changed
+    adjust(Tag.objects.using(using).filter(experience=instance), -1)
+    adjust(Location.objects.using(using).filter(pk=location_id), -1)
+    price, minutes = totals(price, minutes)
+    adjust_stats(instance.user_id, using, -1, -price, -minutes)
+
+
+def lock_experiences(ids, using):
+    """Lock experience rows, in a fixed order to avoid deadlocks"""
+    list(Experience._base_manager.using(using).select_for_update()
+         .filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, using,
+                 **kwargs):
+    """Count tag assignments as they are added and removed.
+
+    The pre_ actions lock the experiences involved, so concurrent changes
+    of their tags take turns and each counts only the assignments it
+    actually adds or removes.
+    """
+    through = sender._base_manager.using(using)
+    if reverse:
+        assigned = through.filter(tag=instance)
+        other_id = 'experience_id'
+    else:
+        assigned = through.filter(experience=instance)
+        other_id = 'tag_id'
+    if pk_set is not None:
+        assigned = assigned.filter(**{f'{other_id}__in': pk_set})
+
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        if not reverse:
+            lock_experiences([instance.pk], using)
+        elif pk_set is not None:
+            lock_experiences(pk_set, using)
+        else:
+            lock_experiences(assigned.values_list(other_id, flat=True),
+                             using)
+        # pk_set holds every ID asked for, assigned or not, and for adds
+        # was computed before the lock
+        instance._assigned_ids = set(
+            assigned.values_list(other_id, flat=True)
+        )
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        before = instance.__dict__.pop('_assigned_ids', set())
+        if action == 'post_add':
+            changed, delta = pk_set - before, 1
+        else:
+            changed, delta = before, -1
+        if not changed:
+            return
+        if reverse:
+            adjust(Tag.objects.using(using).filter(pk=instance.pk),
+                   delta * len(changed))
+        else:
+            adjust(Tag.objects.using(using).filter(pk__in=changed), delta)
+
+
+def uncount_experiences(ids, using):
+    """Stop counting experiences about to be deleted without signals"""
+    through = Experience.tags.through
+    assigned = through.objects.using(using).filter(experience_id__in=ids)
+    per_tag = assigned.filter(tag=OuterRef('pk')).order_by() \
+        .values('tag').annotate(n=Count('*')).values('n')
+    Tag._base_manager.using(using) \
+        .filter(pk__in=assigned.values('tag_id')) \
+        .update(
+            experience_count=F('experience_count') - Subquery(per_tag),
+            updated_at=timezone.now(),
+            change_id=ChangeId()
+        )
+    for row in user_totals(
+        Experience._base_manager.using(using).filter(pk__in=ids)
+    ):
+        adjust_stats(
+            row['user'], using, -row['count'], -row['price'],
+            -row['minutes']
+        )
+
+
+def user_totals(experiences):
+    """Return the experience totals of each user of a queryset"""
+    return experiences.order_by().values('user').annotate(
+        count=Count('id'),
+        price=Sum('price'),
+        minutes=Sum('time_minutes')
+    )
+
+
+def recount(using, fix=True):
+    """Recompute the experience counts of a database.
+
+    Returns the number of tags and of locations whose count was wrong,
+    correcting them unless fix is False.
+    """
+    experiences = Experience.objects.using(using).filter(
+        location=OuterRef('pk')
+    ).order_by().values('location').annotate(n=Count('*')).values('n')
+    through = Experience.tags.through
+    assignments = through.objects.using(using).filter(
+        tag=OuterRef('pk')
+    ).order_by().values('tag').annotate(n=Count('*')).values('n')
+
+    drifted = {}
+    for model, actual in ((Tag, assignments), (Location, experiences)):
+        wrong = model._base_manager.using(using) \
+            .annotate(actual=Coalesce(Subquery(actual), 0)) \
+            .exclude(experience_count=F('actual'))
+        ids = list(wrong.values_list('pk', flat=True))
+        if fix and ids:
+            model._base_manager.using(using).filter(pk__in=ids).update(
+                experience_count=Coalesce(Subquery(actual), 0)
+            )
+        drifted[model._meta.model_name] = len(ids)
+    return drifted
+
+
+pre_save.connect(experience_saving, sender=Experience)
+post_save.connect(experience_saved, sender=Experience)
+pre_delete.connect(experience_deleting, sender=Experience)
+m2m_changed.connect(tags_changed, sender=Experience.tags.through)
+
+
+def rebuild_stats(using, fix=True):
+    """Recompute the experience totals of the users of a database.
+
+    Returns the number of users whose totals were wrong, correcting them
+    unless fix is False.
+    """
+    actual = {
+        row['user']: (row['count'], row['price'], row['minutes'])
+        for row in user_totals(Experience._base_manager.using(using))
+    }
+    stored = {
+        stats.user_id: stats
+        for stats in UserStats._base_manager.using(using)
+    }
+
+    wrong = []
+    for user_id in actual.keys() | stored.keys():
+        count, price, minutes = actual.get(user_id, (0, 0, 0))
+        stats = stored.get(user_id) or UserStats(user_id=user_id)
+        if (stats.experience_count, stats.total_price,
+                stats.total_minutes) != (count, price, minutes):
+            stats.experience_count = count
+            stats.total_price = price
+            stats.total_minutes = minutes
+            wrong.append(stats)
+
+    if fix:
+        for stats in wrong:
+            stats.save(using=using)
+    return len(wrong)
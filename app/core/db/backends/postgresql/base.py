@@ -0,0 +1,83 @@
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+
+from core.db.pool import ConnectionPool, get_pool
+
+
+def check_connection(conn):
+    """Return True if an idle connection still answers a query"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def reset_connection(conn):
+    """Roll back any open transaction, returning False if conn is broken"""
+    if conn.closed:
+        return False
+    status = conn.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend that keeps connections in a per-process pool.
+
+    Pool settings come from the POOL key of the database settings:
+    MAX_SIZE, TIMEOUT (seconds to wait for a free connection) and
+    CHECK_INTERVAL (seconds a connection can stay idle before it is
+    checked on reuse).
+    """
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool(conn_params).acquire()
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def close_if_unusable_or_obsolete(self):
+        """Return the connection to the pool at the end of every request.
+
+        Keeping it until CONN_MAX_AGE runs out would tie it to this thread
+        and leave the worker's other threads waiting on the pool.
+        """
+        if self.connection is not None and not self.in_atomic_block:
+            self.close()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool(self.get_connection_params()).release(
+                    self.connection
+                )
+
+    def pool(self, conn_params):
+        """Return the pool for these connection parameters"""
+        key = (self.alias,) + tuple(
+            sorted((name, str(value)) for name, value in conn_params.items())
+        )
+        options = self.settings_dict.get('POOL', {})
+
+        def factory():
+            return ConnectionPool(
+                connect=lambda: base.DatabaseWrapper.get_new_connection(
+                    self, conn_params
+                ),
+                check=check_connection,
+                reset=reset_connection,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                check_interval=options.get('CHECK_INTERVAL', 30),
+            )
+
+        return get_pool(key, factory)
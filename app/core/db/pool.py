@@ -0,0 +1,127 @@
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """Raised when no connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Thread safe pool of database connections.
+
+    connect() opens a new connection, check() tells whether an idle
+    connection still works and reset() prepares a returned connection for
+    reuse, returning False if it should be thrown away. Idle connections
+    are only checked if they have been idle longer than check_interval.
+    """
+
+    def __init__(self, connect, check, reset, max_size=10, timeout=10,
+                 check_interval=30):
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.active = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self._idle = []
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Return an idle connection or open a new one if the pool has room"""
+        start = time.monotonic()
+        conn = None
+        with self._cond:
+            while not self._idle and self.active >= self.max_size:
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'No database connection available after '
+                        f'{self.timeout}s'
+                    )
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            self.active += 1
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                self.waits += 1
+                self.wait_time += waited
+
+        if conn is not None and \
+                time.monotonic() - idle_since > self.check_interval and \
+                not self.check(conn):
+            self._discard(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                with self._cond:
+                    self.active -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        try:
+            reusable = self.reset(conn)
+        except Exception:
+            reusable = False
+        if not reusable:
+            self._discard(conn)
+        with self._cond:
+            self.active -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_idle(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, idle_since in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Return the active/idle counts and the time spent waiting"""
+        with self._cond:
+            return {
+                'active': self.active,
+                'idle': len(self._idle),
+                'waits': self.waits,
+                'wait_seconds': self.wait_time,
+            }
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """Return the pool for a key, creating it with factory() if needed"""
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+
+def all_pools():
+    """Return the pools of this process by key"""
+    with _pools_lock:
+        return dict(_pools)
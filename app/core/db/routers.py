@@ -0,0 +1,136 @@
+import hashlib
+import itertools
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.utils import OperationalError
+
+from core.health import CachedCheck
+
+
+# Set by ReplicaRoutingMiddleware for requests that may read from replicas
+use_replica = ContextVar('use_replica', default=False)
+
+
+def check_replica(alias):
+    """Raise OperationalError if a replica is down or lagging too far.
+
+    Lag is the amount of WAL the replica has yet to replay compared with
+    the primary's current position. Unlike the time since the last
+    replayed transaction, it stays at 0 while the primary is idle.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return
+    with connections['default'].cursor() as cursor:
+        cursor.execute('SELECT pg_current_wal_lsn()')
+        primary_lsn = cursor.fetchone()[0]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_wal_lsn_diff(%s::pg_lsn, pg_last_wal_replay_lsn())',
+            [primary_lsn]
+        )
+        lag = cursor.fetchone()[0]
+    if lag is not None and lag > settings.DB_REPLICA_MAX_LAG_BYTES:
+        raise OperationalError(
+            f'Replica {alias} is {int(lag)} bytes of WAL behind'
+        )
+
+
+_replica_checks = {}
+
+
+def replica_ready(alias):
+    """Return whether a replica is usable, checking it periodically"""
+    check = _replica_checks.get(alias)
+    if check is None:
+        check = _replica_checks.setdefault(
+            alias, CachedCheck(lambda: check_replica(alias))
+        )
+    return check(settings.DB_REPLICA_CHECK_INTERVAL)
+
+
+class PrimaryPins:
+    """Remember clients that wrote recently so they read from the primary.
+
+    Pins are kept in the DB_REPLICA_PIN_CACHE_ALIAS cache, which must be
+    shared by every worker for a write and the following read to see the
+    same pin. Clients are identified by their token, else their address.
+    """
+
+    def _cache(self):
+        return caches[settings.DB_REPLICA_PIN_CACHE_ALIAS]
+
+    def _key(self, key):
+        return f'replica-pin:{key}'
+
+    def pin(self, key, seconds):
+        self._cache().set(self._key(key), True, seconds)
+
+    def is_pinned(self, key):
+        return self._cache().get(self._key(key)) is not None
+
+    def client_key(self, request):
+        credentials = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if credentials:
+            return self.token_key(credentials[-1])
+        return request.META.get('REMOTE_ADDR')
+
+    def token_key(self, token):
+        return 'token:' + hashlib.sha1(token.encode()).hexdigest()
+
+    def pin_token(self, token):
+        """Pin the client of a token just issued, which replicas may lack"""
+        if settings.DB_REPLICAS:
+            self.pin(self.token_key(token), settings.DB_REPLICA_PIN_SECONDS)
+
+
+primary_pins = PrimaryPins()
+
+# Cookie set alongside the cached pin, for clients that keep cookies
+PRIMARY_PIN_COOKIE = 'primary_pin'
+
+
+class ReplicaRouter:
+    """Send reads of safe requests to healthy replicas.
+
+    Replicas are used round robin and skipped while down or more than
+    DB_REPLICA_MAX_LAG_BYTES of WAL behind. Without a healthy replica, or
+    outside a safe request, reads go to the primary.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DB_REPLICAS
+        if not replicas or not use_replica.get():
+            return None
+        if model._meta.app_label == 'django_cache':
+            # Shared cache entries, like pins, must not lag their writes
+            return None
+        start = next(self._counter)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if replica_ready(alias):
+                return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {'default', *settings.DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DB_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,342 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Max
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from core.models import Experience, Location, Tag, Tombstone, UserShard, \
+    UserStats
+
+
+# User whose shard serves the current request, set by ShardedViewMixin
+shard_user = ContextVar('shard_user', default=None)
+
+OWNED_MODELS = {
+    'tag', 'location', 'experience', 'experience_tags', 'tombstone',
+    'userstats'
+}
+
+
+def sharding_enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def is_owned(model):
+    """Return True for models whose rows belong to a single user"""
+    return model._meta.app_label == 'core' and \
+        model._meta.model_name in OWNED_MODELS
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved, try again shortly.'
+    default_code = 'shard_moving'
+
+
+def has_default_rows(user_id):
+    """Return True if a user has rows from before sharding was enabled"""
+    return any(
+        model._base_manager.using('default').filter(user_id=user_id).exists()
+        for model in (Experience, Tag, Location, Tombstone, UserStats)
+    )
+
+
+def place_user(user_id):
+    """Create the directory row of a user seen for the first time.
+
+    Users with rows on the default database stay there until
+    rebalance_shards moves them. Others are placed by user ID modulo the
+    number of shards, which first gets a copy of their user row.
+    """
+    if has_default_rows(user_id):
+        alias = 'default'
+    else:
+        shards = settings.SHARD_DATABASES
+        alias = shards[user_id % len(shards)]
+        user = get_user_model()._base_manager.using('default') \
+            .filter(pk=user_id).first()
+        if user is not None:
+            mirror_user(user, alias)
+    shard, created = UserShard.objects.using('default').get_or_create(
+        user_id=user_id, defaults={'alias': alias}
+    )
+    return shard
+
+
+class ShardDirectory:
+    """Cached lookup of the shard holding each user's data.
+
+    The mapping lives in the UserShard table on the default database.
+    Users are placed by place_user() when first seen. Entries are cached
+    for SHARD_DIRECTORY_TTL seconds; requests refresh their user's entry,
+    as another worker may have moved the user.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        return self.refresh(user_id).alias
+
+    def refresh(self, user_id):
+        """Return the directory row of a user, bypassing the cache"""
+        shard = UserShard.objects.using('default') \
+            .filter(user_id=user_id).first()
+        if shard is None:
+            shard = place_user(user_id)
+        self.set(user_id, shard.alias)
+        return shard
+
+    def set(self, user_id, alias):
+        with self._lock:
+            self._cache[user_id] = (
+                alias, time.monotonic() + settings.SHARD_DIRECTORY_TTL
+            )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+directory = ShardDirectory()
+
+
+def shard_for_user(user_id):
+    """Return the database alias holding a user's data"""
+    return directory.get(user_id)
+
+
+def _instance_user_id(instance):
+    if instance is None:
+        return None
+    if hasattr(instance, 'user_id'):
+        return instance.user_id
+    # Through table rows point at an experience; only use it when loaded
+    descriptor = getattr(type(instance), 'experience', None)
+    if descriptor is not None and descriptor.is_cached(instance):
+        return instance.experience.user_id
+    return None
+
+
+class ShardRouter:
+    """Route user owned models to the shard of their user.
+
+    The user comes from the instance hint when there is one, otherwise from
+    the user of the current request. The shard directory itself always
+    lives on the default database.
+    """
+
+    def _db_for(self, model, hints):
+        if not sharding_enabled():
+            return None
+        if model._meta.label == 'core.UserShard':
+            return 'default'
+        if not is_owned(model):
+            return None
+        user_id = _instance_user_id(hints.get('instance'))
+        if user_id is None:
+            user_id = shard_user.get()
+        if user_id is None:
+            return None
+        return shard_for_user(user_id)
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Owned rows reference the user's mirror row on the same shard
+        if sharding_enabled() and (is_owned(type(obj1)) or
+                                   is_owned(type(obj2))):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards get the full schema so owned rows can keep their foreign
+        # keys to the mirrored user rows.
+        return None
+
+
+class ShardedViewMixin:
+    """Serve user owned models from the authenticated user's shard.
+
+    Writes are rejected with a 503 while the user is being moved.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not request.user.is_authenticated:
+            return
+        if sharding_enabled():
+            shard = directory.refresh(request.user.pk)
+            if shard.moving and request.method not in SAFE_METHODS:
+                raise ShardMoving()
+        self._shard_token = shard_user.set(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            shard_user.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def user_fields(user):
+    """Return the concrete field values of a user for mirroring"""
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+    }
+
+
+def mirror_user(user, alias):
+    """Create or update the copy of a user row on a shard"""
+    if alias == 'default':
+        return
+    User = get_user_model()
+    fields = user_fields(user)
+    pk = fields.pop('id')
+    updated = User._base_manager.using(alias).filter(pk=pk).update(**fields)
+    if not updated:
+        User(pk=pk, **fields).save(using=alias, force_insert=True)
+
+
+def copy_rows(model, queryset, alias):
+    """Copy rows with their primary keys to another database"""
+    rows = [model(**values) for values in queryset.values(
+        *[field.attname for field in model._meta.concrete_fields]
+    )]
+    model._base_manager.using(alias).bulk_create(rows)
+    return len(rows)
+
+
+def move_user(user_id, target):
+    """Move a user's owned rows to another shard and update the directory.
+
+    The user is first marked as moving, which makes every worker reject
+    their writes. Copying starts SHARD_MOVE_GRACE seconds later, once
+    writes that passed the check before have finished.
+    """
+    source = directory.refresh(user_id).alias
+    if source == target:
+        return {}
+    user = get_user_model()._base_manager.using('default').get(pk=user_id)
+    shard = UserShard.objects.using('default').filter(user_id=user_id)
+    shard.update(moving=True)
+    try:
+        time.sleep(settings.SHARD_MOVE_GRACE)
+        return _copy_user(user, source, target)
+    finally:
+        shard.update(moving=False)
+
+
+def _copy_user(user, source, target):
+    user_id = user.pk
+    through = Experience.tags.through
+    moved = {}
+
+    with transaction.atomic(using=target), transaction.atomic(using=source):
+        mirror_user(user, target)
+        for model in (Location, Tag, Experience, Tombstone, UserStats):
+            moved[model._meta.model_name] = copy_rows(
+                model,
+                model._base_manager.using(source).filter(user_id=user_id),
+                target
+            )
+        moved['experience_tags'] = copy_rows(
+            through,
+            through._base_manager.using(source).filter(
+                experience__user_id=user_id
+            ),
+            target
+        )
+        if connections[target].vendor == 'postgresql':
+            reset_sequences(target)
+
+        UserShard.objects.using('default').filter(user_id=user_id) \
+            .update(alias=target)
+        directory.set(user_id, target)
+        # The rows still exist, so skip the deletion signals that would
+        # leave tombstones and send change events.
+        through._base_manager.using(source).filter(
+            experience__user_id=user_id
+        )._raw_delete(source)
+        for model in (Experience, Tag, Location, Tombstone, UserStats):
+            model._base_manager.using(source).filter(
+                user_id=user_id
+            )._raw_delete(source)
+        if source != 'default':
+            get_user_model()._base_manager.using(source).filter(
+                pk=user_id
+            )._raw_delete(source)
+
+    return moved
+
+
+def reset_sequences(alias):
+    """Make a PostgreSQL shard hand out IDs no other shard uses.
+
+    Shard i of n only generates IDs congruent to i + 1 modulo n, so rows
+    keep their IDs when they move between shards. IDs start above those
+    used on the default database, so rows of users placed there before
+    sharding was enabled can be moved in too.
+    """
+    shards = settings.SHARD_DATABASES
+    stride = len(shards)
+    index = shards.index(alias)
+    models = (Tag, Location, Experience, Experience.tags.through, Tombstone)
+    with connections[alias].cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+            current = max(
+                cursor.fetchone()[0],
+                model._base_manager.using('default')
+                .aggregate(current=Max('id'))['current'] or 0
+            )
+            start = current + 1 + (index - current) % stride
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, 'id')", [table]
+            )
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                f'ALTER SEQUENCE {sequence} INCREMENT BY {stride}'
+            )
+            cursor.execute('SELECT setval(%s, %s, false)', [sequence, start])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, using, **kwargs):
+    """Keep the copy of a user on its shard up to date"""
+    if sharding_enabled() and using == 'default':
+        mirror_user(instance, shard_for_user(instance.pk))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, using, **kwargs):
+    """Delete a user's copy, and with it their rows, from its shard"""
+    if not sharding_enabled() or using != 'default':
+        return
+    alias = UserShard.objects.using('default').filter(
+        user_id=instance.pk
+    ).values_list('alias', flat=True).first()
+    directory.clear()
+    if alias and alias != 'default':
+        get_user_model()._base_manager.using(alias).filter(
+            pk=instance.pk
+        ).delete()
@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core.counters import uncount_experiences
+from core.db.sharding import sharding_enabled, shard_for_user
+from core.events import send_deletions
+from core.models import Experience, Location, PendingFileDeletion, Tag, \
+    Tombstone
+from core.related import mark_changed
+
+
+def user_alias(user_id):
+    """Return the database holding a user's experiences, tags, locations"""
+    return shard_for_user(user_id) if sharding_enabled() else 'default'
+
+
+def queue_files(names):
+    """Queue stored files for removal by purge_deleted_files"""
+    PendingFileDeletion.objects.using('default').bulk_create(
+        [PendingFileDeletion(name=name) for name in names if name]
+    )
+
+
+def delete_experiences(queryset, alias, batch_size, tombstones, progress):
+    """Delete the experiences of a queryset batch by batch.
+
+    Rows are deleted with plain DELETE statements, so no model instances
+    are loaded and no deletion signals are sent. Tombstones and change
+    events stand in for them when asked for. Image files are queued once
+    their batch has committed.
+    """
+    through = Experience.tags.through
+    total = 0
+    while True:
+        rows = list(
+            queryset.using(alias).order_by('pk')
+            .values_list('pk', 'user_id', 'image')[:batch_size]
+        )
+        if not rows:
+            return total
+        ids = [pk for pk, user_id, image in rows]
+        with transaction.atomic(using=alias):
+            uncount_experiences(ids, alias)
+            through._base_manager.using(alias) \
+                .filter(experience_id__in=ids)._raw_delete(alias)
+            Experience._base_manager.using(alias) \
+                .filter(pk__in=ids)._raw_delete(alias)
+            if tombstones:
+                Tombstone.objects.using(alias).bulk_create([
+                    Tombstone(user_id=user_id, model='experience',
+                              object_id=pk)
+                    for pk, user_id, image in rows
+                ])
+                send_deletions(Experience, [
+                    (pk, user_id) for pk, user_id, image in rows
+                ], alias)
+                for user_id in {user_id for pk, user_id, image in rows}:
+                    mark_changed(user_id, alias)
+        queue_files(image for pk, user_id, image in rows)
+        total += len(rows)
+        progress('experience', total)
+
+
+def delete_rows(model, queryset, alias, batch_size, tombstones, progress):
+    """Delete tags or locations batch by batch, once nothing uses them"""
+    through = Experience.tags.through
+    total = 0
+    while True:
+        rows = list(
+            queryset.using(alias).order_by('pk')
+            .values_list('pk', 'user_id')[:batch_size]
+        )
+        if not rows:
+            return total
+        ids = [pk for pk, user_id in rows]
+        with transaction.atomic(using=alias):
+            if model is Tag:
+                through._base_manager.using(alias) \
+                    .filter(tag_id__in=ids)._raw_delete(alias)
+            model._base_manager.using(alias) \
+                .filter(pk__in=ids)._raw_delete(alias)
+            if tombstones:
+                Tombstone.objects.using(alias).bulk_create([
+                    Tombstone(user_id=user_id, model=model._meta.model_name,
+                              object_id=pk)
+                    for pk, user_id in rows
+                ])
+                send_deletions(model, rows, alias)
+        total += len(rows)
+        progress(model._meta.model_name, total)
+
+
+def _no_progress(model_name, count):
+    pass
+
+
+def delete_users(user_ids, batch_size=None, progress=_no_progress):
+    """Delete users and everything they own without the cascade collector.
+
+    Returns the number of deleted rows by model name.
+    """
+    batch_size = batch_size or settings.BULK_DELETE_BATCH_SIZE
+    counts = dict.fromkeys(['experience', 'tag', 'location', 'user'], 0)
+    for user_id in user_ids:
+        alias = user_alias(user_id)
+        counts['experience'] += delete_experiences(
+            Experience._base_manager.filter(user_id=user_id),
+            alias, batch_size, False, progress
+        )
+        for model in (Tag, Location):
+            counts[model._meta.model_name] += delete_rows(
+                model, model._base_manager.filter(user_id=user_id),
+                alias, batch_size, False, progress
+            )
+        Tombstone.objects.using(alias).filter(user_id=user_id) \
+            ._raw_delete(alias)
+        # Only a handful of rows still refer to the user
+        user = get_user_model()._base_manager.filter(pk=user_id).first()
+        if user is not None:
+            user.delete()
+            counts['user'] += 1
+            progress('user', counts['user'])
+    return counts
+
+
+def delete_locations(location_ids, batch_size=None, progress=_no_progress):
+    """Delete locations and their experiences without the cascade collector.
+
+    Tombstones are left for delta sync. Returns the number of deleted rows
+    by model name.
+    """
+    batch_size = batch_size or settings.BULK_DELETE_BATCH_SIZE
+    counts = {'experience': 0, 'location': 0}
+    owners = {}
+    for alias in settings.SHARD_DATABASES or ['default']:
+        for pk, user_id in Location._base_manager.using(alias) \
+                .filter(pk__in=location_ids).values_list('pk', 'user_id'):
+            if user_alias(user_id) == alias:
+                owners.setdefault(alias, []).append(pk)
+
+    for alias, ids in owners.items():
+        counts['experience'] += delete_experiences(
+            Experience._base_manager.filter(location_id__in=ids),
+            alias, batch_size, True, progress
+        )
+        counts['location'] += delete_rows(
+            Location, Location._base_manager.filter(pk__in=ids),
+            alias, batch_size, True, progress
+        )
+    return counts
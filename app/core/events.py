@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from functools import partial
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication
+from core.models import Experience, Location, Tag
+
+
+logger = logging.getLogger('core.events')
+
+# Sent to a subscriber that fell behind so its stream is closed
+OVERFLOW = object()
+
+
+class Broker:
+    """In-process publish/subscribe of change events by user.
+
+    Events can be published from any thread. Each subscriber gets a
+    bounded asyncio queue on its own event loop.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Return a queue receiving the user's events"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (queue, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.difference_update(
+                {item for item in subscribers if item[0] is queue}
+            )
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, event):
+        """Deliver an event to the subscribers of its user"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['user'], ()))
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(items) for items in self._subscribers.values())
+
+    def _put(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Make room for the overflow marker; the client reconnects
+            queue.get_nowait()
+            queue.put_nowait(OVERFLOW)
+
+
+broker = Broker(queue_size=settings.EVENTS_QUEUE_SIZE)
+
+
+class LocalTransport:
+    """Deliver events to the subscribers of this process only"""
+
+    def send(self, event):
+        broker.publish(event)
+
+    def start(self):
+        pass
+
+
+class PostgresTransport:
+    """Deliver events to every worker through LISTEN/NOTIFY.
+
+    Events are sent with pg_notify on the default database. A listener
+    thread, started with the first subscriber, feeds the notifications of
+    EVENTS_CHANNEL into the broker.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        # Runs after the commit, so a failure must not fail the request
+        try:
+            with connections['default'].cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_notify(%s, %s)',
+                    [settings.EVENTS_CHANNEL, json.dumps(event)]
+                )
+        except DatabaseError:
+            logger.exception('Could not send change event')
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(
+            target=self._listen, name='events-listener', daemon=True
+        ).start()
+
+    def _listen(self):
+        delay = 1
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                # Anything escaping would end the thread and every stream
+                # of this process would go quiet.
+                logger.exception('Event listener failed, reconnecting')
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            else:
+                delay = 1
+
+    def _listen_once(self):
+        """Feed notifications to the broker until the connection fails"""
+        params = connections['default'].get_connection_params()
+        conn = psycopg2.connect(**params)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {settings.EVENTS_CHANNEL}')
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        logger.error('Invalid change event %r', notify.payload)
+                        continue
+                    broker.publish(event)
+        finally:
+            conn.close()
+
+
+_transports = {}
+
+
+def get_transport():
+    """Return the EVENTS_TRANSPORT instance of this process"""
+    path = settings.EVENTS_TRANSPORT
+    if path not in _transports:
+        _transports[path] = import_string(path)()
+    return _transports[path]
+
+
+def make_event(model, user_id, action, pk):
+    return {
+        'user': user_id,
+        'model': model._meta.model_name,
+        'action': action,
+        'id': pk,
+    }
+
+
+def send_event(sender, instance, action, using):
+    """Send a change event once the transaction commits"""
+    if not settings.EVENTS_ENABLED:
+        return
+    event = make_event(sender, instance.user_id, action, instance.pk)
+    transaction.on_commit(
+        partial(get_transport().send, event), using=using
+    )
+
+
+def send_events(events):
+    transport = get_transport()
+    for event in events:
+        transport.send(event)
+
+
+def send_deletions(model, rows, using):
+    """Send deleted events for (pk, user_id) rows deleted without signals,
+    once the transaction commits"""
+    if not settings.EVENTS_ENABLED:
+        return
+    events = [make_event(model, user_id, 'deleted', pk)
+              for pk, user_id in rows]
+    transaction.on_commit(partial(send_events, events), using=using)
+
+
+def model_saved(sender, instance, created, using, **kwargs):
+    send_event(sender, instance, 'created' if created else 'updated', using)
+
+
+def model_deleted(sender, instance, using, **kwargs):
+    send_event(sender, instance, 'deleted', using)
+
+
+for model in (Experience, Tag, Location):
+    post_save.connect(model_saved, sender=model)
+    post_delete.connect(model_deleted, sender=model)
+
+
+def authenticate(scope):
+    """Return the user of the token in the headers or query string"""
+    headers = dict(scope['headers'])
+    auth = headers.get(b'authorization', b'').decode('latin1').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        key = auth[1]
+    else:
+        # EventSource cannot send headers, so also accept ?token=
+        query = scope.get('query_string', b'').decode('latin1')
+        params = dict(
+            part.split('=', 1) for part in query.split('&') if '=' in part
+        )
+        key = params.get('token')
+    if not key:
+        return None
+    try:
+        user, token = CachedTokenAuthentication().authenticate_credentials(
+            key
+        )
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def format_event(event):
+    """Return an event in the text/event-stream format"""
+    return (
+        f'event: {event["model"]}.{event["action"]}\n'
+        f'data: {json.dumps(event)}\n\n'
+    ).encode()
+
+
+async def event_stream(scope, receive, send):
+    """ASGI app streaming the authenticated user's change events"""
+    user = await sync_to_async(authenticate)(scope)
+    if user is None:
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': b'Unauthorized'})
+        return
+
+    queue = broker.subscribe(user.pk)
+    get_transport().start()
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'retry: 3000\n\n',
+            'more_body': True,
+        })
+        while not disconnected.done():
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                {getter, disconnected},
+                timeout=settings.EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not getter.done():
+                getter.cancel()
+                if not disconnected.done():
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b': keepalive\n\n',
+                        'more_body': True,
+                    })
+                continue
+            event = getter.result()
+            if event is OVERFLOW:
+                break
+            await send({
+                'type': 'http.response.body',
+                'body': format_event(event),
+                'more_body': True,
+            })
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(user.pk, queue)
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -0,0 +1,152 @@
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, \
+    Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Length of the geohashes stored on locations, cells of about 5 by 5 m
+PRECISION = 9
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Return the geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        if even:
+            bounds, coordinate = lng_range, longitude
+        else:
+            bounds, coordinate = lat_range, latitude
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the height and width in degrees of geohash cells"""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=16):
+    """Return the geohash prefixes of the cells around a circle.
+
+    Uses the longest prefixes for which at most max_cells cells cover the
+    circle's bounding box. Returns None when only the whole world does.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    south = max(latitude - lat_delta, -90)
+    north = min(latitude + lat_delta, 90)
+    widest = max(abs(south), abs(north))
+    if widest >= 90:
+        lng_delta = 180
+    else:
+        lng_delta = min(
+            lat_delta / math.cos(math.radians(widest)), 180
+        )
+
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(
+            math.floor((south + 90) / height),
+            min(math.floor((north + 90) / height), round(180 / height) - 1)
+            + 1
+        )
+        columns_total = round(360 / width)
+        first = math.floor((longitude - lng_delta + 180) / width)
+        last = math.floor((longitude + lng_delta + 180) / width)
+        columns = range(first, min(last, first + columns_total - 1) + 1)
+        if len(rows) * len(columns) > max_cells:
+            continue
+        return sorted({
+            encode(
+                (row + 0.5) * height - 90,
+                ((column % columns_total) + 0.5) * width - 180,
+                precision
+            )
+            for row in rows for column in columns
+        })
+    return None
+
+
+def prefix_range(cell):
+    """Return the bounds of the geohashes starting with a prefix.
+
+    Range conditions, unlike LIKE, can use a plain btree index whatever the
+    collation of the database.
+    """
+    chars = list(cell)
+    while chars and chars[-1] == BASE32[-1]:
+        chars.pop()
+    if not chars:
+        return cell, None
+    chars[-1] = BASE32[BASE32.index(chars[-1]) + 1]
+    return cell, ''.join(chars)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Return the great circle distance between two points"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+def distance_expression(latitude, longitude, prefix=''):
+    """Return the query expression of the distance in km to a point"""
+    lat = Radians(F(f'{prefix}latitude'))
+    lng = Radians(F(f'{prefix}longitude'))
+    origin_lat = math.radians(latitude)
+    origin_lng = math.radians(longitude)
+    a = Power(Sin((lat - origin_lat) / 2), 2) + \
+        math.cos(origin_lat) * Cos(lat) * \
+        Power(Sin((lng - origin_lng) / 2), 2)
+    return (2 * EARTH_RADIUS_KM) * ASin(
+        Least(Sqrt(a), 1.0), output_field=FloatField()
+    )
+
+
+def filter_near(queryset, latitude, longitude, radius_km, prefix=''):
+    """Filter rows to those within radius_km of a point, nearest first.
+
+    Candidates are first pruned to the geohash cells around the circle,
+    through the (user, geohash) index, then checked by exact distance.
+    Rows are annotated with their distance in km.
+    """
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells is None:
+        queryset = queryset.filter(**{f'{prefix}geohash__gt': ''})
+    else:
+        in_cells = Q()
+        for cell in cells:
+            start, end = prefix_range(cell)
+            condition = Q(**{f'{prefix}geohash__gte': start})
+            if end is not None:
+                condition &= Q(**{f'{prefix}geohash__lt': end})
+            in_cells |= condition
+        queryset = queryset.filter(in_cells)
+    return queryset \
+        .annotate(distance=distance_expression(latitude, longitude, prefix)) \
+        .filter(distance__lte=radius_km) \
+        .order_by('distance')
@@ -0,0 +1,49 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+
+class ThreadPoolASGIHandler(ASGIHandler):
+    """ASGI handler running the synchronous views on a bounded thread pool.
+
+    Request bodies are received and responses sent on the event loop, so
+    slow clients and uploads do not hold a thread. Only the middleware and
+    view, which talk to the database, run on one of ASGI_THREADS threads.
+    Django's own handler runs every synchronous view on a single thread.
+    """
+
+    def __init__(self):
+        # Skip ASGIHandler.__init__, which loads an async middleware chain
+        super(ASGIHandler, self).__init__()
+        self.load_middleware(is_async=False)
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi'
+        )
+
+    async def get_response_async(self, request):
+        loop = asyncio.get_running_loop()
+        # Each request gets its own copy of the context variables
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, context.run, self._get_response_in_thread, request
+        )
+
+    def _get_response_in_thread(self, request):
+        # request_started and request_finished are sent from another
+        # thread, so expire this thread's connections here.
+        close_old_connections()
+        try:
+            return self.get_response(request)
+        finally:
+            close_old_connections()
+
+
+def get_asgi_application():
+    """Return the thread pool ASGI handler, setting up Django first"""
+    django.setup(set_prefix=False)
+    return ThreadPoolASGIHandler()
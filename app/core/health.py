@@ -0,0 +1,48 @@
+import threading
+import time
+
+from django.db import DatabaseError, connections
+
+
+def check_database(alias='default'):
+    """Run a trivial query, raising OperationalError if the db is down"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+class CachedCheck:
+    """Cache the result of a health check for a number of seconds.
+
+    Only one thread runs the check when the result expires, the others
+    keep using the previous result meanwhile.
+    """
+
+    def __init__(self, check):
+        self.check = check
+        self._result = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, max_age):
+        now = time.monotonic()
+        if self._result is not None and now < self._expires:
+            return self._result
+        if not self._lock.acquire(blocking=self._result is None):
+            return self._result
+        try:
+            try:
+                self.check()
+                self._result = True
+            except DatabaseError:
+                self._result = False
+            self._expires = time.monotonic() + max_age
+            return self._result
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._result = None
+        self._expires = 0
+
+
+database_ready = CachedCheck(check_database)
@@ -0,0 +1,174 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from core.models import IdempotencyKey
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is in progress.'
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def request_scope(request):
+    """Return who the keys of a request belong to, and for which URL"""
+    if request.user.is_authenticated:
+        owner = f'user:{request.user.pk}'
+    else:
+        owner = f'ip:{request.META.get("REMOTE_ADDR")}'
+    return f'{owner}:{request.path}'
+
+
+def request_hash(request):
+    """Return a hash of the request body, to spot reused keys"""
+    # Multipart boundaries differ between retries, so hash the fields
+    if (request.content_type or '').startswith('multipart/'):
+        body = repr(sorted(request.data.lists())).encode()
+    else:
+        try:
+            body = request.body
+        except RawPostDataException:
+            body = repr(sorted(request.data.items())).encode()
+    return hashlib.sha256(request.method.encode() + b' ' + body).hexdigest()
+
+
+def lease_end():
+    return timezone.now() + timedelta(
+        seconds=settings.IDEMPOTENCY_LEASE_SECONDS
+    )
+
+
+def take_over(stored):
+    """Take over the key of a request whose lease ran out, if still so"""
+    lease = lease_end()
+    taken = IdempotencyKey.objects.filter(
+        pk=stored.pk, status_code=None, leased_until=stored.leased_until
+    ).update(leased_until=lease)
+    if not taken:
+        return None
+    stored.leased_until = lease
+    return stored
+
+
+def owned(record):
+    """Return the key of a request, unless another one took it over"""
+    return IdempotencyKey.objects.filter(
+        pk=record.pk, status_code=None, leased_until=record.leased_until
+    )
+
+
+def claim(scope, key, digest):
+    """Claim a key, returning (record, None) or (None, stored record).
+
+    Concurrent duplicates wait up to IDEMPOTENCY_WAIT_SECONDS for the
+    first request to finish, and take over its key once its lease has
+    run out.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, key=key, request_hash=digest,
+                    leased_until=lease_end()
+                ), None
+        except IntegrityError:
+            pass
+
+        stored = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if stored is None:
+            continue
+        ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        if stored.created_at < timezone.now() - ttl:
+            stored.delete()
+            continue
+        if stored.request_hash != digest:
+            raise IdempotencyKeyReused()
+        if stored.status_code is not None:
+            return None, stored
+        if stored.leased_until is None or \
+                stored.leased_until <= timezone.now():
+            record = take_over(stored)
+            if record is not None:
+                return record, None
+            continue
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+class IdempotentCreateMixin:
+    """Replay the stored response of creates sent again with the same
+    Idempotency-Key header.
+
+    Responses are kept for IDEMPOTENCY_KEY_TTL seconds. Server errors are
+    not stored, so those requests can be retried. A request running past
+    IDEMPOTENCY_LEASE_SECONDS loses its key to the next retry.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError(
+                {'Idempotency-Key': 'Must be at most 255 characters.'}
+            )
+
+        record, stored = claim(
+            request_scope(request), key, request_hash(request)
+        )
+        if stored is not None:
+            response = HttpResponse(
+                bytes(stored.body),
+                status=stored.status_code,
+                content_type=stored.content_type
+            )
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        request.idempotency_record = record
+        try:
+            return super().create(request, *args, **kwargs)
+        except APIException:
+            raise
+        except Exception:
+            owned(record).delete()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        record = getattr(request, 'idempotency_record', None)
+        if record is not None:
+            request.idempotency_record = None
+            # A request outliving its lease leaves the key to the retry
+            # that took it over
+            if response.status_code >= 500:
+                owned(record).delete()
+            else:
+                response.render()
+                owned(record).update(
+                    status_code=response.status_code,
+                    content_type=response.get('Content-Type', ''),
+                    body=response.content
+                )
+        return response
@@ -0,0 +1,150 @@
+import hashlib
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections, transaction
+
+
+class QueryRecorder:
+    """Execute wrapper that counts queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryCapture:
+    """Execute wrapper that keeps every statement with its timing"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'duration': time.perf_counter() - start,
+            })
+
+    def slowest(self, count):
+        """Return the slowest SELECT statements, slowest first"""
+        selects = [
+            query for query in self.queries
+            if not query['many'] and
+            query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        selects.sort(key=lambda query: query['duration'], reverse=True)
+        return selects[:count]
+
+
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Return a normalized statement and a short hash identifying it.
+
+    Literals become ? and IN lists of any length collapse to IN (...), so
+    the same query with different filters shares one fingerprint.
+    """
+    normalized = SPACE_RE.sub(' ', sql).strip()
+    normalized = IN_LIST_RE.sub('IN (...)', normalized)
+    normalized = STRING_RE.sub('?', normalized)
+    normalized = NUMBER_RE.sub('?', normalized)
+    normalized = normalized.replace('%s', '?')
+    digest = hashlib.md5(normalized.encode()).hexdigest()[:12]
+    return digest, normalized
+
+
+class SlowQueryStats:
+    """Thread safe per fingerprint aggregates of slow statements"""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, digest, normalized, duration, view):
+        """Record a slow statement, returning True if it is new"""
+        with self._lock:
+            stats = self._stats.get(digest)
+            if stats is None:
+                self._stats[digest] = {
+                    'fingerprint': digest,
+                    'sql': normalized,
+                    'count': 1,
+                    'total_ms': duration * 1000,
+                    'max_ms': duration * 1000,
+                    'views': [view],
+                    'plan': None,
+                }
+                return True
+            stats['count'] += 1
+            stats['total_ms'] += duration * 1000
+            stats['max_ms'] = max(stats['max_ms'], duration * 1000)
+            if view not in stats['views']:
+                stats['views'].append(view)
+            return False
+
+    def set_plan(self, digest, plan):
+        with self._lock:
+            self._stats[digest]['plan'] = plan
+
+    def summary(self):
+        """Return the aggregates, most total time first"""
+        with self._lock:
+            stats = [dict(item, views=list(item['views']))
+                     for item in self._stats.values()]
+        return sorted(stats, key=lambda item: item['total_ms'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+slow_queries = SlowQueryStats()
+
+
+def explain(alias, sql, params, analyze=False):
+    """Return the query plan of a statement as text.
+
+    ANALYZE runs the statement, so it is only used on PostgreSQL and inside
+    a transaction that is always rolled back.
+    """
+    connection = connections[alias]
+    options = {}
+    if analyze and connection.vendor == 'postgresql':
+        options['analyze'] = True
+    prefix = connection.ops.explain_query_prefix(**options)
+    with transaction.atomic(using=alias):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.fetchall()
+        transaction.set_rollback(True, using=alias)
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    """Install an execute wrapper on every configured database connection"""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield wrapper
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.handlers import ThreadPoolASGIHandler
+
+
+BENCH_EMAIL = 'bench-asgi@example.com'
+
+
+class SlowInput:
+    """wsgi.input of a client sending its body in slow chunks"""
+
+    def __init__(self, body, chunks, delay):
+        self.body = body
+        self.chunks = chunks
+        self.delay = delay
+
+    def read(self, size=-1):
+        for _ in range(self.chunks):
+            time.sleep(self.delay)
+        body, self.body = self.body, b''
+        return body
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+class Command(BaseCommand):
+    """Django command to compare WSGI and ASGI serving of slow clients.
+
+    Every client uploads a small tag in --chunks pieces, waiting --delay
+    seconds before each. Both servers get --threads threads to run views.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=64)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--chunks', type=int, default=5)
+        parser.add_argument('--delay', type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        user = get_user_model().objects.create_user(BENCH_EMAIL, 'password')
+        self.key = Token.objects.create(user=user).key
+        self.url = reverse('experience:tag-list')
+        try:
+            with override_settings(EXPERIENCE_THROTTLE_WRITE_RATE=None,
+                                   ASGI_THREADS=options['threads']):
+                self._report('WSGI', self._run_wsgi(options))
+                self._report('ASGI', self._run_asgi(options))
+        finally:
+            user.delete()
+
+    def _body(self, index):
+        return json.dumps({'name': f'bench {index}'}).encode()
+
+    def _run_wsgi(self, options):
+        handler = WSGIHandler()
+
+        def client(index):
+            body = self._body(index)
+            environ = {
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': self.url,
+                'CONTENT_TYPE': 'application/json',
+                'CONTENT_LENGTH': str(len(body)),
+                'HTTP_HOST': 'localhost',
+                'HTTP_AUTHORIZATION': f'Token {self.key}',
+                'wsgi.input': SlowInput(
+                    body, options['chunks'], options['delay']
+                ),
+            }
+            setup_testing_defaults(environ)
+            statuses = []
+            b''.join(handler(environ, lambda s, h: statuses.append(s)))
+            connections.close_all()
+            # Clients all connect at the start, so queueing counts too
+            return statuses[0][:3], time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            results = list(executor.map(client, range(options['clients'])))
+        return results, time.perf_counter() - start
+
+    def _run_asgi(self, options):
+        handler = ThreadPoolASGIHandler()
+
+        async def client(index):
+            body = self._body(index)
+            size = -(-len(body) // options['chunks'])
+            pieces = [body[i:i + size] for i in range(0, len(body), size)]
+            scope = {
+                'type': 'http',
+                'method': 'POST',
+                'path': self.url,
+                'query_string': b'',
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'authorization', f'Token {self.key}'.encode()),
+                ],
+            }
+            messages = []
+
+            async def receive():
+                await asyncio.sleep(options['delay'])
+                piece = pieces.pop(0)
+                return {
+                    'type': 'http.request',
+                    'body': piece,
+                    'more_body': bool(pieces),
+                }
+
+            async def send(message):
+                messages.append(message)
+
+            await handler(scope, receive, send)
+            return str(messages[0]['status']), time.perf_counter() - start
+
+        async def main():
+            return await asyncio.gather(
+                *(client(index) for index in range(options['clients']))
+            )
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+        handler.executor.shutdown()
+        return results, elapsed
+
+    def _report(self, name, run):
+        results, elapsed = run
+        latencies = sorted(latency for _, latency in results)
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        self.stdout.write(
+            f'{name}: {len(results) / elapsed:.1f} req/s, '
+            f'p50 {statistics.median(latencies) * 1000:.0f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f}ms, '
+            f'statuses {statuses}'
+        )
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import geo
+from core.deletion import delete_users
+from core.models import Location
+
+
+BENCH_EMAIL = 'bench-geo@example.com'
+
+# Roughly the contiguous United States
+BOX = (25.0, 49.0, -125.0, -67.0)
+
+
+class Command(BaseCommand):
+    """Django command to time nearby searches over many locations.
+
+    Compares the geohash pruned search with a scan computing the distance
+    of every location, on random points of a region. Timings are those of
+    the default database, so only runs against PostgreSQL tell how the
+    search behaves in production.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--radius', type=float, default=10)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        user = get_user_model().objects.create_user(BENCH_EMAIL, 'password')
+        try:
+            self._populate(user, options)
+            points = [self._point() for _ in range(options['queries'])]
+            locations = Location.objects.filter(user=user)
+            radius = options['radius']
+
+            indexed = self._run(points, lambda lat, lng: geo.filter_near(
+                locations, lat, lng, radius
+            ))
+            scanned = self._run(points, lambda lat, lng: locations.annotate(
+                distance=geo.distance_expression(lat, lng)
+            ).filter(distance__lte=radius).order_by('distance'))
+
+            self._report('geohash', indexed)
+            self._report('scan', scanned)
+            if [ids for ids, _ in indexed] != [ids for ids, _ in scanned]:
+                self.stderr.write('Results differ between the searches')
+        finally:
+            self.stdout.write('Deleting the bench locations')
+            delete_users([user.id])
+
+    def _point(self):
+        south, north, west, east = BOX
+        return (
+            self.random.uniform(south, north),
+            self.random.uniform(west, east),
+        )
+
+    def _populate(self, user, options):
+        total = options['locations']
+        start = time.perf_counter()
+        for offset in range(0, total, options['batch_size']):
+            rows = []
+            for index in range(offset,
+                               min(offset + options['batch_size'], total)):
+                latitude, longitude = self._point()
+                rows.append(Location(
+                    user=user, name=f'Bench {index}', description='',
+                    latitude=latitude, longitude=longitude,
+                    geohash=geo.encode(latitude, longitude)
+                ))
+            Location.objects.bulk_create(rows)
+        # Without statistics the planner may prefer the user_id index
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Location._meta.db_table}')
+        self.stdout.write(
+            f'Created {total} locations in '
+            f'{time.perf_counter() - start:.1f}s'
+        )
+
+    def _run(self, points, search):
+        results = []
+        for latitude, longitude in points:
+            start = time.perf_counter()
+            ids = list(
+                search(latitude, longitude).values_list('id', flat=True)
+            )
+            results.append((ids, time.perf_counter() - start))
+        return results
+
+    def _report(self, name, results):
+        latencies = sorted(latency for _, latency in results)
+        found = statistics.mean(len(ids) for ids, _ in results)
+        self.stdout.write(
+            f'{name}: p50 {statistics.median(latencies) * 1000:.1f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms, '
+            f'{found:.1f} locations found on average'
+        )
@@ -0,0 +1,50 @@
+import logging
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+
+BENCH_EMAIL = 'bench-middleware@example.com'
+
+
+class Command(BaseCommand):
+    """Django command to compare the full and lean API middleware stacks"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        user = get_user_model().objects.create_user(BENCH_EMAIL, 'password')
+        token = Token.objects.create(user=user)
+        try:
+            for name, prefixes in (('full stack', ()),
+                                   ('lean api', ('/api/',))):
+                with override_settings(API_LEAN_PREFIXES=prefixes):
+                    self._requests(name, token.key, options['requests'])
+        finally:
+            user.delete()
+
+    def _requests(self, name, key, count):
+        client = Client(
+            HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {key}'
+        )
+        url = reverse('user:me')
+        client.get(url)
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            client.get(url)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        self.stdout.write(
+            f'{name}: p50 {statistics.median(latencies) * 1000:.2f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f}ms '
+            f'per request'
+        )
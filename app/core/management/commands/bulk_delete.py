@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.deletion import delete_locations, delete_users
+
+
+class Command(BaseCommand):
+    """Django command to delete users or locations with everything they own.
+
+    Rows are deleted in batches without loading them, and image files are
+    queued for purge_deleted_files.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+', default=[],
+            help='IDs of the users to delete'
+        )
+        parser.add_argument(
+            '--locations', type=int, nargs='+', default=[],
+            help='IDs of the locations to delete'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per transaction, BULK_DELETE_BATCH_SIZE by default'
+        )
+
+    def handle(self, *args, **options):
+        if not options['users'] and not options['locations']:
+            raise CommandError('Pass --users or --locations')
+
+        counts = {}
+        if options['locations']:
+            counts.update(delete_locations(
+                options['locations'], options['batch_size'], self.progress
+            ))
+        if options['users']:
+            for name, count in delete_users(
+                options['users'], options['batch_size'], self.progress
+            ).items():
+                counts[name] = counts.get(name, 0) + count
+
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted ' + ', '.join(f'{n} {k}' for k, n in counts.items())
+        ))
+
+    def progress(self, model_name, count):
+        self.stdout.write(f'  {model_name}: {count} deleted')
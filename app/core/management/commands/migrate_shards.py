@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.db.sharding import reset_sequences
+
+
+class Command(BaseCommand):
+    """Django command to migrate every shard database"""
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARD_DATABASES:
+            self.stdout.write(f'Migrating {alias}...')
+            call_command(
+                'migrate', database=alias, interactive=False,
+                verbosity=options['verbosity']
+            )
+            if connections[alias].vendor == 'postgresql':
+                reset_sequences(alias)
+
+        self.stdout.write(self.style.SUCCESS('Shards migrated'))
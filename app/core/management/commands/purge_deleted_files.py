@@ -0,0 +1,41 @@
+import logging
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from core.models import PendingFileDeletion
+
+
+logger = logging.getLogger('core.deletion')
+
+
+class Command(BaseCommand):
+    """Django command to remove the files queued by bulk deletions"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        removed = failed = 0
+        last_id = 0
+        while True:
+            pending = list(
+                PendingFileDeletion.objects.filter(id__gt=last_id)
+                .order_by('id')[:options['batch_size']]
+            )
+            if not pending:
+                break
+            last_id = pending[-1].id
+            done = []
+            for item in pending:
+                try:
+                    default_storage.delete(item.name)
+                except OSError:
+                    # Left queued for the next run
+                    logger.exception('Could not delete %s', item.name)
+                    failed += 1
+                else:
+                    done.append(item.id)
+            PendingFileDeletion.objects.filter(id__in=done).delete()
+            removed += len(done)
+
+        self.stdout.write(f'{removed} files deleted, {failed} failed')
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to delete tombstones older than SYNC_TOMBSTONE_DAYS"""
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        for alias in settings.SHARD_DATABASES or ['default']:
+            count, _ = Tombstone.objects.using(alias) \
+                .filter(deleted_at__lt=cutoff).delete()
+            self.stdout.write(f'{alias}: {count} tombstones deleted')
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from core.db.sharding import move_user
+from core.models import Experience, Location, Tag, UserShard
+
+
+class Command(BaseCommand):
+    """Django command to move users between shards.
+
+    Users whose rows are still on the default database, from before
+    sharding was enabled, are moved to the emptiest shards first. Writes
+    of each user are rejected with a 503 while they are moved.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Move only this user')
+        parser.add_argument('--to', help='Shard to move the user to')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print the moves'
+        )
+
+    def handle(self, *args, **options):
+        shards = settings.SHARD_DATABASES
+        if not shards:
+            raise CommandError('Sharding is not configured')
+
+        if options['user'] is not None:
+            if options['to'] not in shards:
+                raise CommandError(f'--to must be one of {", ".join(shards)}')
+            moves = [(options['user'], options['to'])]
+        else:
+            moves = self.plan_moves(shards)
+
+        for user_id, target in moves:
+            self.stdout.write(f'User {user_id} -> {target}')
+            if not options['dry_run']:
+                moved = move_user(user_id, target)
+                self.stdout.write(
+                    '  ' + ', '.join(f'{n} {k}' for k, n in moved.items())
+                )
+
+        verb = 'to move' if options['dry_run'] else 'moved'
+        self.stdout.write(self.style.SUCCESS(f'{len(moves)} users {verb}'))
+
+    def plan_moves(self, shards):
+        """Return moves that even out the number of users per shard"""
+        counts = dict.fromkeys(shards, 0)
+        counts.update(
+            UserShard.objects.filter(alias__in=shards)
+            .values_list('alias').annotate(count=Count('user'))
+        )
+        moves = []
+        for user_id in self.default_users():
+            emptiest = min(shards, key=counts.get)
+            moves.append((user_id, emptiest))
+            counts[emptiest] += 1
+
+        target = -(-sum(counts.values()) // len(shards))
+        for alias in shards:
+            surplus = counts[alias] - target
+            if surplus <= 0:
+                continue
+            user_ids = UserShard.objects.filter(alias=alias) \
+                .order_by('-user_id') \
+                .values_list('user_id', flat=True)[:surplus]
+            for user_id in user_ids:
+                emptiest = min(shards, key=counts.get)
+                if counts[emptiest] >= target:
+                    break
+                moves.append((user_id, emptiest))
+                counts[alias] -= 1
+                counts[emptiest] += 1
+        return moves
+
+    def default_users(self):
+        """Return the users whose rows are on the default database"""
+        user_ids = set(
+            UserShard.objects.filter(alias='default')
+            .values_list('user_id', flat=True)
+        )
+        # Users not seen since sharding was enabled have no directory row
+        placed = UserShard.objects.values('user_id')
+        for model in (Experience, Tag, Location):
+            user_ids.update(
+                model._base_manager.using('default')
+                .exclude(user_id__in=placed)
+                .values_list('user_id', flat=True).distinct()
+            )
+        return sorted(user_ids)
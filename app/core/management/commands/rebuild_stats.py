@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.counters import rebuild_stats
+
+
+class Command(BaseCommand):
+    """Django command to recompute the experience totals of every user"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare with a full recompute, failing on mismatch'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in settings.SHARD_DATABASES or ['default']:
+            wrong = rebuild_stats(alias, fix=not options['check'])
+            total += wrong
+            self.stdout.write(f'{alias}: {wrong} users with wrong totals')
+
+        if options['check'] and total:
+            raise CommandError(f'{total} users have wrong totals')
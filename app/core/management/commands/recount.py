@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.counters import recount
+
+
+class Command(BaseCommand):
+    """Django command to repair the experience counts of tags and locations"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report wrong counts, failing if there are any'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in settings.SHARD_DATABASES or ['default']:
+            drifted = recount(alias, fix=not options['check'])
+            total += sum(drifted.values())
+            self.stdout.write(f'{alias}: ' + ', '.join(
+                f'{n} {k} counts wrong' for k, n in drifted.items()
+            ))
+
+        if options['check'] and total:
+            raise CommandError(f'{total} experience counts are wrong')
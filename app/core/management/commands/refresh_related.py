@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F, Q
+from core.models import RelatedIndex
+from core.related import refresh
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the related experience indexes that
+    writes have made stale.
+
+    Runs once, or every --interval seconds when given.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, checking for stale indexes this often'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stale = RelatedIndex.objects.filter(
+                Q(built_version__isnull=True) |
+                Q(built_version__lt=F('version'))
+            ).order_by('user_id').values_list('user_id', flat=True)
+            count = sum(refresh(user_id) is not None for user_id in stale)
+            if count or not options['interval']:
+                self.stdout.write(f'{count} related indexes refreshed')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+            close_old_connections()
@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing is imported beforehand
+WORKER_SCRIPT = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+environ = {'PATH_INFO': sys.argv[1], 'HTTP_HOST': sys.argv[2]}
+setup_testing_defaults(environ)
+statuses = []
+b''.join(application(environ, lambda status, headers: statuses.append(status)))
+done = time.perf_counter()
+print(json.dumps({
+    'setup': setup - start,
+    'application': loaded - setup,
+    'first_request': done - loaded,
+    'status': statuses[0],
+}))
+'''
+
+
+def parse_importtime(output):
+    """Return (module, self seconds, cumulative seconds, depth) tuples"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((
+            name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth
+        ))
+    return modules
+
+
+class Command(BaseCommand):
+    """Django command to report what a fresh worker imports and how long
+    it takes to answer its first request"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/user/me/')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Fail if the first request misses STARTUP_TARGET_MS'
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', WORKER_SCRIPT,
+             options['url'], options['host']],
+            cwd=settings.BASE_DIR, env=os.environ.copy(),
+            capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(result.stderr)
+
+        total = timings['setup'] + timings['application'] + \
+            timings['first_request']
+        self.stdout.write(
+            f'django.setup()      {timings["setup"] * 1000:8.1f}ms\n'
+            f'WSGI application    {timings["application"] * 1000:8.1f}ms\n'
+            f'first request       {timings["first_request"] * 1000:8.1f}ms '
+            f'({timings["status"]})\n'
+            f'time to first byte  {total * 1000:8.1f}ms, '
+            f'{len(modules)} modules imported'
+        )
+
+        packages = {}
+        for name, own, _, _ in modules:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + own
+        self.stdout.write('\nSlowest packages:')
+        for package, seconds in sorted(
+            packages.items(), key=lambda item: item[1], reverse=True
+        )[:options['top']]:
+            self.stdout.write(f'  {seconds * 1000:8.1f}ms  {package}')
+
+        self.stdout.write('\nSlowest top level imports:')
+        top_level = [module for module in modules if module[3] == 0]
+        for name, _, cumulative, _ in sorted(
+            top_level, key=lambda module: module[2], reverse=True
+        )[:options['top']]:
+            self.stdout.write(f'  {cumulative * 1000:8.1f}ms  {name}')
+
+        target = settings.STARTUP_TARGET_MS
+        if options['check'] and total * 1000 > target:
+            raise CommandError(
+                f'First request took {total * 1000:.0f}ms, '
+                f'target is {target}ms'
+            )
@@ -1,21 +1,43 @@
 import time
-from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from core.health import check_database
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Give up after this many seconds'
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='Longest wait between two attempts'
+        )
+
+    def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
+        deadline = time.monotonic() + options['timeout']
+        delay = 0.25
 
-        while not db_conn:
-            try: 
-                db_conn = connections['default']
+        while True:
+            try:
+                check_database(options['database'])
+                break
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
-        
-        self.stdout.write(self.style.SUCCESS('Database available!'))
\ No newline at end of file
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {options["timeout"]:g} '
+                        f'seconds'
+                    )
+                delay = min(delay * 2, options['max_delay'], remaining)
+                self.stdout.write(
+                    f'Database unavailable, waiting {delay:g} seconds...'
+                )
+                time.sleep(delay)
+
+        self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,229 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from core.authentication import token_cache
+from core.db.pool import all_pools
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+
+class MetricsRegistry:
+    """Counters and histograms shared between the workers of a node.
+
+    Recording only touches in-process dicts. Every flush_interval seconds
+    the process writes its totals to a file in directory, and collect()
+    sums the files of every worker.
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def inc(self, name, labels, amount=1):
+        """Increment a counter"""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, labels, value, buckets):
+        """Record a value in a histogram"""
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * (len(buckets) + 1),
+                    'sum': 0,
+                }
+            histogram['counts'][bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+        self._maybe_flush()
+
+    def register_collector(self, collector, kind='counter'):
+        """Add a callable returning (name, labels, value) tuples.
+
+        kind is 'counter' or 'gauge'; gauges of every worker are summed.
+        """
+        self._collectors.append((collector, kind))
+
+    def snapshot(self):
+        """Return this process's metrics as JSON serializable data"""
+        with self._lock:
+            counters = [
+                [name, list(labels), value]
+                for (name, labels), value in self._counters.items()
+            ]
+            histograms = [
+                [name, list(labels), dict(histogram,
+                                          counts=list(histogram['counts']))]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        gauges = []
+        for collector, kind in self._collectors:
+            values = counters if kind == 'counter' else gauges
+            values.extend(
+                [name, list(labels), value]
+                for name, labels, value in collector()
+            )
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+        }
+
+    def flush(self):
+        """Write this process's metrics to its file in the directory"""
+        self._flushed = time.monotonic()
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """Return the metrics of every worker summed together"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            self.flush()
+            own = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        counters = {}
+        gauges = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for totals, field in ((counters, 'counters'),
+                                  (gauges, 'gauges')):
+                for name, labels, value in snapshot.get(field, []):
+                    key = (name, tuple(tuple(label) for label in labels))
+                    totals[key] = totals.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.setdefault(key, {
+                    'buckets': histogram['buckets'],
+                    'counts': [0] * len(histogram['counts']),
+                    'sum': 0,
+                })
+                merged['counts'] = [
+                    a + b
+                    for a, b in zip(merged['counts'], histogram['counts'])
+                ]
+                merged['sum'] += histogram['sum']
+        return counters, gauges, histograms
+
+    def render(self):
+        """Return the collected metrics in the Prometheus text format"""
+        counters, gauges, histograms = self.collect()
+        lines = []
+        typed = set()
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(values.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} {kind}')
+                    typed.add(name)
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            bounds = [str(b) for b in histogram['buckets']] + ['+Inf']
+            for bound, count in zip(bounds, histogram['counts']):
+                cumulative += count
+                bucket_labels = _format_labels(labels + (('le', bound),))
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(
+                f'{name}_sum{_format_labels(labels)} {histogram["sum"]}'
+            )
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """Forget every recorded value of this process"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def token_cache_counters():
+    """Report the token authentication cache hits and misses"""
+    stats = token_cache.stats()
+    return [
+        ('auth_token_cache_hits_total', (), stats['hits']),
+        ('auth_token_cache_misses_total', (), stats['misses']),
+    ]
+
+
+def pool_counters():
+    """Report the waits on every connection pool of this process"""
+    values = []
+    for key, pool in all_pools().items():
+        stats = pool.stats()
+        labels = (('alias', key[0]),)
+        values.append(('db_pool_waits_total', labels, stats['waits']))
+        values.append(
+            ('db_pool_wait_seconds_total', labels, stats['wait_seconds'])
+        )
+    return values
+
+
+def pool_gauges():
+    """Report the active and idle connections of every pool"""
+    values = []
+    for key, pool in all_pools().items():
+        stats = pool.stats()
+        labels = (('alias', key[0]),)
+        values.append(('db_pool_active_connections', labels, stats['active']))
+        values.append(('db_pool_idle_connections', labels, stats['idle']))
+    return values
+
+
+registry = MetricsRegistry(
+    directory=settings.METRICS_DIR,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL,
+)
+registry.register_collector(token_cache_counters)
+registry.register_collector(pool_counters)
+registry.register_collector(pool_gauges, kind='gauge')
@@ -0,0 +1,378 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication
+from core.db.routers import PRIMARY_PIN_COOKIE, primary_pins, \
+    use_replica
+from core.health import database_ready
+from core.instrumentation import QueryCapture, QueryRecorder, explain, \
+                                 fingerprint, slow_queries, wrap_connections
+from core.metrics import LATENCY_BUCKETS, SIZE_BUCKETS, registry
+
+
+logger = logging.getLogger('core.timing')
+slow_query_logger = logging.getLogger('core.slow_queries')
+
+
+class HealthCheckMiddleware:
+    """Answer liveness and readiness probes before any other middleware.
+
+    This must be the first middleware so probes skip sessions, CSRF,
+    messages and URL resolution. Readiness checks the database at most
+    once every HEALTH_CHECK_CACHE_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path_info
+        if path == settings.HEALTH_LIVENESS_PATH:
+            return HttpResponse('ok', content_type='text/plain')
+        if path == settings.HEALTH_READINESS_PATH:
+            if database_ready(settings.HEALTH_CHECK_CACHE_SECONDS):
+                return HttpResponse('ok', content_type='text/plain')
+            return HttpResponse(
+                'database unavailable', content_type='text/plain', status=503
+            )
+        return self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """Report db, view and render time for API requests.
+
+    The timings are sent back in a Server-Timing header and logged as a
+    JSON line. Requests over the query or latency budget are logged as
+    warnings.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        request.timings = {}
+        recorder = QueryRecorder()
+        with wrap_connections(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        if match is None or \
+                match.namespace not in settings.SERVER_TIMING_NAMESPACES:
+            return response
+
+        timings = {
+            'db': recorder.duration,
+            'view': request.timings.get('view', total),
+            'render': request.timings.get('render', 0.0),
+            'total': total,
+        }
+        entries = [f'{name};dur={duration * 1000:.1f}'
+                   for name, duration in timings.items()]
+        entries[0] += f';desc="{recorder.count} queries"'
+        response['Server-Timing'] = ', '.join(entries)
+        self._log(request, response, recorder.count, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        """Split the view time from the time spent rendering the response"""
+        now = time.perf_counter()
+        request.timings['view'] = now - request.timings['view_start']
+
+        def rendered(response):
+            request.timings['render'] = time.perf_counter() - now
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def _log(self, request, response, queries, timings):
+        over_budget = []
+        query_budget = settings.SERVER_TIMING_QUERY_BUDGET
+        latency_budget = settings.SERVER_TIMING_LATENCY_BUDGET
+        if query_budget and queries > query_budget:
+            over_budget.append('queries')
+        if latency_budget and timings['total'] * 1000 > latency_budget:
+            over_budget.append('latency')
+
+        line = json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': request.resolver_match.view_name,
+            'status': response.status_code,
+            'queries': queries,
+            **{f'{name}_ms': round(duration * 1000, 2)
+               for name, duration in timings.items()},
+            'over_budget': over_budget,
+        })
+        if over_budget:
+            logger.warning(line)
+        else:
+            logger.info(line)
+
+
+class MetricsMiddleware:
+    """Record per view request metrics for the /metrics endpoint"""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        recorder = QueryRecorder()
+        with wrap_connections(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        labels = (('view', view),)
+        registry.inc('http_requests_total', labels + (
+            ('method', request.method),
+            ('status', str(response.status_code)),
+        ))
+        registry.inc('db_queries_total', labels, recorder.count)
+        registry.observe(
+            'http_request_duration_seconds', labels, duration, LATENCY_BUCKETS
+        )
+        if not response.streaming:
+            registry.observe(
+                'http_response_size_bytes', labels, len(response.content),
+                SIZE_BUCKETS
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile a request on demand for staff users.
+
+    Sending an X-Profile header or a profile query parameter runs the
+    request under cProfile, captures every SQL statement and explains the
+    slowest ones. The report is saved under PROFILE_REPORT_DIR and its id
+    is returned in the X-Profile-Id header.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._requested(request) or not self._is_staff(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        capture = QueryCapture()
+        with wrap_connections(capture):
+            response = profiler.runcall(self.get_response, request)
+
+        report_id = str(uuid.uuid4())
+        self._save_report(report_id, request, profiler, capture)
+        response['X-Profile-Id'] = report_id
+        return response
+
+    def _requested(self, request):
+        if 'HTTP_X_PROFILE' in request.META:
+            return True
+        # Only parse the query string when it could contain the flag
+        return 'profile' in request.META.get('QUERY_STRING', '') and \
+            'profile' in request.GET
+
+    def _is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                result = CachedTokenAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return False
+            user = result[0] if result else None
+        return user is not None and user.is_staff
+
+    def _save_report(self, report_id, request, profiler, capture):
+        os.makedirs(settings.PROFILE_REPORT_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_REPORT_DIR, report_id)
+        profiler.dump_stats(f'{path}.prof')
+
+        out = io.StringIO()
+        out.write(f'{request.method} {request.get_full_path()}\n\n')
+        pstats.Stats(profiler, stream=out).sort_stats(
+            'cumulative'
+        ).print_stats(50)
+
+        total = sum(query['duration'] for query in capture.queries)
+        out.write(
+            f'{len(capture.queries)} queries in {total * 1000:.1f}ms\n\n'
+        )
+        for query in capture.queries:
+            out.write(
+                f'[{query["duration"] * 1000:.2f}ms] {query["sql"]} '
+                f'{query["params"]}\n'
+            )
+
+        out.write('\nSlowest queries\n')
+        for query in capture.slowest(settings.PROFILE_EXPLAIN_COUNT):
+            out.write(f'\n{query["sql"]}\n')
+            try:
+                out.write(explain(
+                    query['alias'], query['sql'], query['params'],
+                    analyze=True
+                ) + '\n')
+            except Exception as exc:
+                out.write(f'EXPLAIN failed: {exc}\n')
+
+        with open(f'{path}.txt', 'w') as f:
+            f.write(out.getvalue())
+
+
+class SlowQueryMiddleware:
+    """Log statements slower than SLOW_QUERY_THRESHOLD_MS.
+
+    Each slow statement is logged with its view, user and fingerprint and
+    aggregated per fingerprint in slow_queries. The first time a
+    fingerprint is seen its plan is attached when SLOW_QUERY_EXPLAIN is
+    set; explaining waits until the response is ready so it never runs
+    inside the view's own queries.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        capture = QueryCapture()
+        with wrap_connections(capture):
+            response = self.get_response(request)
+
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        slow = [query for query in capture.queries
+                if query['duration'] >= threshold]
+        for query in slow:
+            self._record(request, query)
+        return response
+
+    def _record(self, request, query):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        user = getattr(request, 'user', None)
+        user_id = user.pk if user is not None and user.is_authenticated \
+            else None
+        digest, normalized = fingerprint(query['sql'])
+
+        slow_query_logger.warning(json.dumps({
+            'fingerprint': digest,
+            'duration_ms': round(query['duration'] * 1000, 2),
+            'view': view,
+            'user': user_id,
+            'sql': normalized,
+        }))
+
+        is_new = slow_queries.add(digest, normalized, query['duration'], view)
+        if is_new and settings.SLOW_QUERY_EXPLAIN and not query['many']:
+            try:
+                plan = explain(query['alias'], query['sql'], query['params'])
+            except Exception as exc:
+                plan = f'EXPLAIN failed: {exc}'
+            slow_queries.set_plan(digest, plan)
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe requests read from replicas, with read-your-writes.
+
+    After an unsafe request the client, identified by its token or
+    address, reads from the primary for DB_REPLICA_PIN_SECONDS.
+    The pin is kept in a shared cache and, for clients keeping cookies,
+    in a cookie, so it holds whichever worker serves the next request.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DB_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = primary_pins.client_key(request)
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        pinned = PRIMARY_PIN_COOKIE in request.COOKIES or \
+            primary_pins.is_pinned(key)
+        token = use_replica.set(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if not safe:
+            seconds = settings.DB_REPLICA_PIN_SECONDS
+            primary_pins.pin(key, seconds)
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=seconds, httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+
+def is_lean_request(request):
+    """Return True for API requests that can skip the browser middleware.
+
+    These are requests under API_LEAN_PREFIXES without a session cookie;
+    staff browsing the API with an admin session keep the full stack.
+    """
+    lean = getattr(request, '_lean', None)
+    if lean is None:
+        lean = request._lean = \
+            request.path_info.startswith(settings.API_LEAN_PREFIXES) and \
+            settings.SESSION_COOKIE_NAME not in request.COOKIES
+    return lean
+
+
+class ApiBypassMixin:
+    """Skip a middleware for lean API requests"""
+
+    def __call__(self, request):
+        if is_lean_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class ApiSessionMiddleware(ApiBypassMixin, SessionMiddleware):
+    pass
+
+
+class ApiAuthenticationMiddleware(ApiBypassMixin, AuthenticationMiddleware):
+    pass
+
+
+class ApiMessageMiddleware(ApiBypassMixin, MessageMiddleware):
+    pass
+
+
+class ApiCsrfViewMiddleware(ApiBypassMixin, CsrfViewMiddleware):
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        # The handler calls process_view directly, outside of __call__
+        if is_lean_request(request):
+            return None
+        return super().process_view(
+            request, callback, callback_args, callback_kwargs
+        )
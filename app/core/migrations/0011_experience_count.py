@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_experiences(apps, schema_editor):
+    Experience = apps.get_model('core', 'Experience')
+    Location = apps.get_model('core', 'Location')
+    Tag = apps.get_model('core', 'Tag')
+    alias = schema_editor.connection.alias
+    experiences = Experience.objects.using(alias).filter(
+        location=OuterRef('pk')
+    ).order_by().values('location').annotate(n=Count('*')).values('n')
+    Location.objects.using(alias).update(
+        experience_count=Coalesce(Subquery(experiences), 0)
+    )
+    through = Experience.tags.through
+    assignments = through.objects.using(alias).filter(
+        tag=OuterRef('pk')
+    ).order_by().values('tag').annotate(n=Count('*')).values('n')
+    Tag.objects.using(alias).update(
+        experience_count=Coalesce(Subquery(assignments), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_pendingfiledeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='experience_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='experience_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['user', 'experience_count'], name='core_locati_user_id_154ebf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'experience_count'], name='core_tag_user_id_8949ed_idx'),
+        ),
+        migrations.RunPython(count_experiences, migrations.RunPython.noop),
+    ]
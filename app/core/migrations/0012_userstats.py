@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def build_stats(apps, schema_editor):
+    Experience = apps.get_model('core', 'Experience')
+    UserStats = apps.get_model('core', 'UserStats')
+    alias = schema_editor.connection.alias
+    totals = Experience.objects.using(alias).order_by().values('user') \
+        .annotate(
+            count=Count('id'),
+            price=Sum('price'),
+            minutes=Sum('time_minutes')
+        )
+    UserStats.objects.using(alias).bulk_create([
+        UserStats(
+            user_id=row['user'],
+            experience_count=row['count'],
+            total_price=row['price'],
+            total_minutes=row['minutes']
+        )
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_experience_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('experience_count', models.PositiveIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_minutes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:19
+
+from django.db import migrations, models
+
+
+def fill_name_lower(apps, schema_editor):
+    # Lowercased in Python like Tag.save(), SQLite's LOWER is ASCII only
+    alias = schema_editor.connection.alias
+    for name in ('Tag', 'Location'):
+        model = apps.get_model('core', name)
+        rows = []
+        for obj in model.objects.using(alias).only('name').iterator():
+            obj.name_lower = obj.name.lower()[:255]
+            rows.append(obj)
+        model.objects.using(alias).bulk_update(
+            rows, ['name_lower'], batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_location_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='name_lower',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='name_lower',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_name_lower, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['user', 'name_lower'], name='core_location_name_prefix_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name_lower'], name='core_tag_name_prefix_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+    ]
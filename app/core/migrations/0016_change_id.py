@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:37
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_usershard_moving'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experience',
+            name='change_id',
+            field=core.models.ChangeIdField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='change_id',
+            field=core.models.ChangeIdField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='change_id',
+            field=core.models.ChangeIdField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='change_id',
+            field=core.models.ChangeIdField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='experience',
+            index=models.Index(fields=['user', 'change_id'], name='core_experi_user_id_b043e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['user', 'change_id'], name='core_locati_user_id_c4f90e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'change_id'], name='core_tag_user_id_c719fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'model', 'change_id'], name='core_tombst_user_id_132147_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_change_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='leased_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
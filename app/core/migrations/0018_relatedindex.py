@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_idempotencykey_leased_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('built_version', models.PositiveBigIntegerField(null=True)),
+                ('horizon', models.BigIntegerField(default=0)),
+                ('data', models.BinaryField(default=b'')),
+            ],
+        ),
+    ]
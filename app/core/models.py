@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from core import geo
 import os
+import time
 import uuid
 
 
@@ -14,7 +17,46 @@ def experience_image_file_path(instance, filename):
     return os.path.join('uploads/experience/', filename)
 
 
-class UserManager(BaseUserManager):
+class ChangeId(models.Func):
+    """Position of the writing transaction for delta sync.
+
+    On PostgreSQL this is the transaction ID, so sync_horizon() can tell
+    which changes may still be uncommitted. Other databases, which only
+    run one write transaction at a time, use the clock in microseconds.
+    """
+    output_field = models.BigIntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return '%s', [time.time_ns() // 1000]
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return 'txid_current()', []
+
+
+class ChangeIdField(models.BigIntegerField):
+    """Set to the ChangeId of the transaction writing the row"""
+
+    def pre_save(self, model_instance, add):
+        return ChangeId()
+
+
+def lower_name(name):
+    """Return the form of a name used for prefix searches"""
+    return name.lower()[:255]
+
+
+class UserQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        """Update users, dropping their cached tokens like save() does"""
+        from core.authentication import invalidate_users
+        ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        invalidate_users(ids)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
 
     def create_user(self, email, password=None, **kwargs):
         """Creates and saves a new user"""
@@ -52,27 +94,104 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Tag(models.Model):
     """Tag to be used for an experience"""
     name = models.CharField(max_length=255)
+    # Lowercase name, indexed for prefix searches
+    name_lower = models.CharField(
+        max_length=255, blank=True, editable=False
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # Maintained by core.counters
+    experience_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    change_id = ChangeIdField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'change_id']),
+            models.Index(fields=['user', 'experience_count']),
+            # Pattern ops so PostgreSQL can use it for LIKE 'prefix%'
+            models.Index(
+                fields=['user', 'name_lower'],
+                name='core_tag_name_prefix_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Keep the lowercase name in step with the name"""
+        self.name_lower = lower_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'name_lower', 'change_id'
+            }
+        super().save(*args, **kwargs)
+
 class Location(models.Model):
     """Location associated with one or more experiences"""
     name = models.CharField(max_length=255)
+    # Lowercase name, indexed for prefix searches
+    name_lower = models.CharField(
+        max_length=255, blank=True, editable=False
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
     description = models.TextField()
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Geohash of the coordinates, indexed for nearby searches
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+    # Maintained by core.counters
+    experience_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    change_id = ChangeIdField(default=0, editable=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'change_id']),
+            models.Index(fields=['user', 'experience_count']),
+            models.Index(fields=['user', 'geohash']),
+            models.Index(
+                fields=['user', 'name_lower'],
+                name='core_location_name_prefix_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Keep the geohash and lowercase name in step"""
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        self.name_lower = lower_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'geohash', 'name_lower', 'change_id'
+            }
+        super().save(*args, **kwargs)
+
 class Experience(models.Model):
     """Experience created by a user"""
     user = models.ForeignKey(
@@ -86,6 +205,133 @@ class Experience(models.Model):
     location = models.ForeignKey('Location', on_delete=models.CASCADE)
     image = models.ImageField(null=True, upload_to=experience_image_file_path)
     tags = models.ManyToManyField('Tag')
+    updated_at = models.DateTimeField(auto_now=True)
+    change_id = ChangeIdField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', 'change_id']),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        """Record every save for delta sync.
+
+        Saves run in a transaction, so core.counters can lock the stored
+        row while counting the difference.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'change_id'}
+        using = kwargs.get('using') or \
+            router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class UserStats(models.Model):
+    """Experience totals of a user, maintained by core.counters"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    experience_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    total_minutes = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.experience_count} experiences'
+
+
+class UserShard(models.Model):
+    """Database holding the experiences, tags and locations of a user"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    alias = models.CharField(max_length=100)
+    # Set while move_user copies the user's rows to another shard
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.alias}'
+
+
+class Tombstone(models.Model):
+    """Record of a deleted tag, location or experience for delta sync"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    change_id = ChangeIdField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'model', 'deleted_at']),
+            models.Index(fields=['user', 'model', 'change_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a create request sent with an Idempotency-Key"""
+    scope = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Until when the running request owns the key
+    leased_until = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'key'], name='unique_idempotency_key'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.key}'
+
+
+class PendingFileDeletion(models.Model):
+    """Stored file of a bulk deleted row, removed by purge_deleted_files"""
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class RelatedIndex(models.Model):
+    """Related experience index of a user, maintained by core.related"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    # Bumped by every write to the user's experiences
+    version = models.PositiveBigIntegerField(default=0)
+    # Version the stored index was built from, null until first built
+    built_version = models.PositiveBigIntegerField(null=True)
+    # Sync horizon read before building, see core.sync
+    horizon = models.BigIntegerField(default=0)
+    data = models.BinaryField(default=b'')
+
+    def __str__(self):
+        return f'{self.user_id}: {self.built_version}/{self.version}'
@@ -0,0 +1,367 @@
+import io
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from core.geo import EARTH_RADIUS_KM
+from core.models import Experience, Location, RelatedIndex, Tag
+from core.sync import sync_horizon
+
+
+# Rows of the similarity matrix computed at once, bounding memory use
+BLOCK_SIZE = 256
+
+
+def get_cache():
+    return caches[settings.RELATED_CACHE_ALIAS]
+
+
+def cache_key(user_id, version):
+    return f'related:{user_id}:{version}'
+
+
+def ranges(starts, ends):
+    """Return the concatenated ranges starts[i] to ends[i]"""
+    counts = ends - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+
+class Features:
+    """Tags, location and price of every experience of a user.
+
+    Tags are kept as the sorted assignments, by experience and by tag,
+    and locations as coordinates per experience, so memory grows with
+    the number of experiences and assignments only.
+    """
+
+    def __init__(self, user_id, using=None):
+        rows = list(
+            Experience.objects.using(using).filter(user_id=user_id)
+            .order_by('id')
+            .values_list('id', 'location_id', 'location__latitude',
+                         'location__longitude', 'price')
+        )
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.location_ids = np.array(
+            [row[1] for row in rows], dtype=np.int64
+        )
+        self.coordinates = np.radians(np.array([
+            (np.nan, np.nan) if row[2] is None or row[3] is None
+            else (row[2], row[3])
+            for row in rows
+        ], dtype=np.float64).reshape(-1, 2))
+        self.prices = np.array([float(row[4]) for row in rows])
+
+        through = Experience.tags.through
+        assignments = np.array(
+            through.objects.using(using)
+            .filter(experience__user_id=user_id)
+            .values_list('experience_id', 'tag_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        experience_rows = np.searchsorted(self.ids, assignments[:, 0])
+        tag_ids, tag_columns = np.unique(
+            assignments[:, 1], return_inverse=True
+        )
+        # Tags of each experience, and experiences of each tag
+        by_row = np.lexsort((tag_columns, experience_rows))
+        self.row_tags = tag_columns[by_row]
+        self.row_starts = np.searchsorted(
+            experience_rows[by_row], np.arange(len(rows) + 1)
+        )
+        by_tag = np.lexsort((experience_rows, tag_columns))
+        self.tag_rows = experience_rows[by_tag]
+        self.tag_starts = np.searchsorted(
+            tag_columns[by_tag], np.arange(len(tag_ids) + 1)
+        )
+        self.tag_counts = np.diff(self.row_starts).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def shared_tags(self, rows, columns):
+        """Return the number of tags experiences rows share with columns"""
+        inter = np.zeros((len(rows), len(columns)), dtype=np.float32)
+        positions = np.full(len(self), -1, dtype=np.int64)
+        positions[columns] = np.arange(len(columns))
+
+        # Add one for every tag a row shares with an experience, a tag at
+        # a time so memory stays within the block
+        starts, ends = self.row_starts[rows], self.row_starts[rows + 1]
+        tags = self.row_tags[ranges(starts, ends)]
+        tag_rows = np.repeat(np.arange(len(rows)), ends - starts)
+        for tag in np.unique(tags):
+            tagged = positions[
+                self.tag_rows[self.tag_starts[tag]:self.tag_starts[tag + 1]]
+            ]
+            inter[np.ix_(tag_rows[tags == tag], tagged[tagged >= 0])] += 1
+        return inter
+
+    def place_similarity(self, rows, columns):
+        """Return 1 for the same location, decaying with the distance
+        between locations with coordinates, 0 otherwise"""
+        lat_rows, lng_rows = self.coordinates[rows].T
+        lat_columns, lng_columns = self.coordinates[columns].T
+        a = np.sin((lat_rows[:, None] - lat_columns[None, :]) / 2) ** 2 + \
+            np.cos(lat_rows[:, None]) * np.cos(lat_columns[None, :]) * \
+            np.sin((lng_rows[:, None] - lng_columns[None, :]) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+        similarity = np.exp(-distance / settings.RELATED_DISTANCE_SCALE_KM)
+        similarity = np.nan_to_num(similarity, nan=0.0)
+        same = self.location_ids[rows][:, None] == \
+            self.location_ids[columns][None, :]
+        similarity[same] = 1
+        return similarity
+
+    def similarity(self, rows, columns):
+        """Return the similarity of experiences rows to experiences columns"""
+        inter = self.shared_tags(rows, columns)
+        union = self.tag_counts[rows, None] + \
+            self.tag_counts[None, columns] - inter
+        tags = np.divide(
+            inter, union, out=np.zeros_like(inter), where=union > 0
+        )
+
+        places = self.place_similarity(rows, columns)
+
+        price_rows = self.prices[rows, None]
+        price_columns = self.prices[None, columns]
+        highest = np.maximum(price_rows, price_columns)
+        prices = 1 - np.divide(
+            np.abs(price_rows - price_columns), highest,
+            out=np.zeros(highest.shape), where=highest > 0
+        )
+
+        scores = settings.RELATED_TAG_WEIGHT * tags + \
+            settings.RELATED_LOCATION_WEIGHT * places + \
+            settings.RELATED_PRICE_WEIGHT * prices
+        # An experience is not related to itself
+        scores[rows[:, None] == columns[None, :]] = -np.inf
+        return scores
+
+
+def top_k(ids, scores, k):
+    """Return the k best ids and scores of every row, best first"""
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, best, axis=1)
+        ids = np.take_along_axis(ids, best, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    scores = np.take_along_axis(scores, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+    return np.where(np.isfinite(scores), ids, -1), scores
+
+
+def rank(features, rows, k):
+    """Return the top k related experiences of some rows"""
+    columns = np.arange(len(features))
+    neighbors = np.full((len(rows), k), -1, dtype=np.int64)
+    scores = np.full((len(rows), k), -np.inf)
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        found, best = top_k(
+            np.broadcast_to(features.ids, (len(block), len(features))),
+            features.similarity(block, columns), k
+        )
+        neighbors[start:start + len(block), :found.shape[1]] = found
+        scores[start:start + len(block), :best.shape[1]] = best
+    return neighbors, scores
+
+
+def build(features):
+    """Return the related experience index of all experiences"""
+    k = settings.RELATED_TOP_K
+    neighbors, scores = rank(features, np.arange(len(features)), k)
+    return {'ids': features.ids, 'neighbors': neighbors, 'scores': scores}
+
+
+def update(index, features, changed):
+    """Return an index brought up to date after some experiences changed.
+
+    Only rows of changed experiences, and rows that listed a changed or
+    deleted experience, are ranked again. The other rows can only gain
+    changed experiences, so those are merged into their lists.
+    """
+    k = settings.RELATED_TOP_K
+    old_ids = index['ids']
+    deleted = np.setdiff1d(old_ids, features.ids)
+    changed = np.union1d(
+        np.intersect1d(changed, features.ids),
+        np.setdiff1d(features.ids, old_ids)
+    )
+    if len(changed) + len(deleted) > len(features) // 4:
+        return build(features)
+
+    kept = np.isin(old_ids, features.ids)
+    stale = np.isin(old_ids, changed) | \
+        np.isin(index['neighbors'], np.union1d(changed, deleted)).any(axis=1)
+    others = kept & ~stale
+
+    neighbors = np.full((len(features), k), -1, dtype=np.int64)
+    scores = np.full((len(features), k), -np.inf)
+    rows = np.searchsorted(features.ids, old_ids[others])
+    if len(changed):
+        columns = np.searchsorted(features.ids, changed)
+        merged_ids, merged_scores = top_k(
+            np.concatenate([
+                index['neighbors'][others],
+                np.broadcast_to(changed, (len(rows), len(changed))),
+            ], axis=1),
+            np.concatenate([
+                index['scores'][others],
+                features.similarity(rows, columns),
+            ], axis=1),
+            k
+        )
+        neighbors[rows], scores[rows] = merged_ids, merged_scores
+    else:
+        neighbors[rows] = index['neighbors'][others]
+        scores[rows] = index['scores'][others]
+
+    redo = np.setdiff1d(np.arange(len(features)), rows)
+    neighbors[redo], scores[redo] = rank(features, redo, k)
+    return {'ids': features.ids, 'neighbors': neighbors, 'scores': scores}
+
+
+def changed_since(user_id, horizon, using):
+    """Return the IDs of experiences changed since a sync horizon"""
+    experiences = Experience.objects.using(using).filter(user_id=user_id)
+    changed = experiences.filter(change_id__gte=horizon)
+    moved = experiences.filter(location__change_id__gte=horizon)
+    ids = set(changed.values_list('id', flat=True))
+    ids.update(moved.values_list('id', flat=True))
+    return np.array(sorted(ids), dtype=np.int64)
+
+
+def dump(index):
+    data = io.BytesIO()
+    np.savez(data, **index)
+    return data.getvalue()
+
+
+def load(data):
+    with np.load(io.BytesIO(bytes(data))) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def refresh(user_id):
+    """Rebuild the stored index of a user if writes changed it since.
+
+    Returns the index, or None when it was up to date. Only the changes
+    since the last build are applied.
+    """
+    state, created = RelatedIndex.objects.using('default') \
+        .get_or_create(user_id=user_id)
+    if state.built_version == state.version:
+        return None
+    using = router.db_for_read(
+        Experience, instance=Experience(user_id=user_id)
+    ) or 'default'
+
+    # Read before the rows, so changes committing meanwhile are seen next
+    horizon = sync_horizon(using)
+    features = Features(user_id, using)
+    if state.built_version is None:
+        index = build(features)
+    else:
+        index = update(
+            load(state.data), features,
+            changed_since(user_id, state.horizon, using)
+        )
+    # Another refresh may have stored a newer build meanwhile
+    RelatedIndex.objects.using('default').filter(
+        Q(built_version__isnull=True) |
+        Q(built_version__lt=state.version),
+        user_id=user_id
+    ).update(
+        built_version=state.version, horizon=horizon, data=dump(index)
+    )
+    get_cache().set(
+        cache_key(user_id, state.version), index, settings.RELATED_CACHE_TTL
+    )
+    return index
+
+
+def get_index(user_id):
+    """Return the stored related experience index of a user.
+
+    Reads check which build is current with one primary key lookup and
+    keep it in RELATED_CACHE_ALIAS, which may be local to each worker.
+    refresh_related brings indexes up to date after writes; reads only
+    build them when there is none yet.
+    """
+    built_version = RelatedIndex.objects.using('default') \
+        .filter(user_id=user_id) \
+        .values_list('built_version', flat=True).first()
+    if built_version is None:
+        return refresh(user_id) or get_index(user_id)
+
+    cache = get_cache()
+    index = cache.get(cache_key(user_id, built_version))
+    if index is None:
+        data = RelatedIndex.objects.using('default') \
+            .filter(user_id=user_id, built_version=built_version) \
+            .values_list('data', flat=True).first()
+        if data is None:
+            # Rebuilt meanwhile
+            return get_index(user_id)
+        index = load(data)
+        cache.set(
+            cache_key(user_id, built_version), index,
+            settings.RELATED_CACHE_TTL
+        )
+    return index
+
+
+def related_to(user_id, experience_id, limit):
+    """Return the IDs and scores of the experiences most like another"""
+    index = get_index(user_id)
+    row = np.searchsorted(index['ids'], experience_id)
+    if row == len(index['ids']) or index['ids'][row] != experience_id:
+        return []
+    return [
+        (int(related_id), float(score))
+        for related_id, score in zip(
+            index['neighbors'][row][:limit], index['scores'][row][:limit]
+        )
+        if related_id != -1
+    ]
+
+
+def bump(user_id):
+    RelatedIndex.objects.using('default').filter(user_id=user_id) \
+        .update(version=F('version') + 1)
+
+
+def mark_changed(user_id, using):
+    """Mark a user's index for refresh_related once the write commits"""
+    transaction.on_commit(partial(bump, user_id), using=using)
+
+
+def experience_changed(sender, instance, using, **kwargs):
+    """Mark the index of the owner of a written experience or location"""
+    mark_changed(instance.user_id, using)
+
+
+def tag_deleted(sender, instance, using, **kwargs):
+    """Mark the index when a tag in use goes away"""
+    if instance.experience_count:
+        mark_changed(instance.user_id, using)
+
+
+def experience_tags_changed(sender, instance, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        mark_changed(instance.user_id, using)
+
+
+post_save.connect(experience_changed, sender=Experience)
+post_delete.connect(experience_changed, sender=Experience)
+post_save.connect(experience_changed, sender=Location)
+post_delete.connect(tag_deleted, sender=Tag)
+m2m_changed.connect(experience_tags_changed, sender=Experience.tags.through)
@@ -0,0 +1,153 @@
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from core.models import ChangeId, Experience, Location, Tag, Tombstone
+
+
+# Users being deleted, whose rows need no tombstones
+deleting_users = ContextVar('deleting_users', default=frozenset())
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Sync token expired, fetch the full list again.'
+    default_code = 'sync_token_expired'
+
+
+def parse_sync_token(token):
+    """Return the change ID, issue time and database of a sync token"""
+    if token == '0':
+        return 0, None, None
+    if token.isdigit():
+        # Clock based tokens of earlier versions
+        raise SyncTokenExpired()
+    try:
+        change_id, issued, alias = token.split('.', 2)
+        change_id, issued = int(change_id), int(issued)
+    except ValueError:
+        raise ValidationError({'since': 'Invalid sync token.'})
+    if change_id < 0 or issued < 0 or not alias:
+        raise ValidationError({'since': 'Invalid sync token.'})
+    return change_id, issued, alias
+
+
+def make_sync_token(change_id, alias, issued=None):
+    if issued is None:
+        issued = time.time()
+    return f'{change_id}.{int(issued)}.{alias}'
+
+
+def sync_horizon(using):
+    """Return a change ID below which every change is already visible.
+
+    On PostgreSQL this is the oldest transaction still running, as rows
+    take the ID of the transaction writing them. Elsewhere change IDs are
+    clock times, taken before commit, so the horizon lags the clock by
+    SYNC_SAFETY_MARGIN seconds. Either way it must be read before the
+    changes themselves.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT txid_snapshot_xmin(txid_current_snapshot())'
+            )
+            return cursor.fetchone()[0]
+    return time.time_ns() // 1000 - settings.SYNC_SAFETY_MARGIN * 10 ** 6
+
+
+class DeltaSyncMixin:
+    """Return only the changes since a sync token with ?since=<token>.
+
+    The response lists the changed rows, the IDs deleted since and the
+    token to pass next time. since=0 returns every row.
+    """
+
+    def list(self, request, *args, **kwargs):
+        token = request.query_params.get('since')
+        if token is None:
+            return super().list(request, *args, **kwargs)
+
+        since, issued, alias = parse_sync_token(token)
+        model = self.get_queryset().model
+        # Change IDs only compare within the database that assigned them,
+        # so tokens from before a shard move start over.
+        home = router.db_for_write(model) or 'default'
+        retention = settings.SYNC_TOMBSTONE_DAYS * 24 * 60 * 60
+        if since and (alias != home or issued < time.time() - retention):
+            raise SyncTokenExpired()
+
+        changed = self.filter_queryset(self.get_queryset())
+        horizon = sync_horizon(changed.db)
+        changed = changed.filter(change_id__gte=since)
+        deleted = Tombstone.objects.filter(
+            user=request.user,
+            model=model._meta.model_name,
+            change_id__gte=since
+        ).values_list('object_id', flat=True)
+
+        return Response({
+            'changed': self.get_serializer(changed, many=True).data,
+            'deleted': sorted(set(deleted)),
+            # Never move backwards
+            'sync_token': make_sync_token(max(since, horizon), home),
+        })
+
+
+def user_deleting(sender, instance, **kwargs):
+    deleting_users.set(deleting_users.get() | {instance.pk})
+
+
+def user_deleted(sender, instance, **kwargs):
+    deleting_users.set(deleting_users.get() - {instance.pk})
+
+
+def record_deletion(sender, instance, using, **kwargs):
+    """Leave a tombstone for a deleted row"""
+    if instance.user_id in deleting_users.get():
+        return
+    Tombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        model=sender._meta.model_name,
+        object_id=instance.pk
+    )
+
+
+def touch_tag_experiences(sender, instance, using, **kwargs):
+    """Mark experiences as changed when one of their tags goes away"""
+    Experience.objects.using(using).filter(tags=instance) \
+        .update(updated_at=timezone.now(), change_id=ChangeId())
+
+
+def touch_experiences(sender, instance, action, reverse, pk_set, using,
+                      **kwargs):
+    """Mark experiences as changed when their tags change"""
+    if action in ('post_add', 'post_remove'):
+        ids = pk_set if reverse else {instance.pk}
+        experiences = Experience.objects.filter(pk__in=ids)
+    elif action == 'post_clear' and not reverse:
+        experiences = Experience.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear' and reverse:
+        # The tag's experiences are unknown once it has been cleared
+        experiences = Experience.objects.filter(tags=instance)
+    else:
+        return
+    experiences.using(using).update(
+        updated_at=timezone.now(), change_id=ChangeId()
+    )
+
+
+pre_delete.connect(user_deleting, sender=settings.AUTH_USER_MODEL)
+post_delete.connect(user_deleted, sender=settings.AUTH_USER_MODEL)
+for model in (Experience, Tag, Location):
+    post_delete.connect(record_deletion, sender=model)
+pre_delete.connect(touch_tag_experiences, sender=Tag)
+m2m_changed.connect(touch_experiences, sender=Experience.tags.through)
@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.authentication import TokenCache, token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class TokenCacheTests(TestCase):
+
+    def test_lru_eviction(self):
+        """Test that the least recently used key is evicted when full"""
+        cache = TokenCache(max_size=2, ttl=60)
+        user = get_user_model()(pk=1)
+        cache.set('a', user)
+        cache.set('b', user)
+        cache.get('a')
+        cache.set('c', user)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIs(cache.get('a'), user)
+
+    def test_expired_entries_are_misses(self):
+        """Test that entries past their ttl are not returned"""
+        cache = TokenCache(max_size=2, ttl=-1)
+        cache.set('a', get_user_model()(pk=1))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_resolved_from_cache(self):
+        """Test that the second request does not query the token table"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_deleted_token_rejected(self):
+        """Test that deleting a token invalidates the cache"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test that deactivating a user invalidates the cache"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates(self):
+        """Test that changing the password drops the cached user"""
+        self.client.get(ME_URL)
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_bulk_deactivation_rejected(self):
+        """Test that deactivating users with update() invalidates the cache"""
+        self.client.get(ME_URL)
+        get_user_model().objects.filter(pk=self.user.pk) \
+            .update(is_active=False)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_token_deletion_rejected(self):
+        """Test that deleting tokens with a queryset invalidates the cache"""
+        self.client.get(ME_URL)
+        Token.objects.filter(user=self.user).delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        AUTH_TOKEN_CACHE_ALIAS='shared',
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'auth-token-tests',
+            },
+        }
+    )
+    def test_shared_cache_skips_local_cache(self):
+        """Test that revocations seen in the shared cache apply at once"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+        # Another worker deleted the token and its shared entry
+        Token.objects.filter(pk=self.token.pk).delete()
+        caches['shared'].clear()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.models import Location, Tag
+
+
+TAGS_URL = reverse('experience:tag-list')
+
+
+class PrefixSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_names_lowercased(self):
+        """Test that the stored lowercase name follows renames"""
+        location = Location.objects.create(
+            user=self.user, name='Grand CANYON', description=''
+        )
+        self.assertEqual(location.name_lower, 'grand canyon')
+
+        location.name = 'Bryce Canyon'
+        location.save(update_fields=['name'])
+        location.refresh_from_db()
+
+        self.assertEqual(location.name_lower, 'bryce canyon')
+
+    def test_search_reads_limit_rows(self):
+        """Test that a search is one prefix query limited in the database"""
+        for index in range(20):
+            Tag.objects.create(user=self.user, name=f'Hike {index:02}')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'prefix': 'h', 'limit': 3})
+
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Hike 00', 'Hike 01', 'Hike 02'])
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertIn('LIKE', sql)
+        self.assertIn('LIMIT 3', sql)
@@ -1,26 +1,49 @@
 from unittest.mock import patch
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
 
+ENSURE_CONNECTION = \
+    'django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection'
+
+
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-
+        with patch(ENSURE_CONNECTION) as ec:
             call_command('wait_for_db')
 
-            self.assertEqual(gi.call_count, 1)
+            self.assertEqual(ec.call_count, 1)
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
+        with patch(ENSURE_CONNECTION) as ec:
+            ec.side_effect = [OperationalError] * 5 + [None]
 
             call_command('wait_for_db')
 
-            self.assertEqual(gi.call_count, 6)
\ No newline at end of file
+            self.assertEqual(ec.call_count, 6)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backoff(self, ts):
+        """Test that the delay between attempts doubles up to a maximum"""
+        with patch(ENSURE_CONNECTION) as ec:
+            ec.side_effect = [OperationalError] * 5 + [None]
+
+            call_command('wait_for_db', max_delay=3)
+
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertEqual(delays, [0.5, 1, 2, 3, 3])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """Test that the command fails once the timeout has passed"""
+        with patch(ENSURE_CONNECTION) as ec:
+            ec.side_effect = OperationalError
+
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0)
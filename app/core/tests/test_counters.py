@@ -0,0 +1,225 @@
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from core.deletion import delete_locations
+from core.models import Experience, Location, Tag, UserStats
+
+
+class ExperienceCountTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.park = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        self.beach = Location.objects.create(
+            user=self.user, name='Beach', description='Sandy'
+        )
+        self.hiking = Tag.objects.create(user=self.user, name='Hiking')
+        self.outdoor = Tag.objects.create(user=self.user, name='Outdoor')
+
+    def create_experience(self, location=None):
+        return Experience.objects.create(
+            user=self.user, title='Walk', time_minutes=10, price=1,
+            location=location or self.park
+        )
+
+    def assertCounts(self, **expected):
+        for name, count in expected.items():
+            obj = getattr(self, name)
+            obj.refresh_from_db()
+            self.assertEqual(obj.experience_count, count, name)
+
+    def test_location_count(self):
+        """Test that location counts follow experience changes"""
+        experience = self.create_experience()
+        self.create_experience()
+        self.assertCounts(park=2, beach=0)
+
+        experience = Experience.objects.get(pk=experience.pk)
+        experience.location = self.beach
+        experience.save()
+        self.assertCounts(park=1, beach=1)
+
+        experience.delete()
+        self.assertCounts(park=1, beach=0)
+
+    def test_location_change_with_deferred_fields(self):
+        """Test moving an experience loaded without its location"""
+        experience = self.create_experience()
+
+        experience = Experience.objects.only('title').get(pk=experience.pk)
+        experience.location = self.beach
+        experience.save()
+
+        self.assertCounts(park=0, beach=1)
+
+    def test_tag_count(self):
+        """Test that tag counts follow assignments"""
+        first = self.create_experience()
+        second = self.create_experience()
+
+        first.tags.add(self.hiking, self.outdoor)
+        first.tags.add(self.hiking)
+        second.tags.set([self.hiking])
+        self.assertCounts(hiking=2, outdoor=1)
+
+        first.tags.remove(self.outdoor, self.outdoor)
+        second.tags.remove(self.outdoor)
+        self.assertCounts(hiking=2, outdoor=0)
+
+        self.hiking.experience_set.remove(first)
+        self.assertCounts(hiking=1)
+
+        self.hiking.experience_set.clear()
+        first.tags.add(self.outdoor)
+        first.tags.clear()
+        self.assertCounts(hiking=0, outdoor=0)
+
+    def test_concurrent_adds_counted_once(self):
+        """Test that a tag added meanwhile by another request counts once"""
+        experience = self.create_experience()
+        manager = type(experience.tags)
+        find_missing = manager._get_missing_target_ids
+
+        def add_concurrently(tags, *args):
+            missing = find_missing(tags, *args)
+            if tags.instance is experience:
+                # Another request adds the tag once the IDs are computed
+                Experience.objects.get(pk=experience.pk).tags.add(
+                    self.hiking
+                )
+            return missing
+
+        with patch.object(manager, '_get_missing_target_ids',
+                          add_concurrently):
+            experience.tags.add(self.hiking)
+
+        self.assertCounts(hiking=1)
+
+    def test_experience_deletion(self):
+        """Test that deleting experiences stops counting their tags"""
+        experience = self.create_experience()
+        experience.tags.add(self.hiking)
+        other = self.create_experience(location=self.beach)
+        other.tags.add(self.hiking)
+
+        experience.delete()
+        self.assertCounts(hiking=1)
+
+        delete_locations([self.beach.id])
+        self.assertCounts(hiking=0, park=0)
+
+    def test_concurrent_deletions_counted_once(self):
+        """Test that deleting an experience already deleted counts nothing"""
+        experience = self.create_experience()
+        experience.tags.add(self.hiking)
+        self.create_experience().tags.add(self.hiking)
+        stale = Experience.objects.get(pk=experience.pk)
+
+        experience.delete()
+        stale.delete()
+
+        self.assertCounts(park=1, hiking=1)
+        self.assertEqual(UserStats.objects.get().experience_count, 1)
+
+    def test_concurrent_moves_counted_from_stored_row(self):
+        """Test that moving a stale copy counts from where the row is"""
+        lake = Location.objects.create(
+            user=self.user, name='Lake', description='Blue'
+        )
+        experience = self.create_experience()
+        stale = Experience.objects.get(pk=experience.pk)
+
+        experience.location = self.beach
+        experience.save()
+        stale.location = lake
+        stale.save()
+
+        self.assertCounts(park=0, beach=0)
+        lake.refresh_from_db()
+        self.assertEqual(lake.experience_count, 1)
+
+    def test_recount(self):
+        """Test that the recount command repairs drifted counts"""
+        self.create_experience().tags.add(self.hiking)
+        Tag.objects.update(experience_count=5)
+
+        with self.assertRaises(CommandError):
+            call_command('recount', check=True, stdout=StringIO())
+        call_command('recount', stdout=StringIO())
+
+        self.assertCounts(hiking=1, outdoor=0, park=1)
+        call_command('recount', check=True, stdout=StringIO())
+
+
+class UserStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+
+    def create_experience(self, price, minutes):
+        return Experience.objects.create(
+            user=self.user, title='Walk', time_minutes=minutes, price=price,
+            location=self.location
+        )
+
+    def assertStats(self, count, price, minutes):
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.experience_count, stats.total_price, stats.total_minutes),
+            (count, Decimal(price), minutes)
+        )
+
+    def test_stats_follow_experience_writes(self):
+        """Test that the totals follow creates, updates and deletes"""
+        first = self.create_experience(5.50, 30)
+        second = self.create_experience('10.00', 60)
+        self.assertStats(2, '15.50', 90)
+
+        second = Experience.objects.get(pk=second.pk)
+        second.price = Decimal('12.25')
+        second.time_minutes = 45
+        second.save()
+        self.assertStats(2, '17.75', 75)
+
+        first.delete()
+        self.assertStats(1, '12.25', 45)
+
+        delete_locations([self.location.id])
+        self.assertStats(0, '0', 0)
+
+    def test_update_with_deferred_fields(self):
+        """Test updating an experience loaded without its price"""
+        experience = self.create_experience(5, 30)
+
+        experience = Experience.objects.only('title').get(pk=experience.pk)
+        experience.time_minutes = 40
+        experience.save()
+
+        self.assertStats(1, '5', 40)
+
+    def test_rebuild_stats(self):
+        """Test that rebuild_stats compares and repairs the totals"""
+        self.create_experience(5, 30)
+        UserStats.objects.update(total_minutes=1)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', check=True, stdout=StringIO())
+        call_command('rebuild_stats', stdout=StringIO())
+
+        self.assertStats(1, '5', 30)
+        call_command('rebuild_stats', check=True, stdout=StringIO())
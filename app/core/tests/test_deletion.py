@@ -0,0 +1,133 @@
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.deletion import delete_locations, delete_users
+from core.models import Experience, Location, PendingFileDeletion, Tag, \
+    Tombstone
+
+
+class BulkDeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@website.com',
+            'testpass'
+        )
+
+    def create_experiences(self, user, count, location=None):
+        location = location or Location.objects.create(
+            user=user, name='Park', description='Green'
+        )
+        tag = Tag.objects.create(user=user, name='Hiking')
+        for i in range(count):
+            experience = Experience.objects.create(
+                user=user, title=f'Walk {i}', time_minutes=10, price=1,
+                location=location, image=f'uploads/experience/{i}.jpg'
+            )
+            experience.tags.add(tag)
+        return location
+
+    def test_delete_users(self):
+        """Test deleting users with all of their rows in batches"""
+        self.create_experiences(self.user, 5)
+        self.create_experiences(self.other, 2)
+        progress = []
+
+        counts = delete_users(
+            [self.user.id], batch_size=2,
+            progress=lambda name, count: progress.append((name, count))
+        )
+
+        self.assertEqual(counts, {
+            'experience': 5, 'tag': 1, 'location': 1, 'user': 1
+        })
+        self.assertEqual(progress[:3], [
+            ('experience', 2), ('experience', 4), ('experience', 5)
+        ])
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        self.assertEqual(Experience.objects.count(), 2)
+        self.assertEqual(Experience.tags.through.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertEqual(PendingFileDeletion.objects.count(), 5)
+
+    def test_delete_users_constant_queries_per_batch(self):
+        """Test that the queries depend on the batches, not the rows"""
+        self.create_experiences(self.user, 3)
+        self.create_experiences(self.other, 30)
+        with CaptureQueriesContext(connection) as small:
+            delete_users([self.user.id], batch_size=100)
+
+        with self.assertNumQueries(len(small)):
+            delete_users([self.other.id], batch_size=100)
+
+    def test_delete_locations(self):
+        """Test deleting locations with their experiences"""
+        location = self.create_experiences(self.user, 3)
+        kept = self.create_experiences(self.user, 1)
+
+        counts = delete_locations([location.id])
+
+        self.assertEqual(counts, {'experience': 3, 'location': 1})
+        self.assertEqual(list(Location.objects.all()), [kept])
+        self.assertEqual(Experience.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(
+            Tombstone.objects.filter(model='experience').count(), 3
+        )
+        self.assertTrue(Tombstone.objects.filter(
+            model='location', object_id=location.id
+        ).exists())
+
+    def test_bulk_delete_command(self):
+        """Test that the command deletes and reports progress"""
+        self.create_experiences(self.user, 2)
+        out = StringIO()
+
+        call_command('bulk_delete', users=[self.user.id], stdout=out)
+
+        self.assertIn('experience: 2 deleted', out.getvalue())
+        self.assertIn('1 user', out.getvalue())
+        self.assertFalse(Experience.objects.exists())
+
+    def test_purge_deleted_files(self):
+        """Test that queued files are removed from storage"""
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            name = default_storage.save('uploads/a.jpg', ContentFile(b'x'))
+            PendingFileDeletion.objects.create(name=name)
+
+            call_command('purge_deleted_files', stdout=StringIO())
+
+            self.assertFalse(default_storage.exists(name))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_admin_bulk_delete_action(self):
+        """Test the admin action deleting locations"""
+        admin = get_user_model().objects.create_superuser(
+            'admin@website.com', 'pword123'
+        )
+        self.client.force_login(admin)
+        location = self.create_experiences(self.user, 2)
+
+        self.client.post(reverse('admin:core_location_changelist'), {
+            'action': 'bulk_delete',
+            '_selected_action': [location.id],
+        })
+
+        self.assertFalse(Location.objects.exists())
+        self.assertFalse(Experience.objects.exists())
@@ -0,0 +1,198 @@
+import asyncio
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from core.deletion import delete_locations
+from core.events import PostgresTransport, broker, event_stream
+from core.models import Experience, Location, Tag
+
+
+def stream(scope, publish=None):
+    """Run the event stream until an event is sent, returning the messages"""
+    messages = []
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if b'data:' in message.get('body', b''):
+            disconnect.set()
+
+    async def main():
+        task = asyncio.ensure_future(event_stream(scope, receive, send))
+        while publish and not broker.subscriber_count() and not task.done():
+            await asyncio.sleep(0.01)
+        if publish:
+            broker.publish(publish)
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(main())
+    return messages
+
+
+def http_scope(headers=(), query_string=b''):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/events/',
+        'headers': list(headers),
+        'query_string': query_string,
+    }
+
+
+@override_settings(EVENTS_ENABLED=True,
+                   EVENTS_TRANSPORT='core.events.LocalTransport')
+class ChangeEventTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+
+    @patch('core.events.broker.publish')
+    def test_events_sent_on_commit(self, publish):
+        """Test that saves and deletes publish events after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(user=self.user, name='Hiking')
+        self.assertEqual(publish.call_args[0][0], {
+            'user': self.user.id,
+            'model': 'tag',
+            'action': 'created',
+            'id': tag.id,
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = 'Biking'
+            tag.save()
+        self.assertEqual(publish.call_args[0][0]['action'], 'updated')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(publish.call_args[0][0]['action'], 'deleted')
+
+    @patch('core.events.broker.publish')
+    def test_no_event_before_commit(self, publish):
+        """Test that nothing is published while the transaction is open"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(user=self.user, name='Hiking')
+
+        publish.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+    @patch('core.events.broker.publish')
+    def test_bulk_deletion_events(self, publish):
+        """Test that rows deleted in bulk publish deleted events"""
+        location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        experience = Experience.objects.create(
+            user=self.user, title='Walk', time_minutes=10, price=1,
+            location=location
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_locations([location.id])
+
+        self.assertEqual(
+            [call[0][0] for call in publish.call_args_list[-2:]], [
+                {'user': self.user.id, 'model': 'experience',
+                 'action': 'deleted', 'id': experience.id},
+                {'user': self.user.id, 'model': 'location',
+                 'action': 'deleted', 'id': location.id},
+            ]
+        )
+
+    @patch('core.events.broker.publish')
+    def test_no_event_when_disabled(self, publish):
+        """Test that writes send nothing unless events are enabled"""
+        with self.settings(EVENTS_ENABLED=False):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                Tag.objects.create(user=self.user, name='Hiking').delete()
+
+        publish.assert_not_called()
+        self.assertEqual(callbacks, [])
+
+
+@override_settings(EVENTS_ENABLED=True,
+                   EVENTS_TRANSPORT='core.events.LocalTransport')
+class EventStreamTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_stream_requires_token(self):
+        """Test that the stream is refused without a valid token"""
+        messages = stream(http_scope(query_string=b'token=invalid'))
+
+        self.assertEqual(messages[0]['status'], 401)
+
+    def test_user_events_streamed(self):
+        """Test that the user's events are sent as server-sent events"""
+        event = {'user': self.user.id, 'model': 'experience',
+                 'action': 'created', 'id': 1}
+        messages = stream(
+            http_scope(
+                headers=[(b'authorization',
+                          f'Token {self.token.key}'.encode())]
+            ),
+            publish=event
+        )
+
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), messages[0]['headers']
+        )
+        body = b''.join(m.get('body', b'') for m in messages[1:])
+        self.assertIn(b'event: experience.created\n', body)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_token_in_query_string(self):
+        """Test that EventSource clients can pass the token as a parameter"""
+        messages = stream(
+            http_scope(query_string=f'token={self.token.key}'.encode()),
+            publish={'user': self.user.id, 'model': 'tag',
+                     'action': 'deleted', 'id': 2}
+        )
+
+        self.assertEqual(messages[0]['status'], 200)
+
+
+@override_settings(EVENTS_TRANSPORT='core.events.PostgresTransport')
+class PostgresTransportTests(TestCase):
+
+    @patch('core.events.connections')
+    def test_send_failure_logged(self, connections):
+        """Test that a failed notification does not raise"""
+        cursor = connections['default'].cursor.return_value.__enter__
+        cursor.return_value.execute.side_effect = DatabaseError('down')
+
+        with self.assertLogs('core.events', level='ERROR'):
+            PostgresTransport().send({'user': 1})
+
+    @patch('core.events.time.sleep')
+    def test_listener_survives_errors(self, sleep):
+        """Test that the listener logs any error and reconnects"""
+        transport = PostgresTransport()
+        failures = [OSError('select failed'), ValueError('bad payload'),
+                    KeyboardInterrupt()]
+
+        with patch.object(transport, '_listen_once',
+                          side_effect=failures) as listen_once, \
+                self.assertLogs('core.events', level='ERROR') as logs:
+            with self.assertRaises(KeyboardInterrupt):
+                transport._listen()
+
+        self.assertEqual(listen_once.call_count, 3)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list],
+                         [1, 2])
@@ -0,0 +1,49 @@
+import random
+from django.test import SimpleTestCase
+from core import geo
+
+
+class GeohashTests(SimpleTestCase):
+
+    def test_encode(self):
+        """Test encoding a point as a geohash"""
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(-90, -180, 3), '000')
+
+    def test_prefix_range(self):
+        """Test the bounds of the geohashes starting with a prefix"""
+        self.assertEqual(geo.prefix_range('dhz0'), ('dhz0', 'dhz1'))
+        self.assertEqual(geo.prefix_range('dhzz'), ('dhzz', 'dj'))
+        self.assertEqual(geo.prefix_range('zz'), ('zz', None))
+
+    def test_covering_cells_contain_circle(self):
+        """Test that every point within the radius is in a covering cell"""
+        rng = random.Random(1)
+        centers = [(26.8, -80.06), (0, 179.99), (-89.5, 10), (60, -0.01)]
+        for latitude, longitude in centers:
+            for radius in (0.5, 5, 50, 400):
+                cells = geo.covering_cells(latitude, longitude, radius)
+                self.assertLessEqual(len(cells), 16)
+                for _ in range(200):
+                    point = (
+                        max(-90, min(90, latitude + rng.uniform(-5, 5))),
+                        (longitude + rng.uniform(-5, 5) + 180) % 360 - 180,
+                    )
+                    if geo.distance_km(latitude, longitude, *point) > radius:
+                        continue
+                    geohash = geo.encode(*point)
+                    self.assertTrue(
+                        any(geohash.startswith(cell) for cell in cells),
+                        (latitude, longitude, radius, point)
+                    )
+
+    def test_covering_cells_whole_world(self):
+        """Test that no cells are returned for huge radiuses"""
+        self.assertIsNone(geo.covering_cells(0, 0, 30000))
+
+    def test_distance(self):
+        """Test the great circle distance between two points"""
+        self.assertAlmostEqual(
+            geo.distance_km(51.5007, -0.1246, 40.6892, -74.0445), 5574.8,
+            delta=1
+        )
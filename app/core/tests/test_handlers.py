@@ -0,0 +1,82 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from core.handlers import ThreadPoolASGIHandler
+
+
+CREATE_USER_URL = reverse('user:create')
+
+
+def call(handler, method, path, body=b'', chunk_size=None):
+    """Send a request through an ASGI handler, returning (status, body)"""
+    chunk_size = chunk_size or max(len(body), 1)
+    pieces = [body[i:i + chunk_size]
+              for i in range(0, len(body), chunk_size)] or [b'']
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    }
+    messages = []
+
+    async def receive():
+        piece = pieces.pop(0)
+        return {'type': 'http.request', 'body': piece,
+                'more_body': bool(pieces)}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(handler(scope, receive, send))
+    content = b''.join(m.get('body', b'') for m in messages[1:])
+    return messages[0]['status'], content
+
+
+@override_settings(ASGI_THREADS=2)
+class ThreadPoolASGIHandlerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.handler = ThreadPoolASGIHandler()
+        self.addCleanup(self.handler.executor.shutdown)
+
+    def test_chunked_upload(self):
+        """Test that a body sent in several messages reaches the view"""
+        body = json.dumps({
+            'email': 'test@website.com',
+            'password': 'testpass',
+            'name': 'Test',
+        }).encode()
+
+        status, _ = call(
+            self.handler, 'POST', CREATE_USER_URL, body, chunk_size=8
+        )
+
+        self.assertEqual(status, 201)
+        self.assertTrue(
+            get_user_model().objects.filter(email='test@website.com').exists()
+        )
+
+    def test_views_run_on_pool(self):
+        """Test that the view runs on one of the handler's threads"""
+        threads = []
+        get_response = ThreadPoolASGIHandler.get_response
+
+        def record(handler, request):
+            threads.append(threading.current_thread().name)
+            return get_response(handler, request)
+
+        with patch.object(ThreadPoolASGIHandler, 'get_response', record):
+            status, _ = call(self.handler, 'GET', reverse('user:me'))
+
+        self.assertEqual(status, 401)
+        self.assertTrue(threads[0].startswith('asgi'))
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+from django.db.utils import OperationalError
+from django.test import TestCase
+from rest_framework import status
+from core.health import database_ready
+
+
+ENSURE_CONNECTION = \
+    'django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection'
+
+
+class HealthCheckTests(TestCase):
+
+    def setUp(self):
+        database_ready.clear()
+
+    def test_liveness(self):
+        """Test that liveness answers without touching the database"""
+        with self.assertNumQueries(0):
+            res = self.client.get('/healthz')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_readiness(self):
+        """Test that readiness succeeds when the database answers"""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_readiness_database_down(self):
+        """Test that readiness fails when the database is unavailable"""
+        with patch(ENSURE_CONNECTION, side_effect=OperationalError):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_readiness_cached(self):
+        """Test that the database check result is reused"""
+        self.client.get('/readyz')
+
+        with self.assertNumQueries(0):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_probes_skip_middleware(self):
+        """Test that probes do not create sessions or set cookies"""
+        res = self.client.get('/healthz')
+
+        self.assertEqual(res.cookies, {})
+        self.assertNotIn('X-Frame-Options', res)
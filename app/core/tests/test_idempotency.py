@@ -0,0 +1,156 @@
+from datetime import timedelta
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import IdempotencyKey, Tag
+from experience.views import TagViewSet
+
+
+TAGS_URL = reverse('experience:tag-list')
+CREATE_USER_URL = reverse('user:create')
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_tag(self, name='Hiking', key='key-1'):
+        return self.client.post(
+            TAGS_URL, {'name': name}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_response(self):
+        """Test that a retried create returns the first response"""
+        first = self.post_tag()
+        second = self.post_tag()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_different_keys_create_twice(self):
+        """Test that requests with different keys are separate creates"""
+        self.post_tag(key='key-1')
+        self.post_tag(key='key-2')
+
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_reused_key_rejected(self):
+        """Test that a key sent with another body is refused"""
+        self.post_tag(name='Hiking')
+        res = self.post_tag(name='Biking')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_validation_error_replayed(self):
+        """Test that client errors are stored like any other response"""
+        first = self.post_tag(name='')
+        with patch('experience.serializers.TagSerializer.is_valid') as valid:
+            second = self.post_tag(name='')
+
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(second.content, first.content)
+        valid.assert_not_called()
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_in_progress_conflict(self):
+        """Test that a duplicate gives up if the first never finishes"""
+        self.post_tag()
+        IdempotencyKey.objects.update(status_code=None)
+
+        res = self.post_tag()
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_crashed_request_taken_over(self):
+        """Test that a retry takes over a key whose lease ran out"""
+        self.post_tag()
+        IdempotencyKey.objects.update(
+            status_code=None, leased_until=timezone.now()
+        )
+
+        res = self.post_tag()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(IdempotencyKey.objects.get().status_code,
+                         status.HTTP_201_CREATED)
+
+    def test_late_request_stores_nothing(self):
+        """Test that a request outliving its lease leaves the key alone"""
+        perform_create = TagViewSet.perform_create
+
+        def taken_over(view, serializer):
+            IdempotencyKey.objects.update(
+                leased_until=timezone.now() + timedelta(hours=1)
+            )
+            perform_create(view, serializer)
+
+        with patch.object(TagViewSet, 'perform_create', taken_over):
+            res = self.post_tag()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(IdempotencyKey.objects.get().status_code)
+
+    def test_duplicate_waits_for_first(self):
+        """Test that a concurrent duplicate waits for the first response"""
+        first = self.post_tag()
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.update(status_code=None)
+
+        def finish(delay):
+            IdempotencyKey.objects.update(status_code=record.status_code)
+
+        with patch('core.idempotency.time.sleep', side_effect=finish):
+            second = self.post_tag()
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_expired_key_runs_again(self):
+        """Test that keys past their TTL no longer replay"""
+        self.post_tag()
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        res = self.post_tag()
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_create_user_replayed(self):
+        """Test that signing up twice with a key creates one user"""
+        client = APIClient()
+        payload = {
+            'email': 'new@website.com',
+            'password': 'testpass',
+            'name': 'New',
+        }
+
+        first = client.post(CREATE_USER_URL, payload,
+                            HTTP_IDEMPOTENCY_KEY='signup')
+        second = client.post(CREATE_USER_URL, payload,
+                             HTTP_IDEMPOTENCY_KEY='signup')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            get_user_model().objects.filter(email='new@website.com').count(),
+            1
+        )
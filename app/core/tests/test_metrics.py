@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.metrics import MetricsRegistry, registry
+
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('experience:tag-list')
+
+
+class MetricsRegistryTests(TestCase):
+
+    def test_render_histogram(self):
+        """Test that histograms are rendered with cumulative buckets"""
+        metrics = MetricsRegistry()
+        labels = (('view', 'user:me'),)
+        metrics.observe('latency', labels, 0.2, (0.1, 1))
+        metrics.observe('latency', labels, 0.05, (0.1, 1))
+
+        text = metrics.render()
+
+        self.assertIn('# TYPE latency histogram', text)
+        self.assertIn('latency_bucket{view="user:me",le="0.1"} 1', text)
+        self.assertIn('latency_bucket{view="user:me",le="1"} 2', text)
+        self.assertIn('latency_bucket{view="user:me",le="+Inf"} 2', text)
+        self.assertIn('latency_count{view="user:me"} 2', text)
+
+    def test_collect_sums_worker_files(self):
+        """Test that metrics written by other workers are summed"""
+        with tempfile.TemporaryDirectory() as directory:
+            other = {
+                'counters': [['requests_total', [['view', 'a']], 3]],
+                'histograms': [],
+            }
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+                json.dump(other, f)
+            metrics = MetricsRegistry(directory=directory)
+            metrics.inc('requests_total', (('view', 'a'),), 2)
+
+            text = metrics.render()
+
+        self.assertIn('requests_total{view="a"} 5', text)
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_metrics_per_view(self):
+        """Test that requests are reported by URL name"""
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        text = res.content.decode()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'http_requests_total{view="experience:tag-list",'
+            'method="GET",status="200"} 1',
+            text
+        )
+        self.assertIn(
+            'db_queries_total{view="experience:tag-list"} 1', text
+        )
+        self.assertIn('http_request_duration_seconds_bucket', text)
+        self.assertIn('auth_token_cache_hits_total', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        """Test that the endpoint is hidden when metrics are disabled"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,126 @@
+import json
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.middleware import ApiSessionMiddleware
+from core.models import Experience, Location
+
+
+TAGS_URL = reverse('experience:tag-list')
+EXPERIENCE_URL = reverse('experience:experience-list')
+
+
+@override_settings(SERVER_TIMING_ENABLED=True)
+class ServerTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test that API responses carry a Server-Timing header"""
+        with self.assertLogs('core.timing', level='INFO'):
+            res = self.client.get(TAGS_URL)
+
+        header = res['Server-Timing']
+        for name in ('db', 'view', 'render', 'total'):
+            self.assertIn(f'{name};dur=', header)
+        self.assertIn('desc="1 queries"', header)
+
+    def test_structured_log_line(self):
+        """Test that the request is logged as JSON with its query count"""
+        with self.assertLogs('core.timing', level='INFO') as logs:
+            self.client.get(TAGS_URL)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'experience:tag-list')
+        self.assertEqual(line['queries'], 1)
+        self.assertEqual(line['over_budget'], [])
+
+    @override_settings(SERVER_TIMING_QUERY_BUDGET=1)
+    def test_over_budget_flagged(self):
+        """Test that requests over the query budget log a warning"""
+        location = Location.objects.create(user=self.user, name='Park')
+        Experience.objects.create(
+            user=self.user,
+            title='Tennis',
+            time_minutes=30,
+            price=10,
+            location=location
+        )
+
+        with self.assertLogs('core.timing', level='WARNING') as logs:
+            self.client.get(EXPERIENCE_URL)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['over_budget'], ['queries'])
+
+    def test_other_namespaces_ignored(self):
+        """Test that non API views are not instrumented"""
+        self.client.force_login(self.user)
+
+        res = self.client.get(reverse('admin:login'))
+
+        self.assertNotIn('Server-Timing', res)
+
+
+@override_settings(API_LEAN_PREFIXES=('/api/',))
+class LeanApiMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.factory = RequestFactory()
+        self.middleware = ApiSessionMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.request = request
+        return HttpResponse()
+
+    def test_api_request_skips_session(self):
+        """Test that API requests without a session cookie skip sessions"""
+        self.middleware(self.factory.get(TAGS_URL))
+
+        self.assertFalse(hasattr(self.request, 'session'))
+
+    def test_api_request_with_session_cookie(self):
+        """Test that API requests from a logged in browser keep sessions"""
+        self.factory.cookies[settings.SESSION_COOKIE_NAME] = 'abc'
+
+        self.middleware(self.factory.get(TAGS_URL))
+
+        self.assertTrue(hasattr(self.request, 'session'))
+
+    def test_other_paths_keep_session(self):
+        """Test that requests outside the API go through sessions"""
+        self.middleware(self.factory.get('/admin/'))
+
+        self.assertTrue(hasattr(self.request, 'session'))
+
+    def test_api_post_without_csrf_token(self):
+        """Test that token authenticated API writes still work"""
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_authenticate(self.user)
+
+        res = client.post(TAGS_URL, {'name': 'Hiking'})
+
+        self.assertEqual(res.status_code, 201)
+
+    def test_admin_login_still_works(self):
+        """Test that the admin keeps its sessions and CSRF protection"""
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        res = self.client.get(reverse('admin:index'))
+
+        self.assertEqual(res.status_code, 200)
@@ -0,0 +1,206 @@
+import threading
+from unittest.mock import patch
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+from django.test import SimpleTestCase
+from core.db import pool as pools
+from core.db.backends.postgresql.base import DatabaseWrapper
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    """Create a pool of fake connections"""
+    defaults = {
+        'connect': FakeConnection,
+        'check': lambda conn: not conn.closed,
+        'reset': lambda conn: not conn.closed,
+        'max_size': 2,
+        'timeout': 0.1,
+        'check_interval': 0,
+    }
+    defaults.update(kwargs)
+    return ConnectionPool(**defaults)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_connection_reused(self):
+        """Test that a released connection is handed out again"""
+        pool = make_pool()
+        conn = pool.acquire()
+        pool.release(conn)
+
+        self.assertIs(pool.acquire(), conn)
+
+    def test_stats(self):
+        """Test that active and idle connections are counted"""
+        pool = make_pool()
+        first = pool.acquire()
+        pool.acquire()
+        pool.release(first)
+
+        stats = pool.stats()
+        self.assertEqual(stats['active'], 1)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_timeout_when_exhausted(self):
+        """Test that acquiring from a full pool times out"""
+        pool = make_pool(max_size=1)
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+    def test_waits_for_release(self):
+        """Test that a waiting thread gets a connection once one is freed"""
+        pool = make_pool(max_size=1, timeout=5)
+        conn = pool.acquire()
+        threading.Timer(0.05, pool.release, args=[conn]).start()
+
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertGreater(pool.stats()['wait_seconds'], 0)
+
+    def test_unhealthy_connection_replaced(self):
+        """Test that a connection failing the health check is replaced"""
+        pool = make_pool(reset=lambda conn: True)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.closed = True
+
+        new_conn = pool.acquire()
+
+        self.assertIsNot(new_conn, conn)
+        self.assertFalse(new_conn.closed)
+
+    def test_broken_connection_not_returned(self):
+        """Test that connections failing reset are discarded on release"""
+        pool = make_pool()
+        conn = pool.acquire()
+        conn.closed = True
+        pool.release(conn)
+
+        self.assertEqual(pool.stats(), {
+            'active': 0, 'idle': 0, 'waits': 0, 'wait_seconds': 0.0
+        })
+
+
+class FakeCursor:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        pass
+
+
+class FakePsycopgConnection:
+    """Stands in for a psycopg2 connection to a PostgreSQL server"""
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.isolation_level = extensions.ISOLATION_LEVEL_READ_COMMITTED
+        self.info = type('Info', (), {
+            'transaction_status': extensions.TRANSACTION_STATUS_IDLE
+        })()
+
+    def cursor(self):
+        return FakeCursor()
+
+    def set_client_encoding(self, encoding):
+        pass
+
+    def get_parameter_status(self, name):
+        return 'UTC'
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def make_wrapper(**pool):
+    """Create a pooled backend connection, as each thread has its own"""
+    return DatabaseWrapper({
+        'ENGINE': 'core.db.backends.postgresql',
+        'NAME': 'app', 'USER': 'app', 'PASSWORD': '', 'HOST': 'db',
+        'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None, 'AUTOCOMMIT': True,
+        'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 60, 'TEST': {},
+        'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0.5, 'CHECK_INTERVAL': 30,
+                 **pool},
+    }, alias='pool_test')
+
+
+@patch.object(base.DatabaseWrapper, 'get_new_connection',
+              lambda self, conn_params: FakePsycopgConnection())
+class PooledBackendTests(SimpleTestCase):
+
+    def tearDown(self):
+        with pools._pools_lock:
+            for key in [key for key in pools._pools if key[0] == 'pool_test']:
+                del pools._pools[key]
+
+    def test_connection_released_at_request_end(self):
+        """Test that the end of a request returns the connection"""
+        wrapper = make_wrapper()
+        wrapper.ensure_connection()
+        conn = wrapper.connection
+        pool = wrapper.pool(wrapper.get_connection_params())
+        self.assertEqual(pool.stats()['active'], 1)
+
+        # What request_finished does, despite CONN_MAX_AGE
+        wrapper.close_if_unusable_or_obsolete()
+
+        self.assertIsNone(wrapper.connection)
+        self.assertEqual(pool.stats()['active'], 0)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertFalse(conn.closed)
+
+    def test_threads_share_connections(self):
+        """Test that more threads than connections take turns on the pool"""
+        raw = []
+        errors = []
+
+        def request():
+            wrapper = make_wrapper(TIMEOUT=5)
+            try:
+                for _ in range(5):
+                    wrapper.ensure_connection()
+                    raw.append(wrapper.connection)
+                    wrapper.close_if_unusable_or_obsolete()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(raw), 20)
+        self.assertEqual(len({id(conn) for conn in raw}), 1)
+
+    def test_connection_kept_inside_transaction(self):
+        """Test that an open transaction keeps its connection"""
+        wrapper = make_wrapper()
+        wrapper.ensure_connection()
+        wrapper.in_atomic_block = True
+
+        wrapper.close_if_unusable_or_obsolete()
+
+        self.assertIsNotNone(wrapper.connection)
@@ -0,0 +1,101 @@
+import pstats
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+TAGS_URL = reverse('experience:tag-list')
+
+
+def report_url(report_id):
+    """Return the profile report download URL"""
+    return reverse('profile-report', args=[report_id])
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.report_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILE_REPORT_DIR=self.report_dir.name
+        )
+        self.settings.enable()
+        self.staff = get_user_model().objects.create_superuser(
+            'admin@website.com',
+            'testpass'
+        )
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.report_dir.cleanup()
+
+    def _authenticate(self, user):
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_staff_request_profiled(self):
+        """Test that a staff request with the header is profiled"""
+        self._authenticate(self.staff)
+
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+        report = self.client.get(report_url(res['X-Profile-Id']))
+
+        content = b''.join(report.streaming_content).decode()
+        self.assertEqual(report.status_code, status.HTTP_200_OK)
+        self.assertIn('function calls', content)
+        self.assertIn('SELECT', content)
+        self.assertIn('Slowest queries', content)
+
+    def test_raw_profile_download(self):
+        """Test that the pstats dump can be downloaded"""
+        self._authenticate(self.staff)
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        report = self.client.get(
+            report_url(res['X-Profile-Id']), {'download': 'prof'}
+        )
+
+        self.assertEqual(report.status_code, status.HTTP_200_OK)
+        self.assertIn('.prof', report['Content-Disposition'])
+        with tempfile.NamedTemporaryFile(suffix='.prof') as dump:
+            dump.write(b''.join(report.streaming_content))
+            dump.flush()
+            stats = pstats.Stats(dump.name)
+        self.assertGreater(stats.total_calls, 0)
+
+    def test_query_flag(self):
+        """Test that the profile query parameter also enables profiling"""
+        self._authenticate(self.staff)
+
+        res = self.client.get(TAGS_URL, {'profile': '1'})
+
+        self.assertIn('X-Profile-Id', res)
+
+    def test_non_staff_not_profiled(self):
+        """Test that the flag is ignored for regular users"""
+        self._authenticate(self.user)
+
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', res)
+
+    def test_report_staff_only(self):
+        """Test that regular users cannot download reports"""
+        self._authenticate(self.staff)
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+        self._authenticate(self.user)
+
+        report = self.client.get(report_url(res['X-Profile-Id']))
+
+        self.assertEqual(report.status_code, status.HTTP_403_FORBIDDEN)
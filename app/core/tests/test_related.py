@@ -0,0 +1,194 @@
+import random
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from core import related
+from core.deletion import delete_locations
+from core.models import Experience, Location, Tag
+
+
+@override_settings(SYNC_SAFETY_MARGIN=0)
+class RelatedIndexTests(TestCase):
+
+    def setUp(self):
+        related.get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.park = Location.objects.create(
+            user=self.user, name='Park', description='',
+            latitude=26.78, longitude=-80.10
+        )
+        self.beach = Location.objects.create(
+            user=self.user, name='Beach', description='',
+            latitude=26.80, longitude=-80.03
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(6)
+        ]
+
+    def create_experience(self, tags, price=10, location=None):
+        experience = Experience.objects.create(
+            user=self.user, title='Walk', time_minutes=10, price=price,
+            location=location or self.park
+        )
+        experience.tags.set(tags)
+        return experience
+
+    def test_related_by_tags_location_and_price(self):
+        """Test that more similar experiences rank higher"""
+        tennis, golf, surf, sail = self.tags[:4]
+        experience = self.create_experience([tennis, golf])
+        same = self.create_experience([tennis, golf])
+        half = self.create_experience([tennis, surf])
+        elsewhere = self.create_experience(
+            [tennis, surf], price=90, location=self.beach
+        )
+        unrelated = self.create_experience(
+            [sail], price=500, location=self.beach
+        )
+
+        ranked = related.related_to(self.user.id, experience.id, 10)
+
+        self.assertEqual(
+            [related_id for related_id, _ in ranked],
+            [same.id, half.id, elsewhere.id, unrelated.id]
+        )
+        self.assertAlmostEqual(ranked[0][1], 1.0, places=5)
+
+    def test_index_cached(self):
+        """Test that reads only check which build is current"""
+        experience = self.create_experience(self.tags[:2])
+        self.create_experience(self.tags[:1])
+        related.related_to(self.user.id, experience.id, 10)
+
+        with self.assertNumQueries(1):
+            related.related_to(self.user.id, experience.id, 10)
+
+    def test_index_shared_between_workers(self):
+        """Test that a worker without the index loads the stored one"""
+        experience = self.create_experience(self.tags[:2])
+        related.related_to(self.user.id, experience.id, 10)
+        related.get_cache().clear()
+
+        with patch('core.related.Features') as features, \
+                self.assertNumQueries(2):
+            related.related_to(self.user.id, experience.id, 10)
+        features.assert_not_called()
+
+    def test_writes_mark_index_stale(self):
+        """Test that writes leave the rebuild to refresh_related"""
+        experience = self.create_experience(self.tags[:2])
+        related.related_to(self.user.id, experience.id, 10)
+
+        with patch('core.related.Features') as features, \
+                self.captureOnCommitCallbacks(execute=True):
+            other = self.create_experience(self.tags[:2])
+        features.assert_not_called()
+
+        self.assertEqual(related.related_to(self.user.id, experience.id, 10),
+                         [])
+        out = StringIO()
+        call_command('refresh_related', stdout=out)
+        self.assertIn('1 related indexes refreshed', out.getvalue())
+        ranked = related.related_to(self.user.id, experience.id, 10)
+        self.assertEqual([related_id for related_id, _ in ranked],
+                         [other.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_locations([self.park.id])
+        call_command('refresh_related', stdout=StringIO())
+
+        self.assertEqual(related.get_index(self.user.id)['ids'].size, 0)
+
+    def test_rolled_back_write_not_marked(self):
+        """Test that only committed writes mark the index"""
+        self.create_experience(self.tags[:2])
+        related.refresh(self.user.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_experience(self.tags[:2])
+
+        self.assertIsNone(related.refresh(self.user.id))
+        self.assertTrue(callbacks)
+
+    def test_unchanged_data_not_refreshed(self):
+        """Test that a refresh without changes does nothing"""
+        self.create_experience(self.tags[:2])
+        related.refresh(self.user.id)
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(related.refresh(self.user.id))
+
+    def test_incremental_update_matches_rebuild(self):
+        """Test that refreshing a cached index gives a full rebuild"""
+        rng = random.Random(0)
+        experiences = [
+            self.create_experience(
+                rng.sample(self.tags, rng.randint(0, 3)),
+                price=rng.randint(0, 50),
+                location=rng.choice([self.park, self.beach])
+            )
+            for _ in range(40)
+        ]
+        related.refresh(self.user.id)
+
+        for step in range(8):
+            experience = rng.choice(experiences)
+            with self.captureOnCommitCallbacks(execute=True):
+                if step % 4 == 0:
+                    experience.tags.set(rng.sample(self.tags, 2))
+                elif step % 4 == 1:
+                    experience.price = rng.randint(0, 50)
+                    experience.save()
+                elif step % 4 == 2:
+                    experiences.remove(experience)
+                    experience.delete()
+                else:
+                    experiences.append(
+                        self.create_experience(self.tags[:2])
+                    )
+
+            self.assertIsNotNone(related.refresh(self.user.id))
+            index = related.get_index(self.user.id)
+            rebuilt = related.build(related.Features(self.user.id))
+
+            np.testing.assert_array_equal(index['ids'], rebuilt['ids'])
+            np.testing.assert_allclose(index['scores'], rebuilt['scores'])
+
+    def test_sparse_features_match_dense(self):
+        """Test that shared tags and places match a dense computation"""
+        rng = random.Random(1)
+        lake = Location.objects.create(user=self.user, name='Lake',
+                                       description='')
+        for _ in range(30):
+            self.create_experience(
+                rng.sample(self.tags, rng.randint(0, 4)),
+                location=rng.choice([self.park, self.beach, lake])
+            )
+        features = related.Features(self.user.id)
+        rows = np.arange(len(features))
+        tags = np.zeros((len(features), len(self.tags)))
+        for experience in Experience.objects.prefetch_related('tags'):
+            row = np.searchsorted(features.ids, experience.id)
+            for tag in experience.tags.all():
+                tags[row, self.tags.index(tag)] = 1
+
+        np.testing.assert_array_equal(
+            features.shared_tags(rows, rows[::2]), (tags @ tags.T)[:, ::2]
+        )
+        places = features.place_similarity(rows, rows)
+        same = features.location_ids[:, None] == features.location_ids
+        self.assertTrue((places[same] == 1).all())
+        self.assertTrue((places[~same] < 1).all())
+
+    def test_unknown_experience(self):
+        """Test that experiences missing from the index have no relations"""
+        self.create_experience(self.tags[:1])
+
+        self.assertEqual(related.related_to(self.user.id, 999999, 10), [])
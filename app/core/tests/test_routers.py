@@ -0,0 +1,225 @@
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.checks import Error
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.checks import check_replica_pin_cache
+from core.db.routers import ReplicaRouter, check_replica, use_replica
+from core.models import Tag
+
+
+TAGS_URL = reverse('experience:tag-list')
+TOKEN_URL = reverse('user:token')
+
+
+@override_settings(DB_REPLICAS=['replica_0', 'replica_1'])
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.token = use_replica.set(True)
+
+    def tearDown(self):
+        use_replica.reset(self.token)
+
+    @patch('core.db.routers.replica_ready', return_value=True)
+    def test_reads_round_robin(self, ready):
+        """Test that reads alternate between the replicas"""
+        aliases = {self.router.db_for_read(Tag) for _ in range(4)}
+
+        self.assertEqual(aliases, {'replica_0', 'replica_1'})
+
+    @patch('core.db.routers.replica_ready')
+    def test_unhealthy_replica_skipped(self, ready):
+        """Test that replicas failing the health check are not used"""
+        ready.side_effect = lambda alias: alias == 'replica_1'
+
+        aliases = {self.router.db_for_read(Tag) for _ in range(4)}
+
+        self.assertEqual(aliases, {'replica_1'})
+
+    @patch('core.db.routers.replica_ready', return_value=False)
+    def test_fallback_to_primary(self, ready):
+        """Test that reads use the primary without a healthy replica"""
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+    @patch('core.db.routers.replica_ready', return_value=True)
+    def test_outside_safe_request_uses_primary(self, ready):
+        """Test that reads only use replicas when the request allows it"""
+        use_replica.set(False)
+
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+    @patch('core.db.routers.replica_ready', return_value=True)
+    def test_shared_cache_uses_primary(self, ready):
+        """Test that entries of the database cache are read on the primary"""
+        model = caches['shared'].cache_model_class
+
+        self.assertIsNone(self.router.db_for_read(model))
+
+    def test_replicas_not_migrated(self):
+        """Test that migrations only run on the primary"""
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DB_REPLICAS=['replica_0'])
+class ReplicaRoutingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.seen = []
+
+    def _record(self, model, **hints):
+        # Pins themselves are read from the shared cache on the primary
+        if model._meta.app_label != 'django_cache':
+            self.seen.append(use_replica.get())
+        return None
+
+    def test_reads_pinned_after_write(self):
+        """Test that a client reads from the primary after writing"""
+        with patch.object(ReplicaRouter, 'db_for_read', self._record):
+            self.client.get(TAGS_URL)
+            self.client.post(TAGS_URL, {'name': 'Outdoor'})
+            self.seen.clear()
+            self.client.get(TAGS_URL)
+
+        self.assertTrue(self.seen)
+        self.assertFalse(any(self.seen))
+
+    def test_pin_shared_between_workers(self):
+        """Test that the pin holds for a request without the cookie"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token abc')
+        self.client.post(TAGS_URL, {'name': 'Outdoor'})
+        # Another worker, and a client that does not keep cookies
+        other = APIClient()
+        other.force_authenticate(self.user)
+        other.credentials(HTTP_AUTHORIZATION='Token abc')
+
+        with patch.object(ReplicaRouter, 'db_for_read', self._record):
+            other.get(TAGS_URL)
+
+        self.assertTrue(self.seen)
+        self.assertFalse(any(self.seen))
+
+    def test_pin_cookie(self):
+        """Test that the pin cookie keeps reads on the primary"""
+        res = self.client.post(TAGS_URL, {'name': 'Outdoor'})
+        self.assertIn('primary_pin', res.cookies)
+        caches['shared'].clear()
+
+        with patch.object(ReplicaRouter, 'db_for_read', self._record):
+            self.client.get(TAGS_URL)
+
+        self.assertTrue(self.seen)
+        self.assertFalse(any(self.seen))
+
+    def test_reads_pinned_after_login(self):
+        """Test that requests with a new token read from the primary"""
+        res = APIClient().post(
+            TOKEN_URL, {'email': 'test@website.com', 'password': 'testpass'}
+        )
+        # A client that does not keep cookies, served by another worker
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+
+        with patch.object(ReplicaRouter, 'db_for_read', self._record):
+            res = other.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(self.seen)
+        self.assertFalse(any(self.seen))
+
+    def test_safe_requests_use_replicas(self):
+        """Test that safe requests are allowed to read from replicas"""
+        with patch.object(ReplicaRouter, 'db_for_read', self._record):
+            self.client.get(TAGS_URL)
+
+        self.assertTrue(self.seen)
+        self.assertTrue(all(self.seen))
+
+
+class ReplicaPinCacheCheckTests(SimpleTestCase):
+
+    @override_settings(DB_REPLICAS=['replica_0'],
+                       DB_REPLICA_PIN_CACHE_ALIAS='default')
+    def test_local_cache_rejected(self):
+        """Test that replicas require pins shared between workers"""
+        errors = check_replica_pin_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E002'])
+        self.assertIsInstance(errors[0], Error)
+
+    @override_settings(DB_REPLICAS=['replica_0'],
+                       DB_REPLICA_PIN_CACHE_ALIAS='shared')
+    def test_shared_cache_accepted(self):
+        """Test that a shared pin cache passes the check"""
+        self.assertEqual(check_replica_pin_cache(None), [])
+
+    @override_settings(DB_REPLICAS=[], DB_REPLICA_PIN_CACHE_ALIAS='default')
+    def test_no_replicas(self):
+        """Test that the pin cache is not checked without replicas"""
+        self.assertEqual(check_replica_pin_cache(None), [])
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        self.connection.queries.append((sql, params))
+
+    def fetchone(self):
+        return (self.connection.result,)
+
+
+class FakeConnection:
+    vendor = 'postgresql'
+
+    def __init__(self, result):
+        self.result = result
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@override_settings(DB_REPLICA_MAX_LAG_BYTES=1000)
+class CheckReplicaTests(SimpleTestCase):
+
+    def check(self, lag):
+        primary = FakeConnection('0/3000060')
+        replica = FakeConnection(lag)
+        with patch('core.db.routers.connections',
+                   {'default': primary, 'replica_0': replica}):
+            check_replica('replica_0')
+        return replica.queries
+
+    def test_lag_measured_against_primary_lsn(self):
+        """Test that the replica's replay position is compared in bytes"""
+        queries = self.check(0)
+
+        self.assertIn('pg_last_wal_replay_lsn', queries[0][0])
+        self.assertEqual(queries[0][1], ['0/3000060'])
+
+    def test_lagging_replica_rejected(self):
+        """Test that a replica too far behind fails the check"""
+        self.check(1000)
+        with self.assertRaises(OperationalError):
+            self.check(1001)
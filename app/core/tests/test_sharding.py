@@ -0,0 +1,344 @@
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.db.sharding import ShardRouter, directory, shard_user
+from core.models import Experience, Location, Tag, UserShard
+
+
+TAGS_URL = reverse('experience:tag-list')
+LOCATIONS_URL = reverse('experience:location-list')
+EXPERIENCES_URL = reverse('experience:experience-list')
+
+
+# In-memory SQLite shards, added to the connections for ShardMoveTests
+SHARDS = ['shard_test_0', 'shard_test_1']
+
+
+def create_user(email='test@website.com'):
+    return get_user_model().objects.create_user(email, 'testpass')
+
+
+def add_shard_databases():
+    """Add the shards, before the test runner sets up the databases"""
+    for alias in SHARDS:
+        if alias in connections.settings:
+            continue
+        connections.settings[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+        connections.ensure_defaults(alias)
+        connections.prepare_test_settings(alias)
+
+
+add_shard_databases()
+
+
+class ShardDirectoryTests(TestCase):
+    databases = {'default', *SHARDS}
+
+    def setUp(self):
+        directory.clear()
+        self.addCleanup(directory.clear)
+
+    def test_new_user_placed_by_id(self):
+        """Test that new users are spread over the shards by ID"""
+        user = create_user()
+
+        with self.settings(SHARD_DATABASES=SHARDS):
+            alias = directory.get(user.pk)
+
+        self.assertEqual(alias, SHARDS[user.pk % 2])
+        self.assertTrue(
+            UserShard.objects.filter(user=user, alias=alias).exists()
+        )
+        # Their rows on the shard need a copy of the user row
+        self.assertTrue(
+            get_user_model()._base_manager.using(alias)
+            .filter(pk=user.pk).exists()
+        )
+
+    def test_user_with_rows_stays_on_default(self):
+        """Test that users with rows from before sharding keep them"""
+        user = create_user()
+        Tag.objects.create(user=user, name='Hiking')
+
+        with self.settings(SHARD_DATABASES=SHARDS):
+            self.assertEqual(directory.get(user.pk), 'default')
+
+    def test_lookup_cached(self):
+        """Test that repeated lookups do not query the directory table"""
+        user = create_user()
+
+        with self.settings(SHARD_DATABASES=SHARDS[:1]):
+            directory.get(user.pk)
+            with self.assertNumQueries(0):
+                alias = directory.get(user.pk)
+
+        self.assertEqual(alias, SHARDS[0])
+
+    def test_existing_placement_kept(self):
+        """Test that a stored placement wins over the default placement"""
+        user = create_user()
+        UserShard.objects.create(user=user, alias='shard_1')
+
+        with self.settings(SHARD_DATABASES=['shard_0', 'shard_1']):
+            self.assertEqual(directory.get(user.pk), 'shard_1')
+
+
+@override_settings(SHARD_DATABASES=['shard_0', 'shard_1'])
+@patch('core.db.sharding.shard_for_user', lambda user_id: f'shard_{user_id}')
+class ShardRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = ShardRouter()
+
+    def test_instance_hint_routes_to_owner_shard(self):
+        """Test that writes of an owned row go to its user's shard"""
+        self.assertEqual(
+            self.router.db_for_write(Tag, instance=Tag(user_id=1)),
+            'shard_1'
+        )
+
+    def test_request_user_routes_reads(self):
+        """Test that reads use the shard of the current request's user"""
+        token = shard_user.set(0)
+        self.addCleanup(shard_user.reset, token)
+
+        self.assertEqual(self.router.db_for_read(Experience), 'shard_0')
+
+    def test_unknown_user_not_routed(self):
+        """Test that owned models without a user are left to Django"""
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+    def test_shared_models_not_routed(self):
+        """Test that the directory and users stay on the default database"""
+        self.assertEqual(self.router.db_for_read(UserShard), 'default')
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_disabled_without_shards(self):
+        """Test that nothing is routed when sharding is not configured"""
+        with self.settings(SHARD_DATABASES=[]):
+            self.assertIsNone(
+                self.router.db_for_write(Tag, instance=Tag(user_id=1))
+            )
+
+
+@override_settings(SHARD_DATABASES=['default'])
+class ShardedApiTests(TestCase):
+
+    def setUp(self):
+        directory.clear()
+        self.addCleanup(directory.clear)
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_and_list_on_shard(self):
+        """Test that the experience API works with sharding enabled"""
+        tag = self.client.post(TAGS_URL, {'name': 'Hiking'}).data
+        location = self.client.post(
+            LOCATIONS_URL, {'name': 'Park', 'description': 'Green'}
+        ).data
+        res = self.client.post(EXPERIENCES_URL, {
+            'title': 'Trail',
+            'time_minutes': 60,
+            'price': '5.00',
+            'tags': [tag['id']],
+            'location': location['id'],
+        })
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(
+            UserShard.objects.get(user=self.user).alias, 'default'
+        )
+        res = self.client.get(EXPERIENCES_URL)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['tags'], [tag['id']])
+
+    def test_request_user_reset(self):
+        """Test that the shard user is cleared after the request"""
+        self.client.get(TAGS_URL)
+
+        self.assertIsNone(shard_user.get())
+
+
+@override_settings(SHARD_DATABASES=SHARDS, SHARD_MOVE_GRACE=0)
+class ShardMoveTests(TestCase):
+    databases = {'default', *SHARDS}
+
+    def setUp(self):
+        directory.clear()
+        self.addCleanup(directory.clear)
+        self.user = create_user()
+        self.source = directory.get(self.user.pk)
+        self.target = SHARDS[1 - SHARDS.index(self.source)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_experience(self):
+        tag = self.client.post(TAGS_URL, {'name': 'Hiking'}).data
+        location = self.client.post(
+            LOCATIONS_URL, {'name': 'Park', 'description': 'Green'}
+        ).data
+        return self.client.post(EXPERIENCES_URL, {
+            'title': 'Trail',
+            'time_minutes': 60,
+            'price': '5.00',
+            'tags': [tag['id']],
+            'location': location['id'],
+        }).data
+
+    def count_rows(self, alias):
+        User = get_user_model()
+        return {
+            model._meta.model_name: model._base_manager.using(alias)
+            .filter(**{lookup: self.user.pk}).count()
+            for model, lookup in (
+                (User, 'pk'), (Tag, 'user'), (Location, 'user'),
+                (Experience, 'user'),
+                (Experience.tags.through, 'experience__user'),
+            )
+        }
+
+    def test_migrate_shards(self):
+        """Test that migrate_shards brings every shard up to date"""
+        out = StringIO()
+        call_command('migrate_shards', verbosity=0, stdout=out)
+
+        for alias in SHARDS:
+            self.assertIn(f'Migrating {alias}', out.getvalue())
+            self.assertIn(
+                Experience._meta.db_table,
+                connections[alias].introspection.table_names()
+            )
+
+    def test_rows_written_to_user_shard(self):
+        """Test that API writes go to the user's shard only"""
+        self.create_experience()
+
+        self.assertEqual(set(self.count_rows(self.source).values()), {1})
+        self.assertEqual(set(self.count_rows(self.target).values()), {0})
+
+    def test_move_user(self):
+        """Test that moving a user copies their rows and reroutes them"""
+        experience = self.create_experience()
+
+        call_command('rebalance_shards', user=self.user.pk, to=self.target,
+                     stdout=StringIO())
+
+        self.assertEqual(set(self.count_rows(self.source).values()), {0})
+        self.assertEqual(set(self.count_rows(self.target).values()), {1})
+        shard = UserShard.objects.get(user=self.user)
+        self.assertEqual((shard.alias, shard.moving), (self.target, False))
+        self.assertEqual(directory.get(self.user.pk), self.target)
+
+        res = self.client.get(EXPERIENCES_URL)
+        self.assertEqual([row['id'] for row in res.data], [experience['id']])
+        self.assertEqual(res.data[0]['tags'], experience['tags'])
+
+    def test_stale_directory_refreshed_by_requests(self):
+        """Test that a worker with an outdated entry writes to the new shard"""
+        call_command('rebalance_shards', user=self.user.pk, to=self.target,
+                     stdout=StringIO())
+        # This worker still has the entry from before the move
+        directory.set(self.user.pk, self.source)
+
+        self.client.post(TAGS_URL, {'name': 'Hiking'})
+
+        self.assertEqual(self.count_rows(self.target)['tag'], 1)
+        self.assertEqual(self.count_rows(self.source)['tag'], 0)
+
+    def test_writes_rejected_while_moving(self):
+        """Test that the user's writes wait for the move to finish"""
+        UserShard.objects.filter(user=self.user).update(moving=True)
+
+        res = self.client.post(TAGS_URL, {'name': 'Hiking'})
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+
+    def test_rebalance_evens_out_users(self):
+        """Test that rebalancing moves users from the fuller shard"""
+        other = create_user('other@website.com')
+        UserShard.objects.filter(user=other).update(alias=self.source)
+        directory.clear()
+
+        call_command('rebalance_shards', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(UserShard.objects.values_list('alias', flat=True)),
+            sorted(SHARDS)
+        )
+        self.assertEqual(
+            get_user_model()._base_manager.using(self.target)
+            .filter(pk=other.pk).count(), 1
+        )
+
+
+@override_settings(SHARD_MOVE_GRACE=0)
+class ShardingEnabledLaterTests(TestCase):
+    databases = {'default', *SHARDS}
+
+    def setUp(self):
+        directory.clear()
+        self.addCleanup(directory.clear)
+        # Created before sharding was enabled
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SHARD_DATABASES=SHARDS)
+    def test_user_without_rows_writes_to_shard(self):
+        """Test that an existing user without rows can write to a shard"""
+        res = self.client.post(TAGS_URL, {'name': 'Hiking'})
+
+        self.assertEqual(res.status_code, 201)
+        alias = UserShard.objects.get(user=self.user).alias
+        self.assertIn(alias, SHARDS)
+        self.assertTrue(
+            Tag._base_manager.using(alias).filter(user=self.user).exists()
+        )
+
+    def test_user_with_rows_moved_by_rebalance(self):
+        """Test that rows from before sharding are served, then moved"""
+        old = self.client.post(TAGS_URL, {'name': 'Hiking'}).data
+
+        with self.settings(SHARD_DATABASES=SHARDS):
+            res = self.client.post(TAGS_URL, {'name': 'Biking'})
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(
+                UserShard.objects.get(user=self.user).alias, 'default'
+            )
+
+            call_command('rebalance_shards', stdout=StringIO())
+
+            alias = UserShard.objects.get(user=self.user).alias
+            self.assertIn(alias, SHARDS)
+            self.assertEqual(
+                Tag._base_manager.using(alias).filter(user=self.user)
+                .count(), 2
+            )
+            self.assertFalse(
+                Tag._base_manager.using('default').filter(user=self.user)
+                .exists()
+            )
+            ids = [row['id'] for row in self.client.get(TAGS_URL).data]
+            self.assertEqual(sorted(ids), [old['id'], res.data['id']])
+
+    def test_unseen_user_with_rows_moved_by_rebalance(self):
+        """Test that rebalancing finds users without a directory row"""
+        Tag.objects.create(user=self.user, name='Hiking')
+
+        with self.settings(SHARD_DATABASES=SHARDS):
+            call_command('rebalance_shards', stdout=StringIO())
+
+            alias = UserShard.objects.get(user=self.user).alias
+        self.assertIn(alias, SHARDS)
+        self.assertEqual(
+            Tag._base_manager.using(alias).filter(user=self.user).count(), 1
+        )
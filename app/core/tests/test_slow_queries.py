@@ -0,0 +1,76 @@
+import json
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.instrumentation import fingerprint, slow_queries
+
+
+EXPERIENCE_URL = reverse('experience:experience-list')
+SLOW_QUERIES_URL = reverse('slow-queries')
+
+
+class FingerprintTests(TestCase):
+
+    def test_in_lists_collapse(self):
+        """Test that IN lists of any length share a fingerprint"""
+        one = fingerprint('SELECT * FROM t WHERE id IN (%s)')
+        three = fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)')
+
+        self.assertEqual(one, three)
+        self.assertEqual(one[1], 'SELECT * FROM t WHERE id IN (...)')
+
+    def test_literals_replaced(self):
+        """Test that string and number literals are normalized"""
+        digest, normalized = fingerprint(
+            "SELECT * FROM t WHERE name = 'x'  AND  price > 10.5"
+        )
+
+        self.assertEqual(
+            normalized, 'SELECT * FROM t WHERE name = ? AND price > ?'
+        )
+
+
+@override_settings(SLOW_QUERY_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryMiddlewareTests(TestCase):
+
+    def setUp(self):
+        slow_queries.clear()
+        self.user = get_user_model().objects.create_superuser(
+            'admin@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_slow_query_logged_with_context(self):
+        """Test that slow statements are logged with view and user"""
+        with self.assertLogs('core.slow_queries', level='WARNING') as logs:
+            self.client.get(EXPERIENCE_URL, {'tags': '1,2,3'})
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'experience:experience-list')
+        self.assertEqual(line['user'], self.user.id)
+        self.assertIn('IN (...)', line['sql'])
+
+    def test_aggregated_by_fingerprint(self):
+        """Test that repeated statements are counted once per fingerprint"""
+        with self.assertLogs('core.slow_queries', level='WARNING'):
+            self.client.get(EXPERIENCE_URL, {'tags': '1'})
+            self.client.get(EXPERIENCE_URL, {'tags': '1,2'})
+
+        summary = slow_queries.summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['count'], 2)
+        self.assertTrue(summary[0]['plan'])
+
+    def test_summary_endpoint(self):
+        """Test that staff can list the aggregated slow statements"""
+        with self.assertLogs('core.slow_queries', level='WARNING'):
+            self.client.get(EXPERIENCE_URL)
+
+        res = self.client.get(SLOW_QUERIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['views'], ['experience:experience-list'])
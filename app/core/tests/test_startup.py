@@ -0,0 +1,23 @@
+from django.test import SimpleTestCase
+from core.management.commands.startup_report import parse_importtime
+
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       150 |        150 |   django.utils.version
+import time:       300 |        450 | django
+import time:      1200 |       1200 | yaml
+"""
+
+
+class StartupReportTests(SimpleTestCase):
+
+    def test_parse_importtime(self):
+        """Test that -X importtime output is parsed into seconds"""
+        modules = parse_importtime(IMPORTTIME_OUTPUT)
+
+        self.assertEqual(modules, [
+            ('django.utils.version', 0.00015, 0.00015, 1),
+            ('django', 0.0003, 0.00045, 0),
+            ('yaml', 0.0012, 0.0012, 0),
+        ])
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Convert a rate like '5/min' into a (requests, seconds) tuple"""
+    if not rate:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class SlidingWindowStore:
+    """Thread safe in-process store of request timestamps per key.
+
+    Keys are kept in order of their last hit and dropped once their hits
+    have expired. At most max_keys are kept; beyond that the least
+    recently hit key is forgotten, so keys chosen by clients cannot grow
+    the store without bound.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, duration):
+        """Record a hit for a key if it is within the limit.
+
+        Returns a tuple of whether the hit was allowed and the number of
+        seconds until the next hit would be allowed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            window, _ = self._windows.pop(key, (deque(), duration))
+            while window and window[0] <= now - duration:
+                window.popleft()
+            if len(window) >= limit:
+                self._windows[key] = (window, duration)
+                return False, window[0] + duration - now
+            window.append(now)
+            self._windows[key] = (window, duration)
+            self._sweep(now)
+            return True, 0
+
+    def _sweep(self, now):
+        """Drop expired keys, then the oldest ones over max_keys"""
+        while self._windows:
+            key, (window, duration) = next(iter(self._windows.items()))
+            if window[-1] > now - duration and \
+                    len(self._windows) <= self.max_keys:
+                return
+            del self._windows[key]
+
+    def __len__(self):
+        return len(self._windows)
+
+    def clear(self):
+        """Forget every recorded hit"""
+        with self._lock:
+            self._windows.clear()
+
+
+class TokenBucketStore:
+    """Thread safe in-process token buckets per key"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, duration):
+        """Take a token from the bucket for a key.
+
+        The bucket holds up to capacity tokens and refills completely over
+        duration seconds. Returns a tuple of whether a token was taken, the
+        tokens remaining and the seconds until the next token is available.
+        """
+        rate = capacity / duration
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False, 0, (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            return True, int(tokens - 1), 0
+
+    def clear(self):
+        """Forget every bucket"""
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheTokenBucketStore:
+    """Token buckets shared between workers through a Django cache.
+
+    Django caches have no compare-and-swap, so the bucket is approximated
+    with a fixed window counter per key using the atomic incr() of the
+    backend.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def consume(self, key, capacity, duration):
+        now = time.time()
+        window = int(now // duration)
+        cache_key = f'throttle:{key}:{window}'
+        self.cache.add(cache_key, 0, duration)
+        try:
+            count = self.cache.incr(cache_key)
+        except ValueError:
+            # The key expired between add() and incr()
+            self.cache.add(cache_key, 1, duration)
+            count = 1
+        if count > capacity:
+            return False, 0, (window + 1) * duration - now
+        return True, capacity - count, 0
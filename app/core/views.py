@@ -0,0 +1,58 @@
+import os
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from rest_framework import authentication, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication
+from core.instrumentation import slow_queries
+from core.metrics import registry
+
+
+def metrics(request):
+    """Expose the collected metrics in the Prometheus text format"""
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class ProfileReportView(APIView):
+    """Download a request profile report"""
+    authentication_classes = (
+        CachedTokenAuthentication,
+        authentication.SessionAuthentication,
+    )
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, report_id):
+        """Return the text report, or the pstats dump with ?download=prof"""
+        # Not ?format=, which DRF reserves for choosing the renderer
+        ext = 'prof' if request.query_params.get('download') == 'prof' \
+            else 'txt'
+        path = os.path.join(
+            settings.PROFILE_REPORT_DIR, f'{report_id}.{ext}'
+        )
+        if not os.path.exists(path):
+            raise Http404()
+        return FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=f'{report_id}.{ext}'
+        )
+
+
+class SlowQueryView(APIView):
+    """List this worker's slow statements aggregated by fingerprint"""
+    authentication_classes = (
+        CachedTokenAuthentication,
+        authentication.SessionAuthentication,
+    )
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(slow_queries.summary())
@@ -1,21 +1,40 @@
+from decimal import Decimal
 from rest_framework import serializers
-from core.models import Tag, Location, Experience
+from core.models import Tag, Location, Experience, UserStats
 
 class TagSerializer(serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
         model = Tag
-        fields = ('id', 'name',)
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'experience_count')
+        read_only_fields = ('id', 'experience_count')
 
 class LocationSerializer(serializers.ModelSerializer):
     """Serializer for location objects"""
+    # Only set by ?near= searches, in km
+    distance = serializers.FloatField(read_only=True)
 
     class Meta:
         model= Location
-        fields = ['id', 'name', 'description']
-        read_only_fields = ['id']
+        fields = [
+            'id', 'name', 'description', 'latitude', 'longitude',
+            'experience_count', 'distance'
+        ]
+        read_only_fields = ['id', 'experience_count']
+
+    def validate(self, attrs):
+        latitude = attrs.get(
+            'latitude', getattr(self.instance, 'latitude', None)
+        )
+        longitude = attrs.get(
+            'longitude', getattr(self.instance, 'longitude', None)
+        )
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                'Set both latitude and longitude, or neither.'
+            )
+        return attrs
 
 class ExperienceSerializer(serializers.ModelSerializer):
     """Serializer for experience objects"""
@@ -26,11 +45,18 @@ class ExperienceSerializer(serializers.ModelSerializer):
         many=True,
         queryset=Tag.objects.all()
     )
+    # Only set by ?near= searches, in km
+    distance = serializers.FloatField(read_only=True)
+    # Only set for related experiences
+    score = serializers.FloatField(read_only=True)
 
 
     class Meta:
         model = Experience
-        fields = ['id', 'title', 'time_minutes', 'price', 'website', 'location', 'tags']
+        fields = [
+            'id', 'title', 'time_minutes', 'price', 'website', 'location',
+            'tags', 'distance', 'score'
+        ]
         read_only_field = ['id']
 
 class ExperienceDetailSerializer(ExperienceSerializer):
@@ -46,3 +72,23 @@ class ExperienceImageSerializer(serializers.ModelSerializer):
         model = Experience
         fields = ['id', 'image']
         read_only_fields = ['id']
+
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    """Serializer for the experience totals of a user"""
+    average_price = serializers.SerializerMethodField()
+    locations = LocationSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'experience_count', 'total_price', 'average_price',
+            'total_minutes', 'locations'
+        ]
+        read_only_fields = fields
+
+    def get_average_price(self, obj):
+        if not obj.experience_count:
+            return None
+        average = obj.total_price / obj.experience_count
+        return str(average.quantize(Decimal('0.01')))
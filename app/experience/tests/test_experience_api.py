@@ -1,9 +1,10 @@
 from logging import StreamHandler
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from core import related
 from core.models import Experience, Location, Tag
 from experience.serializers import ExperienceSerializer, ExperienceDetailSerializer
 import tempfile
@@ -12,12 +13,19 @@ from PIL import Image
 
 
 EXPERIENCE_URL = reverse('experience:experience-list')
+BATCH_URL = reverse('experience:experience-batch')
+STATS_URL = reverse('experience:experience-stats')
 
 def image_upload_url(experience_id):
     """Return URL for experience upload"""
     return reverse('experience:experience-upload-image', args=[experience_id])
 
 
+def related_url(experience_id):
+    """Return the related experiences URL"""
+    return reverse('experience:experience-related', args=[experience_id])
+
+
 def detail_url(experience_id):
     """Return experience detail URL"""
     return reverse('experience:experience-detail', args=[experience_id])
@@ -113,6 +121,8 @@ class PrivateExperienceApiTests(TestCase):
 
         res = self.client.get(url)
 
+        # Reload the location and tags with their experience counts
+        experience = Experience.objects.get(id=experience.id)
         serializer = ExperienceDetailSerializer(experience)
 
         self.assertEqual(serializer.data, res.data)
@@ -245,6 +255,154 @@ class PrivateExperienceApiTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+    def test_batch_retrieve_keeps_order(self):
+        """Test retrieving many experience details in the requested order"""
+        experience1 = sample_experience(user=self.user, title='Tennis')
+        experience2 = sample_experience(user=self.user, title='Pickleball')
+        experience2.tags.add(sample_tag(user=self.user))
+
+        res = self.client.get(
+            BATCH_URL, {'ids': f'{experience2.id},{experience1.id}'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            ExperienceDetailSerializer(Experience.objects.get(id=id)).data
+            for id in (experience2.id, experience1.id)
+        ])
+        self.assertEqual(res.data['not_found'], [])
+
+    def test_batch_reports_missing_and_forbidden(self):
+        """Test that unknown and other users' IDs are reported missing"""
+        other = get_user_model().objects.create_user(
+            'other@website.com',
+            'testpass'
+        )
+        mine = sample_experience(user=self.user)
+        theirs = sample_experience(user=other)
+
+        res = self.client.get(
+            BATCH_URL, {'ids': f'{theirs.id},{mine.id},999999'}
+        )
+
+        self.assertEqual([row['id'] for row in res.data['results']],
+                         [mine.id])
+        self.assertEqual(res.data['not_found'], [theirs.id, 999999])
+
+    def test_batch_constant_queries(self):
+        """Test that the batch size does not change the number of queries"""
+        ids = []
+        for i in range(5):
+            experience = sample_experience(user=self.user)
+            experience.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            ids.append(str(experience.id))
+
+        # Location with select_related, tags with one prefetch query
+        with self.assertNumQueries(2):
+            self.client.get(BATCH_URL, {'ids': ','.join(ids)})
+
+    @override_settings(EXPERIENCE_BATCH_MAX=2)
+    def test_batch_size_capped(self):
+        """Test that too many IDs are rejected"""
+        res = self.client.get(BATCH_URL, {'ids': '1,2,3'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_invalid_ids(self):
+        """Test that malformed IDs are rejected"""
+        res = self.client.get(BATCH_URL, {'ids': '1,two'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stats(self):
+        """Test retrieving the experience totals of the user"""
+        park = sample_location(user=self.user, name='Park')
+        sample_location(user=self.user, name='Unused')
+        sample_experience(user=self.user, price=10, time_minutes=20)
+        sample_experience(user=self.user, location=park, price=5,
+                          time_minutes=40)
+        sample_experience(user=self.user, location=park, price=6,
+                          time_minutes=10)
+        other = get_user_model().objects.create_user(
+            'other@website.com',
+            'testpass'
+        )
+        sample_experience(user=other, price=100)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['experience_count'], 3)
+        self.assertEqual(res.data['total_price'], '21.00')
+        self.assertEqual(res.data['average_price'], '7.00')
+        self.assertEqual(res.data['total_minutes'], 70)
+        self.assertEqual(
+            [(row['name'], row['experience_count'])
+             for row in res.data['locations']],
+            [('Park', 2), ('Anchorage Park', 1)]
+        )
+
+    def test_filter_experiences_near(self):
+        """Test returning experiences at locations near a point"""
+        near = sample_experience(user=self.user, location=sample_location(
+            user=self.user, latitude=26.79, longitude=-80.10
+        ))
+        sample_experience(user=self.user, location=sample_location(
+            user=self.user, latitude=28.00, longitude=-80.10
+        ))
+        sample_experience(user=self.user)
+
+        res = self.client.get(EXPERIENCE_URL, {'near': '26.78,-80.10'})
+
+        self.assertEqual([row['id'] for row in res.data], [near.id])
+        self.assertIn('distance', res.data[0])
+
+    def test_related_experiences(self):
+        """Test listing the experiences most like another"""
+        related.get_cache().clear()
+        tennis = sample_tag(user=self.user, name='Tennis')
+        golf = sample_tag(user=self.user, name='Golf')
+        experience = sample_experience(user=self.user)
+        experience.tags.add(tennis, golf)
+        same = sample_experience(user=self.user)
+        same.tags.add(tennis, golf)
+        half = sample_experience(user=self.user)
+        half.tags.add(tennis)
+
+        res = self.client.get(related_url(experience.id), {'limit': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data], [same.id, half.id])
+        self.assertGreater(res.data[0]['score'], res.data[1]['score'])
+
+    def test_related_other_users_experience(self):
+        """Test that other users' experiences have no related list"""
+        other = get_user_model().objects.create_user(
+            'other@website.com',
+            'testpass'
+        )
+        experience = sample_experience(user=other)
+
+        res = self.client.get(related_url(experience.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_related_invalid_limit(self):
+        """Test that the limit must be within RELATED_TOP_K"""
+        experience = sample_experience(user=self.user)
+
+        res = self.client.get(related_url(experience.id), {'limit': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stats_without_experiences(self):
+        """Test the totals of a user without experiences"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['experience_count'], 0)
+        self.assertIsNone(res.data['average_price'])
+        self.assertEqual(res.data['locations'], [])
         
         
 
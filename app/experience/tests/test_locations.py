@@ -3,7 +3,8 @@ from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
-from core.models import Location
+from core import geo
+from core.models import Location, Experience
 from experience.serializers import LocationSerializer
 
 LOCATIONS_URL = reverse('experience:location-list')
@@ -93,3 +94,107 @@ class PrivateLocationsApiTests(TestCase):
         res = self.client.post(LOCATIONS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_locations_assigned_only(self):
+        """Test filtering locations by those used by experiences"""
+        used = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        Location.objects.create(
+            user=self.user, name='Beach', description='Sandy'
+        )
+        Experience.objects.create(
+            user=self.user, title='Hike', time_minutes=60, price=0,
+            location=used
+        )
+
+        res = self.client.get(LOCATIONS_URL, {
+            'assigned_only': 1, 'ordering': 'popular'
+        })
+
+        self.assertEqual([location['id'] for location in res.data], [used.id])
+        self.assertEqual(res.data[0]['experience_count'], 1)
+
+    def test_create_location_with_coordinates(self):
+        """Test that locations with coordinates get a geohash"""
+        payload = {
+            'name': 'Dyer Park',
+            'description': 'Park',
+            'latitude': 26.7862,
+            'longitude': -80.1040
+        }
+
+        res = self.client.post(LOCATIONS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        location = Location.objects.get(id=res.data['id'])
+        self.assertEqual(location.geohash, geo.encode(26.7862, -80.1040))
+
+    def test_create_location_half_coordinates(self):
+        """Test that latitude and longitude must be set together"""
+        payload = {'name': 'Park', 'description': 'Park', 'latitude': 26.8}
+
+        res = self.client.post(LOCATIONS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_locations_near(self):
+        """Test searching locations near a point, nearest first"""
+        far = Location.objects.create(
+            user=self.user, name='Far', description='',
+            latitude=26.90, longitude=-80.10
+        )
+        near = Location.objects.create(
+            user=self.user, name='Near', description='',
+            latitude=26.79, longitude=-80.10
+        )
+        Location.objects.create(
+            user=self.user, name='Away', description='',
+            latitude=27.50, longitude=-80.10
+        )
+        Location.objects.create(user=self.user, name='Nowhere',
+                                description='')
+
+        res = self.client.get(LOCATIONS_URL, {
+            'near': '26.78,-80.10', 'radius': 20
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data], [near.id, far.id])
+        self.assertAlmostEqual(res.data[0]['distance'], 1.11, places=2)
+
+    def test_locations_near_invalid(self):
+        """Test that malformed near searches are rejected"""
+        for params in ({'near': 'here'}, {'near': '91,0'},
+                       {'near': '0,0', 'radius': 100000}):
+            res = self.client.get(LOCATIONS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_locations(self):
+        """Test searching locations by case insensitive name prefix"""
+        canyon = Location.objects.create(
+            user=self.user, name='Grand Canyon', description=''
+        )
+        teton = Location.objects.create(
+            user=self.user, name='grand Teton', description=''
+        )
+        Location.objects.create(user=self.user, name='Glacier',
+                                description='')
+
+        res = self.client.get(LOCATIONS_URL, {'prefix': 'GRAND'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data],
+                         [canyon.id, teton.id])
+
+        res = self.client.get(LOCATIONS_URL, {'prefix': 'gr'})
+
+        self.assertEqual([row['id'] for row in res.data],
+                         [canyon.id, teton.id])
+
+        canyon.name = 'Zion'
+        canyon.save()
+        res = self.client.get(LOCATIONS_URL, {'prefix': 'gr'})
+
+        self.assertEqual([row['id'] for row in res.data], [teton.id])
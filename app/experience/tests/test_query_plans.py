@@ -0,0 +1,184 @@
+"""Query plan regression tests for the experience API.
+
+These seed a representative dataset, capture the SQL each endpoint runs
+and check the PostgreSQL plans. They only run against PostgreSQL, e.g.
+
+    docker-compose run app sh -c "python manage.py wait_for_db &&
+        python manage.py test experience.tests.test_query_plans"
+"""
+import json
+import unittest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import geo
+from core.models import Experience, Location, Tag
+
+
+USERS = 200
+TAGS_PER_USER = 10
+LOCATIONS_PER_USER = 10
+EXPERIENCES_PER_USER = 50
+
+# Tables that must always be reached through an index
+INDEXED_TABLES = {
+    Experience._meta.db_table,
+    Experience.tags.through._meta.db_table,
+    Tag._meta.db_table,
+    Location._meta.db_table,
+}
+COST_CEILING = 1000
+
+
+def explain_json(sql):
+    """Return the JSON plan of an executed statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def plan_nodes(plan):
+    """Yield every node of a plan tree"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql',
+    'Query plans are only checked on PostgreSQL'
+)
+class ExperienceQueryPlanTests(TestCase):
+    """Test that the hot endpoint queries keep using indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f'user{i}@website.com', password='!')
+            for i in range(USERS)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag {i}')
+            for user in users for i in range(TAGS_PER_USER)
+        )
+        locations = Location.objects.bulk_create(
+            Location(
+                user=user, name=f'location {i}', description='',
+                latitude=lat, longitude=lng, geohash=geo.encode(lat, lng)
+            )
+            for u, user in enumerate(users)
+            for i in range(LOCATIONS_PER_USER)
+            for lat, lng in [(25 + (u * 7 + i) % 24, -125 + (u * 13 + i) % 58)]
+        )
+        experiences = Experience.objects.bulk_create(
+            Experience(
+                user=user,
+                title=f'experience {i}',
+                time_minutes=30,
+                price=10,
+                location=locations[u * LOCATIONS_PER_USER +
+                                   i % LOCATIONS_PER_USER]
+            )
+            for u, user in enumerate(users)
+            for i in range(EXPERIENCES_PER_USER)
+        )
+        through = Experience.tags.through
+        through.objects.bulk_create(
+            through(
+                experience=experience,
+                tag=tags[(i // EXPERIENCES_PER_USER) * TAGS_PER_USER +
+                         (i + offset) % TAGS_PER_USER]
+            )
+            for i, experience in enumerate(experiences)
+            for offset in (0, 1)
+        )
+        with connection.cursor() as cursor:
+            for table in INDEXED_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+        cls.user = users[USERS // 2]
+        cls.tag_ids = [
+            tag.id for tag in tags if tag.user_id == cls.user.id
+        ][:2]
+        cls.location_ids = [
+            loc.id for loc in locations if loc.user_id == cls.user.id
+        ][:2]
+        cls.experience = Experience.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_plans(self, url, params=None):
+        """Check the plan of every SELECT the endpoint runs"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params or {})
+        self.assertEqual(res.status_code, 200)
+
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = explain_json(sql)
+            for node in plan_nodes(plan):
+                if node['Node Type'] == 'Seq Scan':
+                    self.assertNotIn(
+                        node.get('Relation Name'), INDEXED_TABLES,
+                        f'Sequential scan in plan for {sql}'
+                    )
+            self.assertLess(
+                plan['Total Cost'], COST_CEILING,
+                f'Estimated cost too high for {sql}'
+            )
+
+    def test_tag_list_plan(self):
+        """Test the tag list query plan"""
+        self.assert_plans(reverse('experience:tag-list'))
+
+    def test_location_list_plan(self):
+        """Test the location list query plan"""
+        self.assert_plans(reverse('experience:location-list'))
+
+    def test_experience_list_plan(self):
+        """Test the experience list query plan"""
+        self.assert_plans(reverse('experience:experience-list'))
+
+    def test_experience_tag_filter_plan(self):
+        """Test the plan of filtering experiences by tags"""
+        self.assert_plans(
+            reverse('experience:experience-list'),
+            {'tags': ','.join(str(i) for i in self.tag_ids)}
+        )
+
+    def test_experience_location_filter_plan(self):
+        """Test the plan of filtering experiences by locations"""
+        self.assert_plans(
+            reverse('experience:experience-list'),
+            {'locations': ','.join(str(i) for i in self.location_ids)}
+        )
+
+    def test_experience_detail_plan(self):
+        """Test the experience detail query plan"""
+        self.assert_plans(
+            reverse('experience:experience-detail', args=[self.experience.id])
+        )
+
+    def test_location_near_plan(self):
+        """Test the plan of searching locations near a point"""
+        self.assert_plans(
+            reverse('experience:location-list'),
+            {'near': '40,-100', 'radius': 50}
+        )
+
+    def test_experience_near_plan(self):
+        """Test the plan of searching experiences near a point"""
+        self.assert_plans(
+            reverse('experience:experience-list'),
+            {'near': '40,-100', 'radius': 50}
+        )
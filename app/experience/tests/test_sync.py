@@ -0,0 +1,195 @@
+import time
+from unittest.mock import MagicMock, patch
+from django.contrib.auth import get_user_model
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import ChangeId, Experience, Location, Tag, Tombstone
+from core.sync import make_sync_token, parse_sync_token, sync_horizon
+
+
+TAGS_URL = reverse('experience:tag-list')
+EXPERIENCE_URL = reverse('experience:experience-list')
+
+
+@override_settings(SYNC_SAFETY_MARGIN=0)
+class DeltaSyncApiTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+
+    def sync(self, url, token='0'):
+        """Return the changes since a token and the token to use next"""
+        res = self.client.get(url, {'since': token})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data, res.data['sync_token']
+
+    def test_full_sync(self):
+        """Test that since=0 returns every row and a sync token"""
+        tag = Tag.objects.create(user=self.user, name='Hiking')
+
+        res = self.client.get(TAGS_URL, {'since': '0'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data['changed']],
+                         [tag.id])
+        self.assertEqual(res.data['deleted'], [])
+        self.assertTrue(res.data['sync_token'])
+
+    def test_changes_since_token(self):
+        """Test that only rows changed since the token are returned"""
+        old = Tag.objects.create(user=self.user, name='Hiking')
+        gone = Tag.objects.create(user=self.user, name='Biking')
+        _, token = self.sync(TAGS_URL)
+        new = Tag.objects.create(user=self.user, name='Sailing')
+        gone_id = gone.id
+        gone.delete()
+
+        data, _ = self.sync(TAGS_URL, token)
+
+        self.assertEqual([row['id'] for row in data['changed']], [new.id])
+        self.assertEqual(data['deleted'], [gone_id])
+        self.assertNotIn(old.id, [row['id'] for row in data['changed']])
+
+    def test_counter_changes_since_token(self):
+        """Test that rows whose counters change are sent again"""
+        tag = Tag.objects.create(user=self.user, name='Hiking')
+        _, token = self.sync(TAGS_URL)
+
+        Experience.objects.create(
+            user=self.user, title='Trail', time_minutes=30, price=5,
+            location=self.location
+        ).tags.add(tag)
+
+        data, _ = self.sync(TAGS_URL, token)
+        self.assertEqual([row['id'] for row in data['changed']], [tag.id])
+        self.assertEqual(data['changed'][0]['experience_count'], 1)
+
+    def test_other_users_deletions_hidden(self):
+        """Test that tombstones of other users are not returned"""
+        other = get_user_model().objects.create_user(
+            'other@website.com', 'testpass'
+        )
+        Tag.objects.create(user=other, name='Hiking').delete()
+
+        res = self.client.get(TAGS_URL, {'since': '0'})
+
+        self.assertEqual(res.data['deleted'], [])
+
+    def test_token_never_decreases(self):
+        """Test that a token ahead of the database is handed back unchanged"""
+        ahead = make_sync_token(time.time_ns(), 'default')
+
+        res = self.client.get(TAGS_URL, {'since': ahead})
+
+        self.assertEqual(res.data['sync_token'], ahead)
+
+    @override_settings(SYNC_SAFETY_MARGIN=60)
+    def test_token_lags_clock(self):
+        """Test that the token leaves room for slow transactions"""
+        res = self.client.get(TAGS_URL, {'since': '0'})
+
+        change_id, _, alias = parse_sync_token(res.data['sync_token'])
+        self.assertLessEqual(change_id, (time.time() - 60) * 10 ** 6)
+        self.assertEqual(alias, 'default')
+
+    def test_invalid_token(self):
+        """Test that a malformed token is rejected"""
+        for token in ('yesterday', '-1.0.default', '1.2.'):
+            res = self.client.get(TAGS_URL, {'since': token})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_token(self):
+        """Test that tokens older than the tombstones are refused"""
+        token = make_sync_token(1, 'default', time.time() - 365 * 86400)
+
+        res = self.client.get(TAGS_URL, {'since': token})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_old_token(self):
+        """Test that clock based tokens are refused"""
+        res = self.client.get(TAGS_URL, {'since': '1700000000000000'})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_token_from_other_database(self):
+        """Test that tokens from before a shard move are refused"""
+        token = make_sync_token(1, 'shard_1')
+
+        res = self.client.get(TAGS_URL, {'since': token})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_tag_changes_touch_experience(self):
+        """Test that changing an experience's tags marks it as changed"""
+        tag = Tag.objects.create(user=self.user, name='Hiking')
+        experience = Experience.objects.create(
+            user=self.user, title='Trail', time_minutes=30, price=5,
+            location=self.location
+        )
+        _, token = self.sync(EXPERIENCE_URL)
+
+        experience.tags.add(tag)
+
+        data, token = self.sync(EXPERIENCE_URL, token)
+        self.assertEqual([row['id'] for row in data['changed']],
+                         [experience.id])
+
+        tag.delete()
+
+        data, _ = self.sync(EXPERIENCE_URL, token)
+        self.assertEqual([row['id'] for row in data['changed']],
+                         [experience.id])
+
+    def test_user_deletion_leaves_no_tombstones(self):
+        """Test that deleting a user does not record its rows"""
+        Tag.objects.create(user=self.user, name='Hiking')
+
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class ChangeIdPostgresTests(SimpleTestCase):
+
+    def setUp(self):
+        self.connection = DatabaseWrapper({
+            'NAME': 'test', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None,
+            'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True,
+        })
+
+    def test_change_id_is_transaction_id(self):
+        """Test that rows take the ID of the transaction writing them"""
+        compiler = Tag.objects.all().query.get_compiler(
+            connection=self.connection
+        )
+
+        self.assertEqual(compiler.compile(ChangeId()),
+                         ('txid_current()', []))
+
+    def test_horizon_is_oldest_running_transaction(self):
+        """Test that the horizon comes from the transaction snapshot"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (1234,)
+        connection = MagicMock(vendor='postgresql')
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with patch('core.sync.connections', {'default': connection}):
+            self.assertEqual(sync_horizon('default'), 1234)
+
+        cursor.execute.assert_called_once_with(
+            'SELECT txid_snapshot_xmin(txid_current_snapshot())'
+        )
@@ -3,7 +3,7 @@ from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
-from core.models import Tag
+from core.models import Tag, Location, Experience
 from experience.serializers import TagSerializer
 
 TAGS_URL = reverse('experience:tag-list')
@@ -79,4 +79,95 @@ class PrivateTagsApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         
+    def test_retrieve_tags_assigned_only(self):
+        """Test filtering tags by those assigned to experiences"""
+        tag1 = Tag.objects.create(user=self.user, name='Outdoor')
+        tag2 = Tag.objects.create(user=self.user, name='Indoor')
+        location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        experience = Experience.objects.create(
+            user=self.user, title='Hike', time_minutes=60, price=0,
+            location=location
+        )
+        experience.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        tag1.refresh_from_db()
+        self.assertIn(TagSerializer(tag1).data, res.data)
+        self.assertNotIn(TagSerializer(tag2).data, res.data)
+
+    def test_retrieve_tags_by_popularity(self):
+        """Test ordering tags by the number of experiences using them"""
+        rare = Tag.objects.create(user=self.user, name='Rare')
+        popular = Tag.objects.create(user=self.user, name='Popular')
+        location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        for title in ('Hike', 'Run'):
+            experience = Experience.objects.create(
+                user=self.user, title=title, time_minutes=60, price=0,
+                location=location
+            )
+            experience.tags.add(popular)
+        experience.tags.add(rare)
+
+        res = self.client.get(TAGS_URL, {'ordering': 'popular'})
+
+        self.assertEqual([tag['id'] for tag in res.data],
+                         [popular.id, rare.id])
+        self.assertEqual(res.data[0]['experience_count'], 2)
+
+    def test_invalid_assigned_only(self):
+        """Test that a non numeric assigned_only is rejected"""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags(self):
+        """Test searching tags by case insensitive name prefix"""
+        Tag.objects.create(user=self.user, name='Sailing')
+        sand = Tag.objects.create(user=self.user, name='sandboarding')
+        safari = Tag.objects.create(user=self.user, name='SAFARI')
+        Tag.objects.create(user=self.user, name='Surfing')
+        other_user = get_user_model().objects.create_user(
+            'other@website.com',
+            'testpass2'
+        )
+        Tag.objects.create(user=other_user, name='Safari')
+
+        for prefix in ('Sa', 'sa', 'SA'):
+            res = self.client.get(TAGS_URL, {'prefix': prefix, 'limit': 2})
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual([tag['id'] for tag in res.data],
+                             [safari.id, Tag.objects.get(name='Sailing').id])
+
+        res = self.client.get(TAGS_URL, {'prefix': 'SANDb'})
+
+        self.assertEqual([tag['id'] for tag in res.data], [sand.id])
+
+    def test_autocomplete_assigned_only(self):
+        """Test that prefix searches combine with other filters"""
+        used = Tag.objects.create(user=self.user, name='Sports')
+        Tag.objects.create(user=self.user, name='Spa')
+        location = Location.objects.create(
+            user=self.user, name='Park', description='Green'
+        )
+        experience = Experience.objects.create(
+            user=self.user, title='Run', time_minutes=60, price=0,
+            location=location
+        )
+        experience.tags.add(used)
+
+        res = self.client.get(TAGS_URL, {'prefix': 's', 'assigned_only': 1})
+
+        self.assertEqual([tag['id'] for tag in res.data], [used.id])
+
+    def test_autocomplete_invalid_limit(self):
+        """Test that limits outside the allowed range are rejected"""
+        for limit in ('0', '51', 'many'):
+            res = self.client.get(TAGS_URL, {'prefix': 's', 'limit': limit})
 
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
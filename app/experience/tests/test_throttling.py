@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.throttling import TokenBucketStore
+from experience.throttling import local_buckets
+
+
+TAGS_URL = reverse('experience:tag-list')
+LOCATIONS_URL = reverse('experience:location-list')
+
+
+class TokenBucketStoreTests(TestCase):
+
+    def test_bucket_empties_and_reports_wait(self):
+        """Test that the bucket rejects once its capacity is used"""
+        store = TokenBucketStore()
+
+        self.assertEqual(store.consume('k', 2, 60)[:2], (True, 1))
+        self.assertEqual(store.consume('k', 2, 60)[:2], (True, 0))
+        allowed, remaining, wait = store.consume('k', 2, 60)
+
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+
+
+@override_settings(EXPERIENCE_THROTTLE_READ_RATE='2/min',
+                   EXPERIENCE_THROTTLE_WRITE_RATE='1/min')
+class ExperienceThrottleTests(TestCase):
+
+    def setUp(self):
+        local_buckets.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@website.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rate_limit_headers(self):
+        """Test that responses report the remaining budget"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-RateLimit-Limit'], '2')
+        self.assertEqual(res['X-RateLimit-Remaining'], '1')
+
+    def test_reads_throttled(self):
+        """Test that reads beyond the budget get 429 with Retry-After"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    def test_write_budget_separate_from_reads(self):
+        """Test that writes do not consume the read budget"""
+        self.client.post(TAGS_URL, {'name': 'Outdoor'})
+        res = self.client.post(TAGS_URL, {'name': 'Indoor'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(
+            self.client.get(TAGS_URL).status_code,
+            status.HTTP_200_OK
+        )
+
+    def test_budgets_per_endpoint(self):
+        """Test that each endpoint has its own bucket"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(LOCATIONS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+from core.throttling import CacheTokenBucketStore, TokenBucketStore, \
+                            parse_rate
+
+
+local_buckets = TokenBucketStore()
+
+
+def get_bucket_store():
+    """Return the shared bucket store if configured, else the local one"""
+    alias = settings.THROTTLE_CACHE_ALIAS
+    if alias:
+        return CacheTokenBucketStore(caches[alias])
+    return local_buckets
+
+
+class ExperienceRateThrottle(BaseThrottle):
+    """Token bucket per user and endpoint with separate read/write budgets"""
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            kind, rate = 'read', settings.EXPERIENCE_THROTTLE_READ_RATE
+        else:
+            kind, rate = 'write', settings.EXPERIENCE_THROTTLE_WRITE_RATE
+
+        self.wait_seconds = 0
+        capacity, duration = parse_rate(rate)
+        if capacity is None:
+            return True
+
+        key = f'{view.basename}:{kind}:{request.user.pk}'
+        allowed, remaining, wait = get_bucket_store().consume(
+            key, capacity, duration
+        )
+        request.rate_limit = (capacity, remaining)
+        self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class RateLimitHeadersMixin:
+    """Add X-RateLimit-* headers from the throttle state to responses.
+
+    Throttled responses also get Retry-After from DRF.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining = rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+        return response
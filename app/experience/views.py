@@ -1,22 +1,72 @@
+from django.conf import settings
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from core.models import Tag, Location, Experience
+from core.authentication import CachedTokenAuthentication
+from core.autocomplete import PrefixSearchMixin
+from core.db.sharding import ShardedViewMixin
+from core.geo import filter_near
+from core.related import related_to
+from core.idempotency import IdempotentCreateMixin
+from core.sync import DeltaSyncMixin
+from core.models import Tag, Location, Experience, UserStats
 from experience import serializers
+from experience.throttling import ExperienceRateThrottle, \
+                                  RateLimitHeadersMixin
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 
+def near_point(params):
+    """Return the latitude, longitude and radius of ?near=lat,lng&radius=km"""
+    near = params.get('near')
+    if not near:
+        return None
+    try:
+        latitude, longitude = (float(value) for value in near.split(','))
+        radius = float(params.get('radius', settings.GEO_DEFAULT_RADIUS_KM))
+    except ValueError:
+        raise ValidationError({'near': 'Expected near=<lat>,<lng>.'})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError({'near': 'Coordinates out of range.'})
+    if not 0 < radius <= settings.GEO_MAX_RADIUS_KM:
+        raise ValidationError({
+            'radius': f'Must be up to {settings.GEO_MAX_RADIUS_KM} km.'
+        })
+    return latitude, longitude, radius
 
-class BaseExperienceAttrViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
+
+class BaseExperienceAttrViewSet(ShardedViewMixin,
+                                RateLimitHeadersMixin,
+                                DeltaSyncMixin,
+                                PrefixSearchMixin,
+                                IdempotentCreateMixin,
+                                viewsets.GenericViewSet,
+                                mixins.ListModelMixin,
                                 mixins.CreateModelMixin):
     """Base Viewset for user owned experience attributes"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ExperienceRateThrottle]
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        try:
+            assigned_only = bool(
+                int(self.request.query_params.get('assigned_only', 0))
+            )
+        except ValueError:
+            raise ValidationError({'assigned_only': 'Expected 0 or 1.'})
+        queryset = self.queryset
+        if assigned_only:
+            queryset = queryset.filter(experience_count__gt=0)
+
+        if self.request.query_params.get('ordering') == 'popular':
+            ordering = ['-experience_count', '-name']
+        else:
+            ordering = ['-name']
+
+        return queryset.filter(user=self.request.user).order_by(*ordering)
     
     def perform_create(self, serializer):
         """Create an new object"""
@@ -34,12 +84,25 @@ class LocationViewSet(BaseExperienceAttrViewSet):
     queryset = Location.objects.all()
     serializer_class = serializers.LocationSerializer
 
-class ExperienceViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        """Return the user's locations, nearest first with ?near="""
+        queryset = super().get_queryset()
+        near = near_point(self.request.query_params)
+        if near:
+            queryset = filter_near(queryset, *near)
+        return queryset
+
+class ExperienceViewSet(ShardedViewMixin,
+                        RateLimitHeadersMixin,
+                        DeltaSyncMixin,
+                        IdempotentCreateMixin,
+                        viewsets.ModelViewSet):
     """Manage Experiences in the database"""
     serializer_class = serializers.ExperienceSerializer
     queryset = Experience.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ExperienceRateThrottle]
 
     def _params_to_ints(self, qs):
         """Convert a list of string IDs to a list of integers"""
@@ -59,12 +122,18 @@ class ExperienceViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(location__id__in=location_ids)
 
 
-        return queryset.filter(user=self.request.user).order_by('-id')
+        queryset = queryset.filter(user=self.request.user).order_by('-id')
+        near = near_point(self.request.query_params)
+        if near:
+            queryset = filter_near(queryset, *near, prefix='location__')
+        return queryset
     
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'batch'):
             return serializers.ExperienceDetailSerializer
+        elif self.action == 'stats':
+            return serializers.UserStatsSerializer
         elif self.action == 'upload_image':
             return serializers.ExperienceImageSerializer
         return self.serializer_class
@@ -73,6 +142,65 @@ class ExperienceViewSet(viewsets.ModelViewSet):
         """Create a new experience"""
         serializer.save(user=self.request.user)
     
+    @action(methods=['GET'], detail=False)
+    def batch(self, request):
+        """Retrieve the details of the experiences in ?ids=1,2,3"""
+        try:
+            ids = list(dict.fromkeys(
+                self._params_to_ints(request.query_params.get('ids', ''))
+            ))
+        except ValueError:
+            raise ValidationError({'ids': 'Expected comma separated IDs.'})
+        if len(ids) > settings.EXPERIENCE_BATCH_MAX:
+            raise ValidationError({
+                'ids': f'At most {settings.EXPERIENCE_BATCH_MAX} IDs.'
+            })
+
+        experiences = self.queryset.filter(user=request.user, id__in=ids) \
+            .select_related('location').prefetch_related('tags')
+        by_id = {experience.id: experience for experience in experiences}
+        found = [by_id[id] for id in ids if id in by_id]
+
+        return Response({
+            'results': self.get_serializer(found, many=True).data,
+            # Other users' experiences are reported as missing
+            'not_found': [id for id in ids if id not in by_id],
+        })
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Return the experience totals of the authenticated user"""
+        stats = UserStats.objects.filter(user=request.user).first() \
+            or UserStats(user=request.user)
+        stats.locations = Location.objects.filter(
+            user=request.user, experience_count__gt=0
+        ).order_by('-experience_count', 'name')
+
+        return Response(self.get_serializer(stats).data)
+
+    @action(methods=['GET'], detail=True)
+    def related(self, request, pk=None):
+        """Return the experiences most like this one, most similar first"""
+        experience = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= settings.RELATED_TOP_K:
+            raise ValidationError({
+                'limit': f'Must be between 1 and {settings.RELATED_TOP_K}.'
+            })
+
+        scores = dict(related_to(request.user.pk, experience.pk, limit))
+        experiences = self.queryset.filter(
+            user=request.user, id__in=scores
+        ).prefetch_related('tags')
+        for item in experiences:
+            item.score = scores[item.id]
+        ordered = sorted(experiences, key=lambda item: -item.score)
+
+        return Response(self.get_serializer(ordered, many=True).data)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to an experience"""
@@ -0,0 +1,74 @@
+import logging
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from user.throttling import login_attempts
+
+
+BENCH_EMAIL = 'bench-token@example.com'
+BENCH_PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the token endpoint under concurrent load"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        user = get_user_model().objects.create_user(
+            BENCH_EMAIL, BENCH_PASSWORD
+        )
+        try:
+            with override_settings(LOGIN_THROTTLE_IP_RATE=None,
+                                   LOGIN_THROTTLE_EMAIL_RATE=None):
+                self._run('unthrottled logins', options)
+            with override_settings(LOGIN_THROTTLE_IP_RATE='1000000/min',
+                                   LOGIN_THROTTLE_EMAIL_RATE='1/min'):
+                self._run('throttled burst', options)
+        finally:
+            user.delete()
+            login_attempts.clear()
+
+    def _run(self, name, options):
+        login_attempts.clear()
+        url = reverse('user:token')
+        payload = {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}
+
+        def worker(count):
+            client = Client(HTTP_HOST='localhost')
+            results = []
+            for _ in range(count):
+                start = time.perf_counter()
+                res = client.post(url, payload)
+                results.append((res.status_code, time.perf_counter() - start))
+            connections.close_all()
+            return results
+
+        concurrency = options['concurrency']
+        per_worker = max(options['requests'] // concurrency, 1)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            batches = list(executor.map(worker, [per_worker] * concurrency))
+        elapsed = time.perf_counter() - start
+
+        results = [result for batch in batches for result in batch]
+        latencies = sorted(latency for _, latency in results)
+        statuses = Counter(code for code, _ in results)
+        self.stdout.write(
+            f'{name}: {len(results) / elapsed:.1f} req/s, '
+            f'p50 {statistics.median(latencies) * 1000:.1f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms, '
+            f'statuses {dict(statuses)}'
+        )
@@ -40,6 +40,8 @@ class AuthTokenSerializer(serializers.Serializer):
         trim_whitespace=False
     )
 
+    rotate = serializers.BooleanField(required=False, default=False)
+
     def validate(self, attrs):
         """Validtate and authenticate the user"""
         email = attrs.get('email')
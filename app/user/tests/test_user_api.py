@@ -1,8 +1,14 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from core.throttling import SlidingWindowStore
+from user.throttling import login_attempts
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -17,6 +23,7 @@ class PublicUserApiTests(TestCase):
 
     def setUp(self):
         self.client = APIClient()
+        login_attempts.clear()
     
     def test_create_valid_user_success(self):
         """Test creating user with valid payload is successful"""
@@ -103,6 +110,101 @@ class PublicUserApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_token_reuses_existing(self):
+        """Test that repeated logins return the same token"""
+        payload = {'email': 'carl@website.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        first = self.client.post(TOKEN_URL, payload)
+        second = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(first.data['token'], second.data['token'])
+
+    def test_create_token_rotate(self):
+        """Test that rotate=true replaces the existing token"""
+        payload = {'email': 'carl@website.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        first = self.client.post(TOKEN_URL, payload)
+        second = self.client.post(TOKEN_URL, {**payload, 'rotate': True})
+
+        self.assertNotEqual(first.data['token'], second.data['token'])
+        self.assertEqual(Token.objects.count(), 1)
+
+    @override_settings(AUTH_TOKEN_MAX_AGE=60)
+    def test_create_token_expired_rotated(self):
+        """Test that a token older than the max age is replaced"""
+        payload = {'email': 'carl@website.com', 'password': 'testpass'}
+        user = create_user(**payload)
+        token = Token.objects.create(user=user)
+        Token.objects.filter(pk=token.pk).update(
+            created=timezone.now() - timedelta(seconds=120)
+        )
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertNotEqual(res.data['token'], token.key)
+
+    @override_settings(LOGIN_THROTTLE_EMAIL_RATE='2/min')
+    def test_create_token_throttled_per_email(self):
+        """Test that excess attempts are rejected before hashing"""
+        payload = {'email': 'carl@website.com', 'password': 'wrongpass'}
+        create_user(email='carl@website.com', password='testpass')
+        self.client.post(TOKEN_URL, payload)
+        self.client.post(TOKEN_URL, payload)
+
+        with patch('user.serializers.authenticate') as auth:
+            res = self.client.post(TOKEN_URL, payload)
+
+        auth.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    @override_settings(LOGIN_THROTTLE_IP_RATE='1/min')
+    def test_create_token_throttled_per_ip(self):
+        """Test that attempts from one IP are limited across emails"""
+        self.client.post(
+            TOKEN_URL,
+            {'email': 'a@website.com', 'password': 'x'}
+        )
+
+        res = self.client.post(
+            TOKEN_URL,
+            {'email': 'b@website.com', 'password': 'x'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_expired_attempts_forgotten(self):
+        """Test that emails whose attempts expired are dropped"""
+        with patch('core.throttling.time.monotonic', return_value=0):
+            for index in range(50):
+                self.client.post(
+                    TOKEN_URL,
+                    {'email': f'{index}@website.com', 'password': 'x'}
+                )
+        self.assertEqual(len(login_attempts), 51)
+
+        with patch('core.throttling.time.monotonic', return_value=61):
+            self.client.post(
+                TOKEN_URL,
+                {'email': 'last@website.com', 'password': 'x'}
+            )
+
+        self.assertEqual(len(login_attempts), 2)
+
+    def test_attempts_bounded(self):
+        """Test that the least recently used keys go over the limit"""
+        store = SlidingWindowStore(max_keys=2)
+        store.hit('a', 1, 60)
+        store.hit('b', 1, 60)
+        store.hit('a', 1, 60)
+        store.hit('c', 1, 60)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.hit('a', 1, 60)[0], False)
+        self.assertEqual(store.hit('b', 1, 60)[0], True)
+
     def test_retrieve_user_unauthorized(self):
         """Test that authentication is required for users"""
 
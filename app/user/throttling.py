@@ -0,0 +1,38 @@
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from core.throttling import SlidingWindowStore, parse_rate
+
+
+login_attempts = SlidingWindowStore(settings.LOGIN_THROTTLE_MAX_KEYS)
+
+
+class LoginRateThrottle(BaseThrottle):
+    """Limit token requests per email and per client IP.
+
+    Throttles run before the serializer, so rejected attempts never reach
+    the password hasher.
+    """
+    store = login_attempts
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        data = request.data if hasattr(request.data, 'get') else {}
+        email = str(data.get('email', '')).strip().lower()
+        checks = [
+            (f'ip:{self.get_ident(request)}', settings.LOGIN_THROTTLE_IP_RATE),
+            (f'email:{email}', settings.LOGIN_THROTTLE_EMAIL_RATE),
+        ]
+
+        for key, rate in checks:
+            limit, duration = parse_rate(rate)
+            if limit is None:
+                continue
+            allowed, wait = self.store.hit(key, limit, duration)
+            if not allowed:
+                self.wait_seconds = wait
+                return False
+
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,9 +1,20 @@
-from rest_framework import generics, authentication, permissions
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import generics, permissions
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from user.serializers import UserSerializer, AuthTokenSerializer
+from user.throttling import LoginRateThrottle
 from rest_framework.settings import api_settings
+from core.authentication import CachedTokenAuthentication
+from core.db.routers import primary_pins
+from core.idempotency import IdempotentCreateMixin
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(IdempotentCreateMixin, generics.CreateAPIView):
     """Create a new user in the system"""
 
     serializer_class = UserSerializer
@@ -13,12 +24,41 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = (LoginRateThrottle,)
+
+    def post(self, request, *args, **kwargs):
+        """Return the user's token, rotating it if requested or expired"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        with transaction.atomic():
+            # Locking the user serializes concurrent logins and rotations
+            get_user_model().objects.select_for_update().get(pk=user.pk)
+            token, created = Token.objects.get_or_create(user=user)
+
+            if not created and (
+                serializer.validated_data.get('rotate') or
+                self._token_expired(token)
+            ):
+                token.delete()
+                token = Token.objects.create(user=user)
+
+        # Requests made with the token must not read a replica lacking it
+        primary_pins.pin_token(token.key)
+        return Response({'token': token.key})
+
+    def _token_expired(self, token):
+        """Return True if the token is older than AUTH_TOKEN_MAX_AGE"""
+        max_age = settings.AUTH_TOKEN_MAX_AGE
+        if not max_age:
+            return False
+        return token.created < timezone.now() - timedelta(seconds=max_age)
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     permission_classes = (permissions.IsAuthenticated,)
 